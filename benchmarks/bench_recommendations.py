@@ -0,0 +1,77 @@
+"""Время пересборки «Кого почитать» на большом графе подписок.
+
+Заполняет временную базу (``common.seed``) ``--users`` пользователями
+по ``--follows`` подписок у каждого и замеряет
+``posts.recommendations.rebuild`` и чтение готовых предложений: первое
+(из базы) и повторное (из кеша).
+
+    python benchmarks/bench_recommendations.py --users 100000 --follows 20
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+import common
+from bench_views import percentile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--follows', type=int, default=20,
+                        help='подписок на пользователя')
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--lookups', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON-отчёт')
+    args = parser.parse_args()
+
+    common.setup()
+    from django.contrib.auth import get_user_model
+
+    from posts import recommendations
+    from posts.models import Follow
+
+    with common.database():
+        with common.timer('заполнение базы'):
+            common.seed(posts=args.posts, users=args.users, groups=5,
+                        follows=args.follows, comments=0,
+                        random_seed=args.seed)
+        edges = Follow.objects.count()
+        started = time.perf_counter()
+        rows = recommendations.rebuild()
+        rebuild_seconds = time.perf_counter() - started
+        rnd = random.Random(args.seed)
+        users = rnd.sample(list(get_user_model().objects.all()),
+                           args.lookups)
+        timings = {'cold': [], 'warm': []}
+        for name in timings:
+            for user in users:
+                started = time.perf_counter()
+                recommendations.for_user(user)
+                timings[name].append(time.perf_counter() - started)
+    report = {
+        'edges': edges,
+        'suggestions': rows,
+        'rebuild_seconds': round(rebuild_seconds, 1),
+    }
+    for name, values in timings.items():
+        report[f'lookup_{name}_p50_ms'] = round(percentile(values, 50)
+                                                * 1000, 3)
+        report[f'lookup_{name}_p99_ms'] = round(percentile(values, 99)
+                                                * 1000, 3)
+    print(f'подписок {edges}, предложений {rows}: пересборка '
+          f'{report["rebuild_seconds"]} с')
+    for name in timings:
+        print(f'чтение ({name}): p50 {report[f"lookup_{name}_p50_ms"]} мс, '
+              f'p99 {report[f"lookup_{name}_p99_ms"]} мс')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
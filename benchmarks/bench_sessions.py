@@ -0,0 +1,132 @@
+"""SQL-запросы сессий у авторизованных читателей лент.
+
+Заполняет временную базу (``common.seed``) и для каждого движка сессий
+из ``--engines`` входит под ``--readers`` пользователями и выполняет
+``--requests`` запросов к лентам, профилям и постам. На запрос
+считаются все SQL-запросы, запросы к ``django_session`` и записи в неё.
+
+    python benchmarks/bench_sessions.py --requests 500
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+import common
+from bench_views import percentile
+
+ENGINES = (
+    'django.contrib.sessions.backends.db',
+    'core.sessions.backends.cached_db',
+    'django.contrib.sessions.backends.signed_cookies',
+)
+
+
+def urls(rnd):
+    from django.contrib.auth import get_user_model
+    from django.urls import reverse
+
+    from posts.models import (Group,
+                              Post,
+                              )
+
+    User = get_user_model()
+    groups = list(Group.objects.values_list('slug', flat=True))
+    authors = list(User.objects.filter(
+        counters__posts_count__gt=0
+    ).values_list('username', flat=True))
+    posts = list(Post.objects.values_list('pk', flat=True))
+    return {
+        'index': lambda: reverse('posts:index'),
+        'follow_index': lambda: reverse('posts:follow_index'),
+        'group_list': lambda: reverse('posts:group_list',
+                                      args=[rnd.choice(groups)]),
+        'profile': lambda: reverse('posts:profile',
+                                   args=[rnd.choice(authors)]),
+        'post_detail': lambda: reverse('posts:post_detail',
+                                       args=[rnd.choice(posts)]),
+    }
+
+
+def measure(engine, readers, count, seed):
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import override_settings
+
+    rnd = random.Random(seed)
+    pages = urls(rnd)
+    calls = {'all': 0, 'session': 0, 'session_writes': 0}
+
+    def counter(execute, sql, params, many, context):
+        calls['all'] += 1
+        if 'django_session' in sql:
+            calls['session'] += 1
+            if not sql.lstrip().upper().startswith('SELECT'):
+                calls['session_writes'] += 1
+        return execute(sql, params, many, context)
+
+    timings = []
+    with override_settings(SESSION_ENGINE=engine):
+        cache.clear()
+        clients = []
+        for user in readers:
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+        with connection.execute_wrapper(counter):
+            for _ in range(count):
+                client = rnd.choice(clients)
+                url = rnd.choice(list(pages.values()))()
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise RuntimeError(f'{response.status_code} от {url}')
+    return {
+        'requests': count,
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'queries_per_request': round(calls['all'] / count, 2),
+        'session_queries_per_request': round(calls['session'] / count, 2),
+        'session_writes': calls['session_writes'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--readers', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--engines', nargs='+', default=ENGINES)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON-отчёт')
+    args = parser.parse_args()
+
+    common.setup()
+    from django.contrib.auth import get_user_model
+
+    report = {}
+    with common.database():
+        with common.timer('заполнение базы'):
+            common.seed(posts=args.posts, users=args.users,
+                        comments=args.posts, random_seed=args.seed)
+        readers = list(get_user_model().objects.filter(
+            counters__following_count__gt=0
+        ).order_by('pk')[:args.readers])
+        for engine in args.engines:
+            row = measure(engine, readers, args.requests, args.seed)
+            report[engine] = row
+            print(f'{engine:<48} p50 {row["p50_ms"]:>7.2f} мс  '
+                  f'SQL {row["queries_per_request"]:>5.2f}  '
+                  f'сессии {row["session_queries_per_request"]:>4.2f}  '
+                  f'записей {row["session_writes"]}')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
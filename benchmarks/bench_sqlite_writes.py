@@ -0,0 +1,217 @@
+"""Конкурентная запись в SQLite: стандартный бэкенд против настроенного.
+
+Для каждой конфигурации создаёт файловую базу во временном каталоге,
+заполняет её и запускает ``--workers`` процессов. Каждый процесс, как
+воркер WSGI-сервера, выполняет ``--requests`` запросов через
+представления: ``post_create``, ``add_comment`` и чтение главной
+страницы в пропорции ``--mix``. Соединения закрываются между запросами
+так же, как это делает обработчик Django (``close_old_connections``),
+поэтому ``CONN_MAX_AGE`` влияет на результат.
+
+С ``--write-behind`` добавляется прогон настроенного бэкенда с
+отложенной записью комментариев и подписок (``posts.write_behind``);
+после него журналы воркеров дописываются в базу, и проверяется, что ни
+один комментарий не потерян.
+
+Печатает пропускную способность, p50/p99 времени ответа и число
+запросов, упавших с «database is locked».
+
+    python benchmarks/bench_sqlite_writes.py --workers 8 --requests 200
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+import common
+from bench_views import percentile
+
+BASELINE = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'CONN_MAX_AGE': 0,
+    'OPTIONS': {},
+}
+OPERATIONS = ('post_create', 'add_comment', 'index')
+
+
+def configurations(path, write_behind):
+    """{название: (настройки базы, отложенная запись)}."""
+    from django.conf import settings
+
+    tuned = settings.DATABASES['default']
+    configs = {
+        'baseline': ({**tuned, **BASELINE, 'NAME': path('baseline')},
+                     False),
+        'tuned': ({**tuned, 'NAME': path('tuned')}, False),
+    }
+    if write_behind:
+        configs['write-behind'] = ({**tuned, 'NAME': path('write-behind')},
+                                   True)
+    return configs
+
+
+def use_database(config):
+    from django.db import connections
+
+    connections.close_all()
+    try:
+        del connections['default']
+    except AttributeError:
+        pass
+    connections.databases['default'] = dict(config)
+
+
+def prepare(config, posts, users):
+    from django.core.cache import cache
+    from django.core.management import call_command
+
+    use_database(config)
+    call_command('migrate', verbosity=0)
+    common.seed(posts=posts, users=users, groups=5, follows=5,
+                comments=posts)
+    cache.clear()
+    use_database(config)
+
+
+def worker(args):
+    """Запросы одного процесса: [(операция, секунды, ошибка)]."""
+    number, count, mix, seed = args
+    from django.contrib.auth import get_user_model
+    from django.db import (OperationalError,
+                           close_old_connections,
+                           )
+    from django.test import Client
+
+    from posts.models import Post
+
+    # Упавшие запросы считаются в отчёте, трейсбеки не нужны.
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    rnd = random.Random(seed + number)
+    client = Client()
+    client.force_login(get_user_model().objects.order_by('pk')[number])
+    post_ids = list(Post.objects.values_list('pk', flat=True))
+    close_old_connections()
+    requests = {
+        'post_create': lambda: client.post(
+            '/create/', {'text': f'Пост воркера {number}'}
+        ),
+        'add_comment': lambda: client.post(
+            f'/posts/{rnd.choice(post_ids)}/comment/',
+            {'text': f'Комментарий воркера {number}'},
+        ),
+        'index': lambda: client.get('/'),
+    }
+    results = []
+    for operation in rnd.choices(OPERATIONS, weights=mix, k=count):
+        close_old_connections()
+        started = time.perf_counter()
+        error = None
+        try:
+            response = requests[operation]()
+            if response.status_code >= 400:
+                error = str(response.status_code)
+        except OperationalError as exc:
+            error = str(exc)
+        results.append((operation, time.perf_counter() - started, error))
+        close_old_connections()
+    return results
+
+
+def run(workers, count, mix, seed):
+    from django.db import connections
+
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    started = time.perf_counter()
+    with context.Pool(workers) as pool:
+        results = pool.map(worker, [(number, count, mix, seed)
+                                    for number in range(workers)])
+    elapsed = time.perf_counter() - started
+    rows = [row for result in results for row in result]
+    timings = [seconds for _, seconds, error in rows if error is None]
+    writes = [row for row in rows if row[0] != 'index']
+    return {
+        'requests': len(rows),
+        'seconds': round(elapsed, 2),
+        'requests_per_second': round(len(rows) / elapsed, 1),
+        'writes_per_second': round(
+            sum(error is None for _, _, error in writes) / elapsed, 1
+        ),
+        'p50_ms': round(percentile(timings, 50) * 1000, 2)
+        if timings else None,
+        'p99_ms': round(percentile(timings, 99) * 1000, 2)
+        if timings else None,
+        'locked': sum(error is not None and 'locked' in error
+                      for _, _, error in rows),
+        'errors': sum(error is not None for _, _, error in rows),
+        'comments': sum(operation == 'add_comment' and error is None
+                        for operation, _, error in rows),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='запросов на воркер')
+    parser.add_argument('--mix', type=int, nargs=3, default=(1, 3, 6),
+                        metavar=('POSTS', 'COMMENTS', 'READS'),
+                        help='доли post_create, add_comment и чтений')
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--write-behind', action='store_true',
+                        help='добавить прогон с отложенной записью')
+    parser.add_argument('--output', help='JSON-отчёт')
+    args = parser.parse_args()
+    if args.users < args.workers:
+        parser.error('--users должно быть не меньше --workers')
+
+    common.setup()
+    from django.conf import settings
+
+    from posts.models import Comment
+
+    report = {}
+    with tempfile.TemporaryDirectory(prefix='yatube-sqlite-') as directory:
+        def path(name):
+            return os.path.join(directory, f'{name}.sqlite3')
+
+        configs = configurations(path, args.write_behind)
+        for name, (config, write_behind) in configs.items():
+            with common.timer(f'{name}: заполнение базы'):
+                prepare(config, args.posts, args.users)
+            settings.WRITE_BEHIND = write_behind
+            settings.WRITE_BEHIND_JOURNAL_DIR = os.path.join(
+                directory, f'{name}-journal'
+            )
+            comments = Comment.objects.count()
+            row = run(args.workers, args.requests, args.mix, args.seed)
+            if write_behind:
+                # Воркеры пула завершаются без atexit: их очереди
+                # остаются в журналах.
+                from posts import write_behind as buffer
+                buffer.recover()
+            settings.WRITE_BEHIND = False
+            row['comments_lost'] = (comments + row['comments']
+                                    - Comment.objects.count())
+            report[name] = row
+            print(f'{name:<12} {row["requests_per_second"]:>8.1f} запр/с  '
+                  f'запись {row["writes_per_second"]:>7.1f}/с  '
+                  f'p50 {row["p50_ms"]:>7.2f} мс  '
+                  f'p99 {row["p99_ms"]:>8.2f} мс  '
+                  f'locked {row["locked"]:>4}  ошибок {row["errors"]:>4}  '
+                  f'потеряно комментариев {row["comments_lost"]}')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
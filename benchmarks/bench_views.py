@@ -0,0 +1,217 @@
+"""Бенчмарк представлений posts на большом воспроизводимом наборе данных.
+
+Заполняет временную базу (``common.seed``), затем для каждого
+представления выполняет ``--requests`` запросов через тестовый клиент
+Django к случайным группам, авторам и постам и пишет JSON-отчёт:
+p50/p99 времени ответа, число SQL-запросов и пик выделенной памяти
+(tracemalloc, отдельным проходом, чтобы не искажать время). Отчёты
+разных версий сравнивает ``--baseline``.
+
+    python benchmarks/bench_views.py --posts 1000000 --users 100000 \\
+        --follows 100 --output report.json
+    python benchmarks/bench_views.py --baseline report.json
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import common
+
+VIEWS = ('index', 'group_list', 'profile', 'post_detail', 'follow_index',
+         'add_comment')
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=common.ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Requests:
+    """Случайные запросы к каждому представлению."""
+
+    def __init__(self, rnd, readers=20):
+        from django.contrib.auth import get_user_model
+        from django.test import Client
+
+        from posts.models import (Group,
+                                  Post,
+                                  )
+
+        User = get_user_model()
+        self.rnd = rnd
+        self.groups = list(Group.objects.values_list('slug', flat=True))
+        self.authors = list(User.objects.filter(
+            counters__posts_count__gt=0
+        ).values_list('username', flat=True))
+        self.posts = list(Post.objects.values_list('pk', flat=True))
+        self.anonymous = Client()
+        self.readers = []
+        for user in User.objects.filter(
+            counters__following_count__gt=0
+        ).order_by('?')[:readers]:
+            client = Client()
+            client.force_login(user)
+            self.readers.append(client)
+
+    def reader(self):
+        return self.rnd.choice(self.readers)
+
+    def index(self):
+        return self.anonymous.get('/')
+
+    def group_list(self):
+        return self.anonymous.get(f'/group/{self.rnd.choice(self.groups)}/')
+
+    def profile(self):
+        return self.reader().get(
+            f'/profile/{self.rnd.choice(self.authors)}/'
+        )
+
+    def post_detail(self):
+        return self.reader().get(f'/posts/{self.rnd.choice(self.posts)}/')
+
+    def follow_index(self):
+        return self.reader().get('/follow/')
+
+    def add_comment(self):
+        return self.reader().post(
+            f'/posts/{self.rnd.choice(self.posts)}/comment/',
+            {'text': 'Комментарий из бенчмарка'},
+        )
+
+
+def measure(request, count, memory_count, cold):
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings, queries, peaks = [], [], []
+    for _ in range(count):
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = request()
+            timings.append(time.perf_counter() - started)
+        if response.status_code not in (200, 302):
+            raise RuntimeError(f'{response.status_code} от {request}')
+        queries.append(len(captured))
+    tracemalloc.start()
+    try:
+        for _ in range(memory_count):
+            if cold:
+                cache.clear()
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            request()
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+    return {
+        'requests': count,
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p99_ms': round(percentile(timings, 99) * 1000, 3),
+        'mean_ms': round(statistics.mean(timings) * 1000, 3),
+        'max_ms': round(max(timings) * 1000, 3),
+        'queries_p50': percentile(queries, 50),
+        'queries_max': max(queries),
+        'memory_p50_kib': round(percentile(peaks, 50) / 1024, 1),
+        'memory_max_kib': round(max(peaks) / 1024, 1),
+    }
+
+
+def compare(baseline, report, out=sys.stdout):
+    """Печатает изменения метрик относительно прошлого отчёта."""
+    print(f'{"представление":<14} {"метрика":<15} {"было":>10} '
+          f'{"стало":>10} {"изм.":>8}', file=out)
+    for view, row in report['views'].items():
+        old_row = baseline.get('views', {}).get(view)
+        if old_row is None:
+            continue
+        for metric, value in row.items():
+            old = old_row.get(metric)
+            if metric == 'requests' or not old:
+                continue
+            change = (value - old) / old * 100
+            print(f'{view:<14} {metric:<15} {old:>10} {value:>10} '
+                  f'{change:>+7.1f}%', file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=50)
+    parser.add_argument('--follows', type=int, default=20,
+                        help='подписок на пользователя')
+    parser.add_argument('--comments', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='запросов к каждому представлению')
+    parser.add_argument('--memory-requests', type=int, default=20)
+    parser.add_argument('--cold', action='store_true',
+                        help='очищать кеш перед каждым запросом')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--views', nargs='+', choices=VIEWS, default=VIEWS)
+    parser.add_argument('--output', default='benchmark-report.json')
+    parser.add_argument('--baseline', help='отчёт для сравнения')
+    args = parser.parse_args()
+
+    common.setup()
+    import django
+
+    dataset = {name: getattr(args, name) for name in (
+        'posts', 'users', 'groups', 'follows', 'comments', 'seed'
+    )}
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'dataset': dataset,
+        'options': {'requests': args.requests, 'cold': args.cold},
+        'views': {},
+    }
+    with common.database():
+        started = time.perf_counter()
+        common.seed(posts=args.posts, users=args.users, groups=args.groups,
+                    follows=args.follows, comments=args.comments,
+                    random_seed=args.seed)
+        report['seed_seconds'] = round(time.perf_counter() - started, 1)
+        requests = Requests(random.Random(args.seed))
+        for view in args.views:
+            row = measure(getattr(requests, view), args.requests,
+                          args.memory_requests, args.cold)
+            report['views'][view] = row
+            print(f'{view:<14} p50 {row["p50_ms"]:>8.2f} мс  '
+                  f'p99 {row["p99_ms"]:>8.2f} мс  '
+                  f'SQL {row["queries_p50"]:>3}  '
+                  f'память {row["memory_p50_kib"]:>8.1f} КиБ')
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f'Отчёт: {args.output}')
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            compare(json.load(file), report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
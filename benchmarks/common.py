@@ -0,0 +1,154 @@
+"""Общая обвязка бенчмарков: Django, временная база и тестовые данные.
+
+Бенчмарки запускаются из корня репозитория (``python benchmarks/…``),
+поднимают пустую базу так же, как тесты, и заполняют её
+воспроизводимым набором пользователей, групп, постов и подписок.
+"""
+import atexit
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT = os.path.join(ROOT, 'yatube')
+
+
+def setup():
+    """Настраивает Django; кеш бенчмарка живёт во временном каталоге."""
+    sys.path.insert(0, PROJECT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    if 'YATUBE_CACHE_DIR' not in os.environ:
+        cache_dir = tempfile.mkdtemp(prefix='yatube-bench-')
+        os.environ['YATUBE_CACHE_DIR'] = cache_dir
+        atexit.register(shutil.rmtree, cache_dir, ignore_errors=True)
+    import django
+    django.setup()
+
+
+@contextmanager
+def database():
+    """Пустая база с применёнными миграциями, удаляется после выхода."""
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import (setup_test_environment,
+                                   teardown_test_environment,
+                                   )
+
+    runner = DiscoverRunner(verbosity=0)
+    setup_test_environment()
+    old_config = runner.setup_databases()
+    try:
+        yield
+    finally:
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
+
+
+@contextmanager
+def timer(label, out=sys.stderr):
+    started = time.perf_counter()
+    yield
+    print(f'{label}: {time.perf_counter() - started:.1f} с', file=out)
+
+
+def bulk_create(model, objects, chunk=50000):
+    """bulk_create по частям: генератор на миллионы строк не копится."""
+    objects = iter(objects)
+    while True:
+        batch = list(islice(objects, chunk))
+        if not batch:
+            return
+        model.objects.bulk_create(batch)
+
+
+class Texts:
+    """Русские тексты от Faker, собранные из заранее подготовленных фраз.
+
+    Faker на каждый пост из миллиона работал бы дольше самой вставки,
+    поэтому предложения генерируются один раз, а тексты постов
+    собираются из случайных предложений пула.
+    """
+
+    def __init__(self, rnd, size=5000):
+        from faker import Faker
+
+        fake = Faker('ru_RU')
+        fake.seed_instance(rnd.random())
+        self.rnd = rnd
+        self.sentences = [fake.sentence(nb_words=10) for _ in range(size)]
+
+    def __call__(self, low=1, high=5):
+        return ' '.join(self.rnd.sample(self.sentences,
+                                        self.rnd.randint(low, high)))
+
+
+def seed(posts=20000, users=200, groups=20, follows=10, comments=20000,
+         random_seed=1):
+    """Заполняет базу и пересобирает производные данные.
+
+    Посты создаются пачками без сигналов, поэтому счётчики, ленты
+    подписок и поисковый индекс затем пересобираются целиком, как это
+    сделали бы команды ``rebuild_*``.
+    """
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+
+    from posts import (counters,
+                       search,
+                       timeline,
+                       )
+    from posts.models import (Comment,
+                              Follow,
+                              Group,
+                              Post,
+                              )
+
+    User = get_user_model()
+    rnd = random.Random(random_seed)
+    text = Texts(rnd)
+    bulk_create(User, (User(username=f'user{i}') for i in range(users)))
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    bulk_create(Group, (
+        Group(title=f'Группа {i}', slug=f'group-{i}', description=text())
+        for i in range(groups)
+    ))
+    group_ids = [*Group.objects.values_list('pk', flat=True), None]
+    bulk_create(Post, (
+        Post(author_id=rnd.choice(user_ids),
+             group_id=rnd.choice(group_ids),
+             text=text(1, 6))
+        for _ in range(posts)
+    ))
+    # auto_now_add ставит всем постам одно время: разносим их по минуте.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE posts_post SET pub_date = "
+            "datetime(pub_date, '-' || (%s - id) || ' minutes')",
+            [posts],
+        )
+    post_ids = list(Post.objects.values_list('pk', flat=True))
+
+    def authors(user_id):
+        sample = rnd.sample(user_ids, min(follows + 1, users))
+        return [author_id for author_id in sample if author_id != user_id]
+
+    bulk_create(Follow, (
+        Follow(user_id=user_id, author_id=author_id)
+        for user_id in user_ids
+        for author_id in authors(user_id)[:follows]
+    ))
+    bulk_create(Comment, (
+        Comment(post_id=rnd.choice(post_ids),
+                author_id=rnd.choice(user_ids),
+                text=text(1, 1))
+        for _ in range(comments)
+    ))
+    counters.rebuild()
+    timeline.rebuild()
+    search.rebuild()
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
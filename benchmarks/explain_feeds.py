@@ -0,0 +1,139 @@
+"""Планы запросов лент: каждая лента читается по индексу без сортировки.
+
+Заполняет временную базу, строит те же запросы, что выполняют
+представления (первая и следующая страницы по курсору, комментарии,
+проверка подписки), и для каждого печатает EXPLAIN QUERY PLAN и
+медианное время. Завершается с кодом 1, если запросу, который должен
+идти по индексу, понадобилась временная сортировка
+(``USE TEMP B-TREE FOR ORDER BY``) или полный проход таблицы постов.
+
+    python benchmarks/explain_feeds.py --posts 100000
+"""
+import argparse
+import statistics
+import sys
+import time
+
+import common
+
+SORT = 'USE TEMP B-TREE'
+
+
+def explain(queryset):
+    from django.db import connection
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def measure(queryset, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        list(queryset._chain())
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def feed_queries(per_page=10):
+    """(название, queryset, ожидаемый индекс или None) для каждой ленты."""
+    from django.contrib.auth import get_user_model
+
+    from posts.models import (Comment,
+                              Follow,
+                              Group,
+                              Post,
+                              Timeline,
+                              )
+    from posts.paginator import keyset_queryset
+
+    User = get_user_model()
+    limit = per_page + 1
+    feed = Post.objects.for_feed()
+    middle = feed.order_by('-pub_date', '-pk')[feed.count() // 2]
+    cursor = (middle.pub_date, middle.pk)
+    group = Group.objects.order_by('-posts_count').first()
+    author = User.objects.order_by('-counters__posts_count').first()
+    reader = User.objects.order_by('-counters__following_count').first()
+    post = Post.objects.order_by('-comments_count').first()
+    follow = Follow.objects.filter(user=reader).first()
+    timeline = Timeline.objects.filter(user=reader).select_related(
+        'post__author', 'post__group'
+    )
+    followed = list(reader.follower.values_list('author_id', flat=True))
+    return [
+        ('index', keyset_queryset(feed, None, False)[:limit],
+         'posts_post_pub_date'),
+        ('index, следующая страница',
+         keyset_queryset(feed, cursor, False)[:limit],
+         'posts_post_pub_date'),
+        ('group_list', keyset_queryset(feed.filter(group=group),
+                                       None, False)[:limit],
+         'post_group_feed_idx'),
+        ('group_list, следующая страница',
+         keyset_queryset(feed.filter(group=group), cursor, False)[:limit],
+         'post_group_feed_idx'),
+        ('profile', keyset_queryset(feed.filter(author=author),
+                                    None, False)[:limit],
+         'post_author_feed_idx'),
+        ('profile, следующая страница',
+         keyset_queryset(feed.filter(author=author), cursor, False)[:limit],
+         'post_author_feed_idx'),
+        ('follow_index', keyset_queryset(timeline, None, False,
+                                         ('pub_date', 'post_id'))[:limit],
+         'timeline_user_feed_idx'),
+        ('follow_index, следующая страница',
+         keyset_queryset(timeline, cursor, False,
+                         ('pub_date', 'post_id'))[:limit],
+         'timeline_user_feed_idx'),
+        # Посты популярных авторов подмешиваются при чтении: это слияние
+        # нескольких индексных диапазонов, и SQLite сортирует результат.
+        ('follow_index, популярные авторы',
+         keyset_queryset(feed.filter(author_id__in=followed),
+                         None, False)[:limit],
+         None),
+        ('post_detail, комментарии', Comment.objects.for_post(post),
+         'comment_post_created_idx'),
+        ('profile, проверка подписки',
+         Follow.objects.filter(user=reader, author_id=follow.author_id),
+         'posts_follow'),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    common.setup()
+    failed = []
+    with common.database():
+        with common.timer('Заполнение базы'):
+            common.seed(posts=args.posts, users=args.users,
+                        comments=args.posts)
+        for name, queryset, index in feed_queries():
+            plan = explain(queryset)
+            seconds = measure(queryset, args.repeat)
+            ok = index is None or (
+                not any(SORT in step for step in plan)
+                and any(index in step for step in plan)
+                and not any(step == 'SCAN posts_post' for step in plan)
+            )
+            if not ok:
+                failed.append(name)
+            mark = 'ok' if ok else 'FAIL'
+            print(f'[{mark}] {name}: {seconds * 1000:.2f} мс')
+            for step in plan:
+                print(f'       {step}')
+    if failed:
+        print(f'Без индексного порядка: {", ".join(failed)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
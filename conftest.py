@@ -0,0 +1,15 @@
+"""Общие настройки pytest для проверок из tests/.
+
+Как и ``manage.py test`` (``core.runner``), фоновые задачи выполняются
+в потоке теста: тестовая база SQLite в памяти не выдерживает потоков;
+картинки, общий кеш и журналы пишутся во временный каталог.
+"""
+import pytest
+
+
+@pytest.fixture(autouse=True, scope='session')
+def isolated():
+    from core.runner import isolated_environment
+
+    with isolated_environment():
+        yield
@@ -0,0 +1,382 @@
+"""Двухуровневый кеш: LRU в памяти процесса поверх общего кеша.
+
+L1 живёт в каждом воркере и отвечает без обращения к диску; L2 — любой
+другой настроенный кеш (по умолчанию ``SharedFileCache``), общий для
+всех воркеров на машине. Запись идёт в оба уровня, поэтому воркер сразу
+видит свои изменения, а чужие — не позже чем через ``LOCAL_TIMEOUT``.
+Ключи с префиксами из ``LOCAL_SKIP_PREFIXES`` (например, версии лент)
+в L1 не кладутся и всегда читаются из L2. ``add``, ``incr`` и
+``update`` выполняются в L2, и их атомарность между процессами — это
+атомарность L2.
+
+Попадания и промахи считаются по префиксу ключа и раз в
+``STATS_FLUSH_INTERVAL`` секунд прибавляются к счётчикам в L2
+(``incr`` на каждый префикс и исход), откуда их читает команда
+``cache_stats``.
+"""
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+import zlib
+from collections import (Counter,
+                         OrderedDict,
+                         )
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import (DEFAULT_TIMEOUT,
+                                             BaseCache,
+                                             )
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+from django.core.files.move import file_move_safe
+from django.utils.functional import cached_property
+
+from core import instrumentation
+
+# Множество префиксов; счётчики лежат в ключах STATS_KEY:префикс:исход.
+STATS_KEY = 'core:cache-stats'
+
+OUTCOMES = ('local', 'shared', 'miss')
+
+_MISSING = object()
+
+
+def key_prefix(key):
+    """Префикс ключа для статистики: всё до последнего ``:`` или ``.``."""
+    return re.split(r'[:.][^:.]*$', key)[0] or key
+
+
+def _stats_key(prefix, outcome):
+    return f'{STATS_KEY}:{prefix}:{outcome}'
+
+
+class SharedFileCache(FileBasedCache):
+    """Файловый кеш с атомарными между процессами ``add``, ``incr`` и
+    ``update``.
+
+    У ``FileBasedCache`` из Django 2.2 ``add`` — это ``has_key`` и
+    ``set``, а ``incr`` — ``get`` и ``set``: два процесса могут оба
+    «добавить» ключ или потерять прибавку. Здесь запись и
+    чтение-изменение-запись идут под ``flock`` на файле-замке ключа
+    (ключи распределены по ``LOCK_STRIPES`` замкам). Чтение замок не
+    берёт: запись идёт во временный файл, который затем
+    переименовывается, и читатель видит старое или новое значение.
+
+    ``_cull`` перечисляет все файлы каталога; он запускается не на
+    каждую запись, а не чаще раза в ``CULL_INTERVAL`` секунд в процессе,
+    так что между проверками кеш может превысить ``MAX_ENTRIES`` на
+    число записей за этот интервал.
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        options = params.get('OPTIONS', {})
+        self._lock_stripes = int(options.get('LOCK_STRIPES', 64))
+        self._cull_interval = options.get('CULL_INTERVAL', 60)
+        self._culled_at = None
+
+    @contextmanager
+    def _locked(self, fname):
+        stripe = int(os.path.basename(fname)[:8], 16) % self._lock_stripes
+        lock_dir = os.path.join(self._dir, 'locks')
+        os.makedirs(lock_dir, 0o700, exist_ok=True)
+        with open(os.path.join(lock_dir, f'{stripe}.lock'), 'ab') as file:
+            locks.lock(file, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(file)
+
+    def _read(self, fname):
+        """(срок, значение) из файла ключа или None, если ключа нет."""
+        try:
+            with open(fname, 'rb') as file:
+                expiry = pickle.load(file)
+                if expiry is not None and expiry < time.time():
+                    return None
+                return expiry, pickle.loads(zlib.decompress(file.read()))
+        except (FileNotFoundError, EOFError):
+            return None
+
+    def _write(self, fname, expiry, value):
+        self._createdir()
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        renamed = False
+        try:
+            with open(fd, 'wb') as file:
+                file.write(pickle.dumps(expiry, self.pickle_protocol))
+                file.write(zlib.compress(
+                    pickle.dumps(value, self.pickle_protocol)
+                ))
+            file_move_safe(tmp_path, fname, allow_overwrite=True)
+            renamed = True
+        finally:
+            if not renamed:
+                os.remove(tmp_path)
+
+    def _cull(self):
+        now = time.monotonic()
+        if (self._culled_at is not None
+                and now - self._culled_at < self._cull_interval):
+            return
+        self._culled_at = now
+        super()._cull()
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        fname = self._key_to_file(key, version)
+        with self._locked(fname):
+            self._write(fname, self.get_backend_timeout(timeout), value)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        fname = self._key_to_file(key, version)
+        with self._locked(fname):
+            if self._read(fname) is not None:
+                return False
+            self._write(fname, self.get_backend_timeout(timeout), value)
+            return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        fname = self._key_to_file(key, version)
+        with self._locked(fname):
+            entry = self._read(fname)
+            if entry is None:
+                return False
+            self._write(fname, self.get_backend_timeout(timeout), entry[1])
+            return True
+
+    def incr(self, key, delta=1, version=None):
+        fname = self._key_to_file(key, version)
+        with self._locked(fname):
+            entry = self._read(fname)
+            if entry is None:
+                raise ValueError("Key '%s' not found" % key)
+            expiry, value = entry
+            value += delta
+            # Срок жизни ключа сохраняется, как у incr в memcached.
+            self._write(fname, expiry, value)
+        return value
+
+    def update(self, key, function, default=None, timeout=DEFAULT_TIMEOUT,
+               version=None):
+        """Атомарно заменяет значение на ``function(значение)``.
+
+        Отсутствующий ключ читается как ``default``. Возвращает новое
+        значение.
+        """
+        fname = self._key_to_file(key, version)
+        with self._locked(fname):
+            entry = self._read(fname)
+            value = function(default if entry is None else entry[1])
+            self._write(fname, self.get_backend_timeout(timeout), value)
+        return value
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = location
+        self._max_local = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._skip_prefixes = tuple(options.get('LOCAL_SKIP_PREFIXES', ()))
+        self._flush_interval = options.get('STATS_FLUSH_INTERVAL', 10)
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        self._stats = Counter()
+        self._flushed_at = time.monotonic()
+
+    @cached_property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    # L1
+
+    def _local_get(self, key, version=None):
+        key = self.make_key(key, version)
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._local[key]
+                return _MISSING
+            self._local.move_to_end(key)
+        return pickle.loads(value)
+
+    def _local_set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if key.startswith(self._skip_prefixes):
+            return
+        key = self.make_key(key, version)
+        ttl = self._local_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            ttl = min(ttl, timeout)
+        # Как и LocMemCache, храним копию: изменения объекта,
+        # полученного из кеша, не должны попадать обратно в кеш.
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._local[key] = (value, time.monotonic() + ttl)
+            self._local.move_to_end(key)
+            while len(self._local) > self._max_local:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, key, version=None):
+        key = self.make_key(key, version)
+        with self._lock:
+            self._local.pop(key, None)
+
+    # Статистика
+
+    def _record(self, key, outcome):
+        instrumentation.record_cache(outcome != 'miss')
+        with self._lock:
+            self._stats[(key_prefix(key), outcome)] += 1
+        if time.monotonic() - self._flushed_at >= self._flush_interval:
+            self.flush_stats()
+
+    def flush_stats(self):
+        """Прибавляет накопленные счётчики к общей статистике в L2."""
+        with self._lock:
+            pending, self._stats = self._stats, Counter()
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        prefixes = {prefix for prefix, outcome in pending}
+        self.update(STATS_KEY, lambda known: known | prefixes, set(), None)
+        for (prefix, outcome), count in pending.items():
+            self.count(_stats_key(prefix, outcome), count)
+
+    def stats(self):
+        """Общая статистика по префиксам: {префикс: {исход: число}}."""
+        self.flush_stats()
+        keys = {_stats_key(prefix, outcome): (prefix, outcome)
+                for prefix in self.shared.get(STATS_KEY) or ()
+                for outcome in OUTCOMES}
+        totals = {}
+        for key, count in self.shared.get_many(keys).items():
+            prefix, outcome = keys[key]
+            totals.setdefault(prefix, {})[outcome] = count
+        return totals
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = Counter()
+        prefixes = self.shared.get(STATS_KEY) or ()
+        self.shared.delete_many([_stats_key(prefix, outcome)
+                                 for prefix in prefixes
+                                 for outcome in OUTCOMES])
+        self.shared.delete(STATS_KEY)
+
+    # API кеша
+
+    def get(self, key, default=None, version=None):
+        value = self._local_get(key, version)
+        if value is not _MISSING:
+            self._record(key, 'local')
+            return value
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._record(key, 'miss')
+            return default
+        self._record(key, 'shared')
+        self._local_set(key, value, version=version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        remote = []
+        for key in keys:
+            value = self._local_get(key, version)
+            if value is _MISSING:
+                remote.append(key)
+            else:
+                self._record(key, 'local')
+                found[key] = value
+        if remote:
+            shared = self.shared.get_many(remote, version=version)
+            for key in remote:
+                if key in shared:
+                    self._record(key, 'shared')
+                    self._local_set(key, shared[key], version=version)
+                else:
+                    self._record(key, 'miss')
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._local_set(key, value, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._local_set(key, value, timeout, version)
+        return added
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._local_set(key, value, timeout, version)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(key, version)
+        self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._local_delete(key, version)
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        if self._local_get(key, version) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        self._local_set(key, value, version=version)
+        return value
+
+    def count(self, key, delta=1, timeout=None, version=None):
+        """Прибавляет ``delta`` к счётчику в L2, создавая его при
+        отсутствии, и возвращает новое значение."""
+        while not self.shared.add(key, delta, timeout, version=version):
+            try:
+                return self.shared.incr(key, delta, version=version)
+            except ValueError:
+                # Счётчик удалили между add и incr.
+                continue
+        return delta
+
+    def update(self, key, function, default=None, timeout=DEFAULT_TIMEOUT,
+               version=None):
+        """Атомарно заменяет значение в L2 на ``function(значение)``
+        (см. ``SharedFileCache.update``)."""
+        update = getattr(self.shared, 'update', None)
+        if update is not None:
+            value = update(key, function, default, timeout, version=version)
+        else:
+            # L2 без update (LocMemCache в тестах) живёт в одном
+            # процессе, и хватает блокировки воркера.
+            with self._update_lock:
+                value = function(self.shared.get(key, default,
+                                                 version=version))
+                self.shared.set(key, value, timeout, version=version)
+        self._local_set(key, value, timeout, version)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
@@ -0,0 +1,23 @@
+from django.db import (DatabaseError,
+                       connections,
+                       router,
+                       )
+
+
+def estimated_rows(model):
+    """Число строк таблицы модели по статистике или None.
+
+    SQLite сохраняет его в ``sqlite_stat1`` при ``ANALYZE``: это оценка
+    на момент анализа, зато её не нужно считать проходом по таблице.
+    """
+    connection = connections[router.db_for_read(model)]
+    if connection.vendor != 'sqlite':
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s',
+                           [model._meta.db_table])
+            rows = [int(stat.split()[0]) for stat, in cursor.fetchall()]
+    except DatabaseError:
+        return None
+    return max(rows, default=None)
@@ -0,0 +1,107 @@
+"""SQLite для нескольких воркеров: WAL, прагмы и повтор занятой записи.
+
+Отличия от ``django.db.backends.sqlite3``:
+
+* у файловой базы включается WAL: читатели не ждут писателя, а
+  писатель — читателей; остальные прагмы (``synchronous``, кеш
+  страниц, ``mmap_size``) задаются словарём ``OPTIONS['pragmas']``
+  поверх ``PRAGMAS``;
+* ``OPTIONS['transaction_mode'] = 'IMMEDIATE'`` открывает транзакции
+  через ``BEGIN IMMEDIATE``: блокировка записи берётся сразу, и
+  занятая база ждёт ``timeout`` секунд. При обычном ``BEGIN``
+  транзакция, которая сначала читала, получает «database is locked»
+  без ожидания, когда пытается писать;
+* если база всё же занята, ``BEGIN`` и запросы вне транзакции
+  повторяются ``OPTIONS['busy_retries']`` раз с растущей паузой.
+  Запрос внутри транзакции не повторяется: её уже нужно откатить.
+"""
+import random
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+Database = base.Database
+
+PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05
+
+
+def is_busy(error):
+    return isinstance(error, Database.OperationalError) and (
+        'database is locked' in str(error)
+    )
+
+
+def retry_busy(operation, retries):
+    """Выполняет ``operation``, пока база занята, с паузой 50 мс, 100 мс…"""
+    for attempt in range(retries + 1):
+        try:
+            return operation()
+        except Database.OperationalError as error:
+            if attempt == retries or not is_busy(error):
+                raise
+            time.sleep(BUSY_BACKOFF * 2 ** attempt * random.uniform(1, 1.5))
+
+
+class SQLiteCursorWrapper(base.SQLiteCursorWrapper):
+    retries = BUSY_RETRIES
+
+    def execute(self, query, params=None):
+        if self.connection.in_transaction:
+            return super().execute(query, params)
+        return retry_busy(lambda: super(SQLiteCursorWrapper, self).execute(
+            query, params
+        ), self.retries)
+
+    def executemany(self, query, param_list):
+        if self.connection.in_transaction:
+            return super().executemany(query, param_list)
+        param_list = list(param_list)
+        return retry_busy(
+            lambda: super(SQLiteCursorWrapper, self).executemany(
+                query, param_list
+            ), self.retries,
+        )
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = {**PRAGMAS, **params.pop('pragmas', {})}
+        self.busy_retries = params.pop('busy_retries', BUSY_RETRIES)
+        self.transaction_mode = params.pop('transaction_mode', None)
+        if self.transaction_mode not in (None, *TRANSACTION_MODES):
+            raise ImproperlyConfigured(
+                f'transaction_mode должен быть одним из {TRANSACTION_MODES}'
+            )
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if not self.is_in_memory_db():
+            retry_busy(
+                lambda: conn.execute('PRAGMA journal_mode = WAL'),
+                self.busy_retries,
+            )
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=SQLiteCursorWrapper)
+        cursor.retries = self.busy_retries
+        return cursor
+
+    def _start_transaction_under_autocommit(self):
+        statement = 'BEGIN'
+        if self.transaction_mode:
+            statement = f'BEGIN {self.transaction_mode}'
+        self.cursor().execute(statement)
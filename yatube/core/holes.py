@@ -0,0 +1,78 @@
+"""Кеш целых страниц с личными вставками («дырами»).
+
+Страница ленты одинакова для всех, кроме небольших частей: шапки
+с именем пользователя, кнопки подписки, вкладок ленты. В шаблоне такие
+части подключаются тегом ``{% hole 'шаблон' имя=значение … %}`` из
+библиотеки ``holes`` вместо ``{% include %}``.
+
+``render_page`` отрисовывает страницу один раз для всех: вместо каждой
+вставки в HTML остаётся метка с именем шаблона и его аргументами, и
+готовый HTML хранится в кеше под ключом фрагментов страницы
+(``posts.feed_cache``). На каждый запрос, в том числе из кеша, метки
+заменяются вставками, отрисованными для текущего пользователя, — как
+edge-side includes, только на стороне приложения. Вне ``render_page``
+тег ``hole`` работает как обычный ``include``.
+
+Аргументы вставки — строки и числа: они сохраняются в метке, а всё
+личное шаблон вставки берёт из контекстных процессоров (пользователь,
+токен CSRF) и из ``personal`` — значений, которые представление уже
+посчитало для этого запроса (например, для ETag) и передаёт в
+``render_page``, чтобы вставки не считали их заново. Текст постов экранируется
+шаблонами, поэтому подделать метку в нём нельзя.
+"""
+import json
+import re
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.http import (urlsafe_base64_decode,
+                               urlsafe_base64_encode,
+                               )
+from django.utils.safestring import mark_safe
+
+# Переменная контекста, при которой тег hole оставляет метку.
+PUNCH = 'punch_holes'
+
+MARKER = re.compile(r'<!--hole:(?P<data>[\w-]+)-->')
+
+
+def marker(template_name, kwargs):
+    data = json.dumps([template_name, kwargs], separators=(',', ':'))
+    return mark_safe(
+        f'<!--hole:{urlsafe_base64_encode(data.encode())}-->'
+    )
+
+
+def render(request, template_name, kwargs):
+    """Вставка для пользователя запроса."""
+    return render_to_string(template_name, kwargs, request)
+
+
+def fill(request, html, personal=None):
+    """Заменяет метки вставками для текущего пользователя."""
+    def replace(match):
+        template_name, kwargs = json.loads(
+            urlsafe_base64_decode(match.group('data'))
+        )
+        return render(request, template_name, {**(personal or {}),
+                                               **kwargs})
+
+    return MARKER.sub(replace, html)
+
+
+def render_page(request, template_name, fragment, get_context,
+                personal=None):
+    """Ответ со страницей из кеша, дополненной личными вставками.
+
+    ``get_context`` вызывается только при промахе кеша: выборка постов
+    страницы нужна, лишь когда её HTML отрисовывается заново.
+    ``personal`` — контекст вставок для текущего пользователя.
+    """
+    key = f'holes:{template_name}:{fragment.key}'
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string(template_name,
+                                {**get_context(), PUNCH: True}, request)
+        cache.set(key, html, fragment.timeout)
+    return HttpResponse(fill(request, html, personal))
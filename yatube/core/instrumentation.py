@@ -0,0 +1,186 @@
+"""Метрики запросов: SQL, время базы, отрисовка шаблонов и кеш.
+
+``InstrumentationMiddleware`` открывает сбор метрик на время запроса,
+а счётчики пополняют обёртка ``execute_wrapper`` у соединений с базой,
+бэкенд шаблонов ``core.template.backends.DjangoTemplates`` и
+``core.cache.TieredCache``. Итоги складываются по имени URL
+(``posts:index``, ``posts:profile``…) и раз в
+``METRICS_FLUSH_INTERVAL`` секунд прибавляются к счётчикам в общем
+кеше (атомарный ``incr`` на каждое представление и поле, так что
+воркеры не затирают суммы друг друга), откуда их показывает команда
+``view_stats``. Если представление выполнило
+больше запросов, чем разрешает ``QUERY_BUDGETS``/``QUERY_BUDGET``,
+в лог пишется предупреждение.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Множество представлений; счётчики лежат в ключах
+# METRICS_KEY:представление:поле.
+METRICS_KEY = 'core:view-metrics'
+
+FIELDS = ('requests', 'queries', 'max_queries', 'db_time', 'render_time',
+          'total_time', 'cache_hits', 'cache_misses', 'over_budget')
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.total_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.render_depth = 0
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def server_timing(self):
+        return ', '.join((
+            f'db;desc="{self.queries} queries";dur={self.db_time * 1000:.1f}',
+            f'tpl;dur={self.render_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ))
+
+
+def current():
+    """Метрики текущего запроса или None вне запроса."""
+    return getattr(_state, 'metrics', None)
+
+
+@contextmanager
+def collect():
+    metrics = RequestMetrics()
+    _state.metrics = metrics
+    try:
+        yield metrics
+    finally:
+        _state.metrics = None
+
+
+def record_cache(hit):
+    metrics = current()
+    if metrics is None:
+        return
+    if hit:
+        metrics.cache_hits += 1
+    else:
+        metrics.cache_misses += 1
+
+
+@contextmanager
+def render_timer():
+    """Учитывает время отрисовки; вложенные шаблоны не считаются дважды."""
+    metrics = current()
+    if metrics is None:
+        yield
+        return
+    metrics.render_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.render_depth -= 1
+        if not metrics.render_depth:
+            metrics.render_time += time.perf_counter() - started
+
+
+def _metric_key(view_name, field):
+    return f'{METRICS_KEY}:{view_name}:{field}'
+
+
+def query_budget(view_name):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(
+        view_name, settings.QUERY_BUDGET
+    )
+
+
+class Aggregator:
+    """Суммы метрик по представлениям в памяти процесса."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+        self._flushed_at = time.monotonic()
+
+    def add(self, view_name, metrics):
+        budget = query_budget(view_name)
+        over_budget = metrics.queries > budget
+        if over_budget:
+            logger.warning(
+                '%s: %d SQL-запросов при бюджете %d',
+                view_name, metrics.queries, budget,
+            )
+        with self._lock:
+            row = self._pending[view_name]
+            row['requests'] += 1
+            row['queries'] += metrics.queries
+            row['max_queries'] = max(row['max_queries'], metrics.queries)
+            row['db_time'] += metrics.db_time
+            row['render_time'] += metrics.render_time
+            row['total_time'] += metrics.total_time
+            row['cache_hits'] += metrics.cache_hits
+            row['cache_misses'] += metrics.cache_misses
+            row['over_budget'] += over_budget
+        interval = settings.METRICS_FLUSH_INTERVAL
+        if time.monotonic() - self._flushed_at >= interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(
+                lambda: dict.fromkeys(FIELDS, 0)
+            )
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        views = set(pending)
+        cache.update(METRICS_KEY, lambda known: known | views, set(), None)
+        for view_name, row in pending.items():
+            for field, value in row.items():
+                key = _metric_key(view_name, field)
+                if field == 'max_queries':
+                    cache.update(key, partial(max, value), 0, None)
+                elif value:
+                    cache.count(key, value)
+
+    def totals(self):
+        self.flush()
+        keys = {_metric_key(view_name, field): (view_name, field)
+                for view_name in cache.get(METRICS_KEY) or ()
+                for field in FIELDS}
+        totals = {}
+        for key, value in cache.get_many(keys).items():
+            view_name, field = keys[key]
+            totals.setdefault(
+                view_name, dict.fromkeys(FIELDS, 0)
+            )[field] = value
+        return totals
+
+    def reset(self):
+        with self._lock:
+            self._pending.clear()
+        cache.delete_many([_metric_key(view_name, field)
+                           for view_name in cache.get(METRICS_KEY) or ()
+                           for field in FIELDS])
+        cache.delete(METRICS_KEY)
+
+
+aggregator = Aggregator()
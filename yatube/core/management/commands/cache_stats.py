@@ -0,0 +1,32 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кеша по префиксам ключей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить накопленную статистику.')
+
+    def handle(self, *args, **options):
+        if not hasattr(cache, 'stats'):
+            raise CommandError(
+                'Статистику собирает только core.cache.TieredCache.'
+            )
+        if options['reset']:
+            cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Статистика обнулена.'))
+            return
+        self.stdout.write(
+            f'{"префикс":40} {"L1":>8} {"L2":>8} {"промах":>8} {"hit %":>6}'
+        )
+        for prefix, row in sorted(cache.stats().items()):
+            local = row.get('local', 0)
+            shared = row.get('shared', 0)
+            miss = row.get('miss', 0)
+            total = local + shared + miss
+            rate = 100 * (local + shared) / total if total else 0
+            self.stdout.write(
+                f'{prefix[:40]:40} {local:8} {shared:8} {miss:8} {rate:6.1f}'
+            )
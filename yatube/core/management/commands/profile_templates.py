@@ -0,0 +1,67 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import (BaseCommand,
+                                         CommandError,
+                                         )
+from django.test import Client
+
+from core.template.profiler import profile
+
+
+class Command(BaseCommand):
+    help = ('Показывает, на какие шаблоны и теги уходит время отрисовки '
+            'страниц.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', metavar='URL')
+        parser.add_argument('--requests', type=int, default=20,
+                            help='запросов к каждой странице')
+        parser.add_argument('--user', help='открывать страницы от имени '
+                                           'пользователя')
+        parser.add_argument('--cold', action='store_true',
+                            help='очищать кеш перед каждым запросом, '
+                                 'чтобы фрагменты отрисовывались заново')
+        parser.add_argument('--limit', type=int, default=30,
+                            help='строк в таблице')
+
+    def handle(self, *args, **options):
+        client = Client()
+        if options['user']:
+            User = get_user_model()
+            try:
+                client.force_login(User.objects.get(
+                    username=options['user']
+                ))
+            except User.DoesNotExist:
+                raise CommandError(f'Нет пользователя {options["user"]}')
+        # Первый запрос загружает шаблоны и заполняет кеши.
+        for url in options['urls']:
+            client.get(url)
+        requests = options['requests'] * len(options['urls'])
+        with profile() as render_profile:
+            for _ in range(options['requests']):
+                for url in options['urls']:
+                    if options['cold']:
+                        cache.clear()
+                    response = client.get(url)
+                    if response.status_code != 200:
+                        raise CommandError(
+                            f'{url}: ответ {response.status_code}'
+                        )
+        total = render_profile.total or 1
+        self.stdout.write(
+            f'{"шаблон или тег":44} {"вызовов":>8} {"всего мс":>9} '
+            f'{"своё мс":>8} {"своё %":>7}'
+        )
+        for name, calls, full, own in render_profile.table()[
+            :options['limit']
+        ]:
+            self.stdout.write(
+                f'{name[:44]:44} {calls / requests:8.1f} '
+                f'{1000 * full / requests:9.2f} '
+                f'{1000 * own / requests:8.2f} {100 * own / total:7.1f}'
+            )
+        self.stdout.write(
+            f'Отрисовка: {1000 * render_profile.total / requests:.2f} мс '
+            f'на запрос, запросов: {requests}.'
+        )
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from core.instrumentation import (aggregator,
+                                  query_budget,
+                                  )
+
+
+class Command(BaseCommand):
+    help = ('Показывает число SQL-запросов, время базы, отрисовки '
+            'и попадания в кеш по представлениям.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить накопленные метрики.')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            aggregator.reset()
+            self.stdout.write(self.style.SUCCESS('Метрики обнулены.'))
+            return
+        self.stdout.write(
+            f'{"представление":28} {"запросов":>8} {"SQL ср.":>8} '
+            f'{"SQL макс":>8} {"бюджет":>6} {"БД мс":>7} {"шаблон мс":>9} '
+            f'{"всего мс":>8} {"кеш %":>6} {"сверх":>6}'
+        )
+        for view_name, row in sorted(aggregator.totals().items()):
+            requests = row['requests'] or 1
+            lookups = row['cache_hits'] + row['cache_misses']
+            hit_rate = 100 * row['cache_hits'] / lookups if lookups else 0
+            self.stdout.write(
+                f'{view_name[:28]:28} {row["requests"]:8} '
+                f'{row["queries"] / requests:8.1f} {row["max_queries"]:8} '
+                f'{query_budget(view_name):6} '
+                f'{1000 * row["db_time"] / requests:7.1f} '
+                f'{1000 * row["render_time"] / requests:9.1f} '
+                f'{1000 * row["total_time"] / requests:8.1f} '
+                f'{hit_rate:6.1f} {row["over_budget"]:6}'
+            )
@@ -0,0 +1,91 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.urls import (Resolver404,
+                         resolve,
+                         )
+
+from core import (instrumentation,
+                  page_cache,
+                  routers,
+                  )
+
+
+class InstrumentationMiddleware:
+    """Собирает метрики запроса и добавляет заголовок Server-Timing."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with instrumentation.collect() as metrics, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(metrics.db_wrapper)
+                )
+            response = self.get_response(request)
+        metrics.total_time = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else 'unresolved'
+        instrumentation.aggregator.add(view_name, metrics)
+        response['Server-Timing'] = metrics.server_timing()
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """Чтения из основной базы там, где реплика может отстать.
+
+    Небезопасные методы читают из ``default`` целиком. Если запрос
+    что-то записал, клиент получает cookie, и следующие
+    ``REPLICA_STICKY_SECONDS`` секунд его запросы тоже читают из
+    ``default``: автор сразу видит свой пост.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        cookie = settings.REPLICA_COOKIE_NAME
+        try:
+            sticky = float(request.COOKIES.get(cookie, 0)) > time.time()
+        except ValueError:
+            sticky = False
+        pin = sticky or request.method not in ('GET', 'HEAD', 'OPTIONS')
+        with routers.pin_primary(pin):
+            response = self.get_response(request)
+            wrote = routers.wrote()
+        if wrote:
+            seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(cookie, str(time.time() + seconds),
+                                max_age=seconds, httponly=True,
+                                samesite='Lax')
+        return response
+
+
+class AnonymousPageCacheMiddleware:
+    """Ответы анонимным читателям из ``core.page_cache``.
+
+    Стоит до ``SessionMiddleware``: попадание в кеш не загружает ни
+    сессию, ни пользователя.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not page_cache.is_anonymous(request):
+            return self.get_response(request)
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return self.get_response(request)
+        if match.view_name not in settings.PAGE_CACHE_VIEWS:
+            return self.get_response(request)
+        # Для метрик: при попадании обработчик URL не разбирает.
+        request.resolver_match = match
+        return page_cache.serve(request, self.get_response)
@@ -0,0 +1,155 @@
+"""Кеш готовых ответов для анонимных читателей.
+
+``AnonymousPageCacheMiddleware`` отвечает на GET без cookie сессии
+к представлениям из ``PAGE_CACHE_VIEWS`` из кеша, минуя сессии,
+аутентификацию, ORM и шаблоны.
+
+Запись в кеше помечена тегами — областями, от которых зависит страница
+(представление сообщает их через ``tag``). ``purge`` отмечает время
+изменения тегов, и записи, собранные раньше, устаревают. Свежая запись
+живёт ``PAGE_CACHE_TIMEOUT`` секунд, после чего, как и после
+``purge``, ещё ``PAGE_CACHE_STALE`` секунд считается устаревшей:
+
+* устаревшую или отсутствующую запись пересобирает один запрос — тот,
+  кто первым взял блокировку ключа (``cache.add``; он атомарен между
+  процессами, только если таков общий кеш — ``core.cache.SharedFileCache``
+  или memcached/redis, но не файловый кеш Django);
+* остальные в это время получают устаревшую запись, а если её нет —
+  ждут новую до ``PAGE_CACHE_LOCK_WAIT`` секунд и только потом
+  собирают страницу сами.
+
+Так после публикации поста или истечения срока лента не пересобирается
+одновременно во всех воркерах.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+
+from core import routers
+
+FRESH = 'hit'
+STALE = 'stale'
+MISS = 'miss'
+
+# Заголовки, которые добавляют внешние middleware или которые нельзя
+# отдавать другим клиентам.
+SKIP_HEADERS = {'set-cookie', 'server-timing'}
+
+
+def _entry_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'core:page:{request.method == "HEAD"}:{path}'
+
+
+def _purged_key(tag):
+    return f'core:page-purged:{tag}'
+
+
+def _purge(tags):
+    # Дольше отметка не нужна: записи старше неё уже вытеснены.
+    now = time.time()
+    cache.set_many({_purged_key(tag): now for tag in tags},
+                   settings.PAGE_CACHE_TIMEOUT + settings.PAGE_CACHE_STALE)
+
+
+def purge(*tags):
+    """Устаревает страницы с тегами сейчас и ещё раз после коммита."""
+    tags = set(tags)
+    _purge(tags)
+    transaction.on_commit(lambda: _purge(tags))
+
+
+def tag(request, *tags):
+    """Отмечает, от каких областей зависит ответ на запрос.
+
+    Если какую-то из областей сбросили меньше ``REPLICA_STICKY_SECONDS``
+    секунд назад, остальные чтения запроса идут в основную базу: реплика
+    может ещё не получить изменение.
+    """
+    request.page_cache_tags = getattr(request, 'page_cache_tags', ()) + tags
+    if settings.DATABASE_REPLICAS:
+        since = time.time() - settings.REPLICA_STICKY_SECONDS
+        purged = cache.get_many([_purged_key(tag) for tag in tags])
+        if any(purged_at > since for purged_at in purged.values()):
+            routers.pin()
+
+
+def is_anonymous(request):
+    return (request.method in ('GET', 'HEAD')
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES)
+
+
+def _state(entry):
+    if entry is None:
+        return MISS
+    age = time.time() - entry['created']
+    if age >= settings.PAGE_CACHE_TIMEOUT + settings.PAGE_CACHE_STALE:
+        return MISS
+    purged = cache.get_many([_purged_key(tag) for tag in entry['tags']])
+    if age >= settings.PAGE_CACHE_TIMEOUT or any(
+        entry['created'] <= purged_at for purged_at in purged.values()
+    ):
+        return STALE
+    return FRESH
+
+
+def _respond(request, entry, state):
+    response = HttpResponse(entry['content'], status=entry['status'])
+    for header, value in entry['headers']:
+        response[header] = value
+    response['X-Page-Cache'] = state
+    etag = response.get('ETag')
+    if etag:
+        return get_conditional_response(request, etag=etag,
+                                        response=response)
+    return response
+
+
+def _build(request, key, get_response):
+    created = time.time()
+    response = get_response(request)
+    response['X-Page-Cache'] = MISS
+    if (response.status_code != 200 or response.cookies
+            or response.streaming):
+        return response
+    entry = {
+        'created': created,
+        'status': response.status_code,
+        'content': response.content,
+        'headers': [(header, value) for header, value in response.items()
+                    if header.lower() not in SKIP_HEADERS],
+        'tags': getattr(request, 'page_cache_tags', ()),
+    }
+    cache.set(key, entry,
+              settings.PAGE_CACHE_TIMEOUT + settings.PAGE_CACHE_STALE)
+    return response
+
+
+def serve(request, get_response):
+    """Ответ из кеша или от ``get_response`` с сохранением в кеш."""
+    key = _entry_key(request)
+    entry = cache.get(key)
+    state = _state(entry)
+    if state == FRESH:
+        return _respond(request, entry, FRESH)
+    lock = f'{key}:lock'
+    if cache.add(lock, True, settings.PAGE_CACHE_LOCK_TIMEOUT):
+        try:
+            return _build(request, key, get_response)
+        finally:
+            cache.delete(lock)
+    if state == STALE:
+        return _respond(request, entry, STALE)
+    deadline = time.monotonic() + settings.PAGE_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        state = _state(entry)
+        if state != MISS:
+            return _respond(request, entry, state)
+    return _build(request, key, get_response)
@@ -0,0 +1,103 @@
+"""Чтение из реплик базы, запись в основную.
+
+``ReplicaRouter`` отправляет чтения в случайную базу из
+``DATABASE_REPLICAS``, а запись — в ``default``. Реплики догоняют
+основную базу с задержкой, поэтому чтения идут в ``default``, когда
+свежесть важна:
+
+* внутри транзакции на ``default`` — иначе код не увидит только что
+  записанные в ней строки;
+* в запросах, которые что-то записали (POST и т. п.), — ``pin_primary``
+  включает ``ReplicaRoutingMiddleware``;
+* ещё ``REPLICA_STICKY_SECONDS`` секунд после записи: клиент получает
+  cookie, и автор сразу видит свой пост и комментарий в лентах;
+* столько же после сброса областей, от которых зависит страница
+  (``core.page_cache.tag`` вызывает ``pin``): её пересборка ляжет в кеш
+  под новой версией, и по отстающей реплике там осталось бы старое
+  содержимое. Страницы других областей читают реплики.
+
+Без настроенных реплик роутер ничего не решает, и всё идёт в
+``default``.
+"""
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import (DEFAULT_DB_ALIAS,
+                       connections,
+                       )
+
+_state = threading.local()
+
+
+def _scopes():
+    if not hasattr(_state, 'scopes'):
+        _state.scopes = []
+    return _state.scopes
+
+
+def pinned():
+    """Читает ли текущий поток из основной базы."""
+    scopes = _scopes()
+    return bool(scopes) and (scopes[-1]['pin'] or scopes[-1]['wrote'])
+
+
+def wrote():
+    """Писал ли текущий поток в базу внутри ``pin_primary``."""
+    scopes = _scopes()
+    return bool(scopes) and scopes[-1]['wrote']
+
+
+def pin():
+    """Направляет в ``default`` остальные чтения блока ``pin_primary``."""
+    scopes = _scopes()
+    if scopes:
+        scopes[-1]['pin'] = True
+
+
+def stale(instance):
+    """Прочитан ли объект из реплики до того, как поток стал читать из
+    ``default``; такой объект представлению стоит перечитать."""
+    return pinned() and instance._state.db != DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def pin_primary(pin=True):
+    """Направляет чтения потока в ``default``.
+
+    С ``pin=False`` чтения уходят в ``default`` только после первой
+    записи внутри блока; ``wrote()`` сообщает, была ли она.
+    """
+    scopes = _scopes()
+    outer = scopes[-1] if scopes else None
+    scopes.append({'pin': pin or bool(outer and outer['pin']),
+                   'wrote': bool(outer and outer['wrote'])})
+    try:
+        yield
+    finally:
+        scope = scopes.pop()
+        if outer is not None:
+            outer['wrote'] = outer['wrote'] or scope['wrote']
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or pinned():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        scopes = _scopes()
+        if scopes:
+            scopes[-1]['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
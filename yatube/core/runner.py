@@ -0,0 +1,57 @@
+"""Запуск тестов ``manage.py test``.
+
+Тестовая база SQLite живёт в памяти: потоки процесса делят её, но её
+блокировки таблиц не ждут, а незакоммиченные данные теста другим
+потокам не видны. Поэтому на время тестов фоновые задачи — миниатюры
+и отложенная запись — выполняются в потоке теста. Тесты пула и потока
+записи включают их через ``override_settings`` и дожидаются их
+завершения сами.
+
+Загруженные картинки, общий файловый кеш и журналы отложенной записи
+на время тестов лежат во временном каталоге, который удаляется после
+прогона: ``cache.clear()`` в тестах не трогает кеш рабочего сервера, а
+в ``media/`` не остаются тестовые файлы.
+"""
+import copy
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+def isolated_settings(directory):
+    """Настройки тестов; файлы пишутся в ``directory``."""
+    caches = copy.deepcopy(settings.CACHES)
+    for alias in caches:
+        if caches[alias]['BACKEND'] == 'core.cache.SharedFileCache':
+            caches[alias]['LOCATION'] = os.path.join(directory, 'cache',
+                                                     alias)
+    return {
+        'THUMBNAIL_EXECUTOR': 'inline',
+        'WRITE_BEHIND_EXECUTOR': 'inline',
+        'MEDIA_ROOT': os.path.join(directory, 'media'),
+        'WRITE_BEHIND_JOURNAL_DIR': os.path.join(directory, 'journal'),
+        'CACHES': caches,
+    }
+
+
+@contextmanager
+def isolated_environment():
+    """Временный каталог и настройки тестов на время блока."""
+    with tempfile.TemporaryDirectory(prefix='yatube-tests-') as directory:
+        with override_settings(**isolated_settings(directory)):
+            yield
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._environment = isolated_environment()
+        self._environment.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self._environment.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,28 @@
+"""Сессии в кеше с записью в базу только при изменении.
+
+Как ``django.contrib.sessions.backends.cached_db``, сессия читается из
+кеша, а из ``django_session`` — только при промахе. Кроме того,
+сохранение пропускает запись в базу, если данные не отличаются от
+прочитанных: ``SessionMiddleware`` сохраняет сессию при любом
+присваивании ключа, даже того же значения.
+"""
+from django.contrib.sessions.backends import cached_db
+
+
+class SessionStore(cached_db.SessionStore):
+    _saved = None
+
+    def _dump(self, data):
+        return self.serializer().dumps(data)
+
+    def load(self):
+        data = super().load()
+        self._saved = self._dump(data)
+        return data
+
+    def save(self, must_create=False):
+        if (not must_create and self.session_key is not None
+                and self._saved == self._dump(self._session)):
+            return
+        super().save(must_create)
+        self._saved = self._dump(self._session)
@@ -0,0 +1,118 @@
+"""Профиль отрисовки шаблонов: время по шаблонам и тегам.
+
+Внутри ``profile()`` учитывается отрисовка в текущем потоке: для
+каждого шаблона, в том числе подключённого через ``include`` и
+``extends``, для каждого тега (``url``, ``cache``, ``post_thumbnail``…)
+и для переменных ``{{ … }}`` считаются число вызовов, полное время и
+собственное время — без вложенных шаблонов и тегов. Сумма собственного
+времени равна времени отрисовки.
+
+Учёт подключается заменой ``Template._render`` и
+``Node.render_annotated`` при первом вызове ``profile()``; вне профиля
+замены только проверяют, что профиль не включён. Профиль страниц
+показывает команда ``profile_templates``.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.template import base
+
+_state = threading.local()
+_install_lock = threading.Lock()
+_installed = False
+
+
+class RenderProfile:
+    def __init__(self):
+        # {имя: [вызовов, полное время, собственное время]}
+        self.rows = defaultdict(lambda: [0, 0.0, 0.0])
+        self._children = []
+
+    def measure(self, name, render, *args):
+        self._children.append(0.0)
+        started = time.perf_counter()
+        try:
+            return render(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = self._children.pop()
+            if self._children:
+                self._children[-1] += elapsed
+            row = self.rows[name]
+            row[0] += 1
+            row[1] += elapsed
+            row[2] += elapsed - children
+
+    @property
+    def total(self):
+        return sum(row[2] for row in self.rows.values())
+
+    def table(self):
+        """[(имя, вызовов, полное время, собственное время)] по убыванию
+        собственного времени."""
+        return sorted(((name, *row) for name, row in self.rows.items()),
+                      key=lambda row: row[3], reverse=True)
+
+
+def current():
+    return getattr(_state, 'profile', None)
+
+
+def _template_name(template):
+    return f'template:{template.origin.template_name or template.name}'
+
+
+def _node_name(node):
+    try:
+        return node._profile_name
+    except AttributeError:
+        pass
+    token = getattr(node, 'token', None)
+    name = None
+    if token is not None and token.token_type == base.TokenType.BLOCK:
+        name = f'tag:{token.split_contents()[0]}'
+    elif token is not None and token.token_type == base.TokenType.VAR:
+        name = 'var'
+    node._profile_name = name
+    return name
+
+
+def _install():
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        template_render = base.Template._render
+        node_render = base.Node.render_annotated
+
+        def _render(self, context):
+            profile = current()
+            if profile is None:
+                return template_render(self, context)
+            return profile.measure(_template_name(self), template_render,
+                                   self, context)
+
+        def render_annotated(self, context):
+            profile = current()
+            name = None if profile is None else _node_name(self)
+            if name is None:
+                return node_render(self, context)
+            return profile.measure(name, node_render, self, context)
+
+        base.Template._render = _render
+        base.Node.render_annotated = render_annotated
+        _installed = True
+
+
+@contextmanager
+def profile():
+    """Собирает профиль отрисовки текущего потока."""
+    _install()
+    render_profile = RenderProfile()
+    _state.profile = render_profile
+    try:
+        yield render_profile
+    finally:
+        _state.profile = None
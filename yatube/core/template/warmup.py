@@ -0,0 +1,48 @@
+"""Загрузка шаблонов проекта при старте процесса.
+
+С ``cached.Loader`` шаблон читается и разбирается при первом обращении,
+и эту цену платит первый запрос каждой страницы в каждом воркере.
+``warm_templates`` загружает заранее все шаблоны из ``DIRS`` движков,
+у которых включён кеширующий загрузчик; без него загрузка заранее
+ничего не даёт, и функция ничего не делает.
+"""
+import logging
+import os
+
+from django.template import (TemplateSyntaxError,
+                             engines,
+                             )
+from django.template.loaders.cached import Loader as CachedLoader
+
+logger = logging.getLogger(__name__)
+
+
+def _is_cached(engine):
+    return any(isinstance(loader, CachedLoader)
+               for loader in engine.template_loaders)
+
+
+def _template_names(directory):
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.endswith('.html'):
+                path = os.path.relpath(os.path.join(root, name), directory)
+                yield path.replace(os.sep, '/')
+
+
+def warm_templates():
+    """Загружает шаблоны в кеш загрузчика. Возвращает их число."""
+    loaded = 0
+    for backend in engines.all():
+        engine = getattr(backend, 'engine', None)
+        if engine is None or not _is_cached(engine):
+            continue
+        for directory in engine.dirs:
+            for template_name in _template_names(directory):
+                try:
+                    engine.get_template(template_name)
+                except TemplateSyntaxError:
+                    logger.exception('Шаблон %s не разобран', template_name)
+                else:
+                    loaded += 1
+    return loaded
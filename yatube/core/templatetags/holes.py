@@ -0,0 +1,13 @@
+from django import template
+
+from core import holes
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, template_name, **kwargs):
+    """Личная вставка страницы, см. ``core.holes``."""
+    if context.get(holes.PUNCH):
+        return holes.marker(template_name, kwargs)
+    return holes.render(context.get('request'), template_name, kwargs)
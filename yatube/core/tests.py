@@ -1,9 +1,691 @@
-from django.test import TestCase
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import (cache,
+                               caches,
+                               )
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import (connection,
+                       connections,
+                       transaction,
+                       )
+from django.test import (Client,
+                         RequestFactory,
+                         SimpleTestCase,
+                         TestCase,
+                         TransactionTestCase,
+                         override_settings,
+                         )
+from django.http import HttpResponse
+from django.template import engines
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from http import HTTPStatus
 
+from core.cache import (SharedFileCache,
+                        TieredCache,
+                        key_prefix,
+                        )
+from core import (page_cache,
+                  routers,
+                  )
+from core.db.backends.sqlite3 import base as sqlite_backend
+from core.instrumentation import (Aggregator,
+                                  RequestMetrics,
+                                  aggregator,
+                                  )
+from core.sessions.backends.cached_db import SessionStore
+from core.template import profiler
+from core.template.warmup import warm_templates
+from posts.models import (Comment,
+                          Follow,
+                          Post,
+                          )
+
+User = get_user_model()
+
+SHARED_LOCMEM = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tiered-cache-tests',
+    },
+}
+
 
 class ViewTestClass(TestCase):
     def test_error_page(self):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+@override_settings(CACHES=SHARED_LOCMEM)
+class TieredCacheTests(TestCase):
+    def make_cache(self, **options):
+        options.setdefault('STATS_FLUSH_INTERVAL', 3600)
+        return TieredCache('shared', {'OPTIONS': options})
+
+    def setUp(self):
+        self.worker = self.make_cache(LOCAL_SKIP_PREFIXES=['version:'])
+        self.other_worker = self.make_cache()
+        self.worker.clear()
+
+    def test_write_is_shared_between_workers(self):
+        """Запись одного воркера видна другому через L2."""
+        self.worker.set('feed:1', 'html')
+        self.assertEqual(self.other_worker.get('feed:1'), 'html')
+        self.worker.delete('feed:1')
+        self.assertIsNone(self.worker.get('feed:1'))
+
+    def test_local_tier_answers_without_shared(self):
+        """Повторное чтение обслуживается из L1."""
+        self.worker.set('feed:1', 'html')
+        self.worker.shared.delete('feed:1')
+        self.assertEqual(self.worker.get('feed:1'), 'html')
+
+    def test_local_tier_is_bounded(self):
+        """L1 вытесняет самые старые ключи."""
+        worker = self.make_cache(LOCAL_MAX_ENTRIES=2)
+        for key in ('a', 'b', 'c'):
+            worker.set(key, key)
+        self.assertEqual(len(worker._local), 2)
+        self.assertNotIn(worker.make_key('a'), worker._local)
+
+    def test_skip_prefixes_bypass_local_tier(self):
+        """Ключи версий всегда читаются из L2."""
+        self.worker.set('version:index', 1, None)
+        self.other_worker.incr('version:index')
+        self.assertEqual(self.worker.get('version:index'), 2)
+
+    def test_local_copy_is_not_shared_object(self):
+        """Изменение полученного объекта не меняет кеш."""
+        self.worker.set('session:1', {'a': 1})
+        value = self.worker.get('session:1')
+        value['a'] = 2
+        self.assertEqual(self.worker.get('session:1'), {'a': 1})
+
+    def test_stats_by_prefix(self):
+        """Попадания и промахи считаются по префиксу ключа."""
+        self.worker.set('feed:1', 'html')
+        self.worker.get('feed:1')
+        self.other_worker.get('feed:1')
+        self.other_worker.get('feed:2')
+        self.worker.flush_stats()
+        self.assertEqual(self.other_worker.stats()['feed'],
+                         {'local': 1, 'shared': 1, 'miss': 1})
+        self.other_worker.get('feed:1')
+        self.other_worker.flush_stats()
+        self.assertEqual(self.worker.stats()['feed']['local'], 2)
+        self.worker.reset_stats()
+        self.assertEqual(self.other_worker.stats(), {})
+
+    def test_key_prefix(self):
+        self.assertEqual(key_prefix('posts:version:index'), 'posts:version')
+        self.assertEqual(key_prefix('template.cache.index_page.abc'),
+                         'template.cache.index_page')
+        self.assertEqual(key_prefix('plain'), 'plain')
+
+
+def _incr_many(location, times):
+    shared = SharedFileCache(location, {})
+    for _ in range(times):
+        shared.incr('counter')
+
+
+def _add_once(location, barrier, winners):
+    shared = SharedFileCache(location, {})
+    barrier.wait()
+    if shared.add('lock', os.getpid(), 30):
+        with winners.get_lock():
+            winners.value += 1
+
+
+class TestEnvironmentTests(SimpleTestCase):
+    def test_files_stay_out_of_project(self):
+        """Тесты не пишут в media/ и не чистят кеш рабочего сервера."""
+        shared = caches['default'].shared
+        for path in (settings.MEDIA_ROOT, shared._dir,
+                     settings.WRITE_BEHIND_JOURNAL_DIR):
+            with self.subTest(path=path):
+                self.assertFalse(path.startswith(settings.BASE_DIR))
+
+
+class SharedFileCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.cache = SharedFileCache(self.location, {})
+
+    def run_processes(self, target, *args, count=4):
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=target, args=args)
+                     for _ in range(count)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(30)
+            self.assertEqual(process.exitcode, 0)
+
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.set('counter', 0, None)
+        self.run_processes(_incr_many, self.location, 100)
+        self.assertEqual(self.cache.get('counter'), 400)
+
+    def test_add_has_one_winner_across_processes(self):
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(4)
+        winners = context.Value('i', 0)
+        self.run_processes(_add_once, self.location, barrier, winners)
+        self.assertEqual(winners.value, 1)
+
+    def test_incr_keeps_expiry(self):
+        self.cache.set('counter', 1, 30)
+        fname = self.cache._key_to_file('counter')
+        expiry, value = self.cache._read(fname)
+        self.assertEqual(self.cache.incr('counter', 2), 3)
+        self.assertEqual(self.cache._read(fname), (expiry, 3))
+        self.cache.set('expired', 1, -1)
+        with self.assertRaises(ValueError):
+            self.cache.incr('expired')
+
+    def test_update(self):
+        self.assertEqual(self.cache.update('list', lambda ids: ids + [1], []),
+                         [1])
+        self.cache.update('list', lambda ids: ids + [2], [])
+        self.assertEqual(self.cache.get('list'), [1, 2])
+
+    def test_cull_is_throttled(self):
+        cache = SharedFileCache(self.location, {'OPTIONS': {
+            'MAX_ENTRIES': 2, 'CULL_INTERVAL': 3600,
+        }})
+        with mock.patch.object(cache, '_list_cache_files',
+                               return_value=[]) as listing:
+            for key in 'abc':
+                cache.set(key, key)
+        listing.assert_called_once()
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        aggregator.reset()
+
+    def test_server_timing_header(self):
+        """Ответ содержит метрики запроса в заголовке Server-Timing."""
+        response = self.client.get(reverse('about:author'))
+        self.assertIn('db;desc=', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+
+    def test_metrics_by_url_name(self):
+        """Метрики складываются по имени URL."""
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('posts:index'))
+        queries_count = len(queries)
+        self.client.get(reverse('posts:index'))
+        row = aggregator.totals()['posts:index']
+        self.assertEqual(row['requests'], 2)
+        self.assertEqual(row['max_queries'], queries_count)
+        self.assertGreater(row['render_time'], 0)
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 0})
+    def test_over_budget_is_logged(self):
+        """Превышение бюджета запросов попадает в лог."""
+        with self.assertLogs('core.instrumentation', 'WARNING') as logs:
+            self.client.get(reverse('posts:index'), {'page': 1})
+        self.assertIn('posts:index', logs.output[0])
+        self.assertEqual(aggregator.totals()['posts:index']['over_budget'], 1)
+
+    def test_workers_add_up(self):
+        """Суммы воркеров складываются, а не затирают друг друга."""
+        workers = [Aggregator(), Aggregator()]
+        for queries, worker in enumerate(workers, start=1):
+            metrics = RequestMetrics()
+            metrics.queries = queries
+            worker.add('posts:index', metrics)
+        for worker in workers:
+            worker.flush()
+        row = aggregator.totals()['posts:index']
+        self.assertEqual(row['requests'], 2)
+        self.assertEqual(row['queries'], 3)
+        self.assertEqual(row['max_queries'], 2)
+
+    def test_view_stats_command(self):
+        self.client.get(reverse('posts:index'))
+        out = StringIO()
+        call_command('view_stats', stdout=out)
+        self.assertIn('posts:index', out.getvalue())
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+
+    def test_pinned_reads_go_to_primary(self):
+        with routers.pin_primary():
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+
+    def test_reads_after_write_go_to_primary(self):
+        """Внутри pin_primary(False) чтения переходят в default после
+        первой записи, и это видно снаружи вложенного блока."""
+        with routers.pin_primary(False):
+            self.assertEqual(self.router.db_for_read(Post), 'replica')
+            with routers.pin_primary(False):
+                self.router.db_for_write(Post)
+            self.assertTrue(routers.wrote())
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.assertFalse(routers.wrote())
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+
+    def test_pin_sends_rest_of_block_to_primary(self):
+        with routers.pin_primary(False):
+            post = Post(pk=1)
+            post._state.db = self.router.db_for_read(Post)
+            self.assertEqual(post._state.db, 'replica')
+            self.assertFalse(routers.stale(post))
+            routers.pin()
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+            self.assertTrue(routers.stale(post))
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """Две SQLite-базы: реплика — снимок основной, который отстаёт."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='Author')
+        self.post = Post.objects.create(author=self.author, text='Старый')
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.guest_client = Client()
+        self.replicate()
+        override = override_settings(DATABASE_REPLICAS=['replica'])
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def replicate(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'replica.sqlite3')
+        connection.ensure_connection()
+        with sqlite3.connect(path) as replica:
+            connection.connection.backup(replica)
+        replica.close()
+        connections.databases['replica'] = {
+            **connection.settings_dict, 'NAME': path,
+        }
+        self.addCleanup(self.drop_replica)
+
+    def drop_replica(self):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+
+    def queries(self, client, url, **kwargs):
+        cache.clear()
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = client.get(url, **kwargs)
+        return response, len(primary), len(replica)
+
+    def test_reads_use_replica(self):
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        response, primary, replica = self.queries(self.guest_client, url)
+        self.assertContains(response, 'Старый')
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_author_reads_own_writes(self):
+        """После публикации автор читает из основной базы, а остальные —
+        из реплики, которая пост ещё не получила."""
+        response = self.author_client.post(reverse('posts:post_create'),
+                                           {'text': 'Новый'})
+        self.assertIn('primary_reads_until', response.cookies)
+        post = Post.objects.using('default').get(text='Новый')
+        url = reverse('posts:post_detail', args=[post.pk])
+        response, primary, replica = self.queries(self.author_client, url)
+        self.assertContains(response, 'Новый')
+        self.assertEqual(replica, 0)
+        response, _, _ = self.queries(self.guest_client, url)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_render_after_purge_reads_primary(self):
+        """Страница, пересобранная после изменения поста, читается из
+        основной базы: реплика ещё отдала бы старый текст, и он лёг бы
+        в кеш под новой версией."""
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        self.guest_client.get(url)
+        self.post.text = 'Новый'
+        self.post.save()
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.guest_client.get(url)
+        self.assertContains(response, 'Новый')
+        self.assertEqual(len(replica), 0)
+
+    def test_other_pages_read_replica_after_purge(self):
+        """Сброс областей поста не отправляет в основную базу страницы,
+        которые от них не зависят."""
+        other = User.objects.create_user(username='Other')
+        url = reverse('posts:profile', args=[other.username])
+        self.post.text = 'Новый'
+        self.post.save()
+        with CaptureQueriesContext(connections['default']) as primary:
+            self.guest_client.get(url)
+        self.assertEqual(len(primary), 0)
+
+    def test_transactions_read_primary(self):
+        router = routers.ReplicaRouter()
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Post), 'default')
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    def make_wrapper(self, **options):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'db.sqlite3')
+        wrapper = sqlite_backend.DatabaseWrapper({
+            **connections.databases['default'],
+            'ENGINE': 'core.db.backends.sqlite3',
+            'NAME': self.path,
+            'OPTIONS': options,
+        }, alias='sqlite-backend-test')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_file_database_uses_wal_and_pragmas(self):
+        wrapper = self.make_wrapper(pragmas={'cache_size': -1000})
+        with wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -1000)
+
+    def test_immediate_transaction_takes_write_lock(self):
+        """BEGIN IMMEDIATE блокирует запись другим соединениям сразу."""
+        wrapper = self.make_wrapper(transaction_mode='IMMEDIATE')
+        wrapper.ensure_connection()
+        wrapper.set_autocommit(
+            False, force_begin_transaction_with_broken_autocommit=True
+        )
+        self.addCleanup(wrapper.rollback)
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        with self.assertRaisesMessage(sqlite3.OperationalError,
+                                      'database is locked'):
+            other.execute('BEGIN IMMEDIATE')
+
+    def test_invalid_transaction_mode(self):
+        wrapper = self.make_wrapper(transaction_mode='LAZY')
+        with self.assertRaises(ImproperlyConfigured):
+            wrapper.ensure_connection()
+
+    def test_busy_write_is_retried(self):
+        """Запись вне транзакции ждёт, пока другой воркер отпустит базу."""
+        wrapper = self.make_wrapper(timeout=0, busy_retries=3)
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id INTEGER PRIMARY KEY)')
+        other = sqlite3.connect(self.path, isolation_level=None)
+        self.addCleanup(other.close)
+        other.execute('BEGIN IMMEDIATE')
+        sleep = sqlite_backend.time.sleep
+
+        def release(seconds):
+            other.execute('COMMIT')
+            sleep(0)
+
+        with mock.patch.object(sqlite_backend.time, 'sleep',
+                               side_effect=release) as slept, \
+                wrapper.cursor() as cursor:
+            cursor.execute('INSERT INTO item DEFAULT VALUES')
+        self.assertEqual(slept.call_count, 1)
+
+    def test_retries_are_limited(self):
+        operation = mock.Mock(
+            side_effect=sqlite3.OperationalError('database is locked')
+        )
+        with mock.patch.object(sqlite_backend.time, 'sleep') as slept, \
+                self.assertRaises(sqlite3.OperationalError):
+            sqlite_backend.retry_busy(operation, 2)
+        self.assertEqual(operation.call_count, 3)
+        self.assertLess(*(call.args[0] for call in slept.call_args_list))
+
+
+class TemplateTests(TestCase):
+    def test_warmup_fills_cached_loader(self):
+        templates = [{
+            **settings.TEMPLATES[0],
+            'OPTIONS': {
+                **settings.TEMPLATES[0]['OPTIONS'],
+                'loaders': [('django.template.loaders.cached.Loader',
+                             ['django.template.loaders.filesystem.Loader'])],
+            },
+        }]
+        with override_settings(TEMPLATES=templates):
+            loaded = warm_templates()
+            loader, = engines.all()[0].engine.template_loaders
+            self.assertEqual(len(loader.get_template_cache), loaded)
+            self.assertIn('posts/includes/paginator.html',
+                          loader.get_template_cache)
+
+    def test_warmup_needs_cached_loader(self):
+        self.assertEqual(warm_templates(), 0)
+
+    def test_profile_by_template_and_tag(self):
+        """Время делится по подключённым шаблонам и тегам."""
+        with profiler.profile() as render_profile:
+            render_to_string('posts/index.html', {'feed_cache': {
+                'timeout': 60, 'key': 'profile-test',
+            }})
+        names = {row[0] for row in render_profile.table()}
+        self.assertLessEqual({'template:posts/index.html',
+                              'template:base.html',
+                              'template:includes/header.html',
+                              'tag:url', 'tag:cache', 'tag:include'}, names)
+        calls, full, own = render_profile.rows['template:posts/index.html']
+        self.assertEqual(calls, 1)
+        self.assertLess(own, full)
+        self.assertAlmostEqual(render_profile.total, full, places=3)
+
+    def test_profile_command(self):
+        out = StringIO()
+        call_command('profile_templates', '/', requests=2, cold=True,
+                     stdout=out)
+        self.assertIn('template:posts/index.html', out.getvalue())
+
+
+class HolesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='Author')
+        self.reader = User.objects.create_user(username='Reader')
+        Post.objects.create(author=self.author, text='Общий пост')
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_anonymous_page_is_served_from_cache(self):
+        url = reverse('posts:index')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len(queries), 0)
+        self.assertContains(response, 'Общий пост')
+        self.assertContains(response, 'Войти')
+
+    def test_holes_are_filled_per_user(self):
+        """Закешированная страница получает шапку каждого пользователя."""
+        url = reverse('posts:index')
+        self.client.get(url)
+        response = self.reader_client.get(url)
+        self.assertNotIn('page_obj', response.context)
+        self.assertContains(response, 'Пользователь: Reader')
+        self.assertContains(response, 'Избранные авторы')
+        self.assertNotContains(response, '<!--hole:')
+        response = self.client.get(url)
+        self.assertNotContains(response, 'Reader')
+        self.assertNotContains(response, 'Избранные авторы')
+
+    def test_follow_button_is_personal(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        url = reverse('posts:profile', args=[self.author.username])
+        self.assertContains(self.reader_client.get(url), 'Отписаться')
+        response = self.client.get(url)
+        self.assertContains(response, 'Подписаться')
+        self.assertNotContains(response, 'Отписаться')
+
+    def test_hole_outside_page_cache_is_rendered_inline(self):
+        post = Post.objects.get()
+        response = self.reader_client.get(reverse('posts:post_detail',
+                                                  args=[post.pk]))
+        self.assertContains(response, 'Пользователь: Reader')
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='Author')
+        Post.objects.create(author=self.author, text='Первый пост')
+        self.url = reverse('posts:index')
+
+    def lock(self):
+        key = page_cache._entry_key(RequestFactory().get(self.url))
+        cache.add(f'{key}:lock', True)
+        return lambda: cache.delete(f'{key}:lock')
+
+    def test_anonymous_hit_skips_sessions_and_database(self):
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'miss')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertEqual(len(queries), 0)
+        self.assertContains(response, 'Первый пост')
+        response = self.client.get(self.url,
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_logged_in_user_bypasses_cache(self):
+        self.client.get(self.url)
+        self.client.force_login(self.author)
+        response = self.client.get(self.url)
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'Пользователь: Author')
+
+    def test_stale_while_revalidate(self):
+        """Пока страницу пересобирает другой запрос, отдаётся старая."""
+        self.client.get(self.url)
+        Post.objects.create(author=self.author, text='Второй пост')
+        release = self.lock()
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'stale')
+        self.assertNotContains(response, 'Второй пост')
+        release()
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Второй пост')
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'hit')
+
+    def test_comment_purges_post_page(self):
+        post = Post.objects.get()
+        url = reverse('posts:post_detail', args=[post.pk])
+        self.client.get(url)
+        Comment.objects.create(post=post, author=self.author,
+                               text='Новый комментарий')
+        self.assertContains(self.client.get(url), 'Новый комментарий')
+
+    @override_settings(PAGE_CACHE_LOCK_WAIT=0.1)
+    def test_missing_page_waits_for_builder(self):
+        release = self.lock()
+        self.addCleanup(release)
+        with mock.patch.object(page_cache.time, 'sleep') as slept:
+            response = self.client.get(self.url)
+        self.assertTrue(slept.called)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+
+
+def _serve_page(url, barrier, builds, states):
+    def build(request):
+        with builds.get_lock():
+            builds.value += 1
+        time.sleep(0.2)
+        return HttpResponse('страница')
+
+    barrier.wait()
+    response = page_cache.serve(RequestFactory().get(url), build)
+    states.put(response['X-Page-Cache'])
+
+
+class PageCacheStampedeTests(SimpleTestCase):
+    def test_one_process_builds_missing_page(self):
+        """Из нескольких процессов страницу собирает только один."""
+        cache.clear()
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(4)
+        builds = context.Value('i', 0)
+        states = context.Queue()
+        processes = [context.Process(target=_serve_page,
+                                     args=('/stampede/', barrier, builds,
+                                           states))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(30)
+            self.assertEqual(process.exitcode, 0)
+        self.assertEqual(builds.value, 1)
+        self.assertEqual(sorted(states.get(timeout=5) for _ in processes),
+                         ['hit', 'hit', 'hit', 'miss'])
+
+
+class SessionStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Reader')
+
+    def session_queries(self, action):
+        with CaptureQueriesContext(connection) as queries:
+            action()
+        return [query['sql'] for query in queries
+                if 'django_session' in query['sql']]
+
+    def test_logged_in_pages_do_not_read_session_table(self):
+        self.client.force_login(self.user)
+        url = reverse('posts:index')
+        self.assertEqual(self.session_queries(lambda: self.client.get(url)),
+                         [])
+
+    def test_unchanged_session_is_not_written(self):
+        session = SessionStore()
+        session['theme'] = 'dark'
+        session.create()
+        session = SessionStore(session.session_key)
+        session['theme'] = 'dark'
+        self.assertEqual(self.session_queries(session.save), [])
+        session['theme'] = 'light'
+        self.assertEqual(len(self.session_queries(session.save)), 1)
+        cache.clear()
+        self.assertEqual(SessionStore(session.session_key)['theme'], 'light')
@@ -0,0 +1,87 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются из сигналов в той же транзакции, что и сама запись,
+поэтому страницам не нужен ``COUNT(*)``. ``rebuild`` пересчитывает
+их с нуля (команда ``rebuild_counters``).
+"""
+from django.db.models import (Count,
+                              F,
+                              OuterRef,
+                              Subquery,
+                              Value,
+                              )
+from django.db.models.functions import (Coalesce,
+                                        Greatest,
+                                        )
+
+from .models import (Comment,
+                     Follow,
+                     Group,
+                     Post,
+                     User,
+                     UserCounter,
+                     )
+
+
+def for_user(user):
+    """Счётчики пользователя; если строки ещё нет — нулевые."""
+    try:
+        return user.counters
+    except UserCounter.DoesNotExist:
+        return UserCounter(user=user)
+
+
+def _shift(field, delta):
+    """Сдвиг счётчика, который не уходит ниже нуля."""
+    return Greatest(F(field) + delta, Value(0))
+
+
+def bump_user(user_id, **deltas):
+    changes = {field: _shift(field, delta)
+               for field, delta in deltas.items()}
+    if UserCounter.objects.filter(user_id=user_id).update(**changes):
+        return
+    # Строка создаётся только при росте: при удалении пользователя
+    # его счётчики удаляются раньше постов и подписок.
+    if all(delta > 0 for delta in deltas.values()):
+        UserCounter.objects.get_or_create(user_id=user_id)
+        UserCounter.objects.filter(user_id=user_id).update(**changes)
+
+
+def bump_group(group_id, delta):
+    if group_id is not None:
+        Group.objects.filter(pk=group_id).update(
+            posts_count=_shift('posts_count', delta)
+        )
+
+
+def bump_post(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=_shift('comments_count', delta)
+    )
+
+
+def _count(model, field, ref='pk'):
+    """Подзапрос: число строк ``model``, у которых ``field`` = ``ref``."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef(ref)})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), Value(0))
+
+
+def rebuild():
+    Group.objects.update(posts_count=_count(Post, 'group'))
+    Post.objects.update(comments_count=_count(Comment, 'post'))
+    UserCounter.objects.bulk_create(
+        (UserCounter(user_id=pk)
+         for pk in User.objects.values_list('pk', flat=True).iterator()),
+        ignore_conflicts=True,
+    )
+    UserCounter.objects.update(
+        posts_count=_count(Post, 'author', 'user_id'),
+        followers_count=_count(Follow, 'author', 'user_id'),
+        following_count=_count(Follow, 'user', 'user_id'),
+    )
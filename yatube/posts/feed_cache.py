@@ -0,0 +1,125 @@
+"""Версионированный кеш фрагментов лент.
+
+Ключ фрагмента собирается из версий областей, от которых зависит
+страница (вся лента, группа, автор, пост, список групп), и параметров
+страницы. Сигналы при изменении постов, комментариев и групп
+увеличивают версии, поэтому фрагменты можно хранить долго: после
+изменения старый ключ просто больше никто не запрашивает.
+
+Те же версии служат валидатором страницы: ``etag`` собирает ETag из
+ключа фрагментов и того, что отрисовывается вне них для конкретного
+пользователя, а ``not_modified`` отвечает 304, не выполняя выборку
+постов и не отрисовывая шаблон.
+"""
+import hashlib
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control,
+                                )
+from django.utils.http import quote_etag
+
+from core import page_cache
+
+FeedCache = namedtuple('FeedCache', ('key', 'timeout'))
+
+PAGE_PARAMS = ('page', 'after', 'before')
+
+
+def _version_key(scope):
+    return f'posts:version:{scope}'
+
+
+def _initial_version():
+    # Версия, вытесненная из кеша, начинается не с единицы, а с текущего
+    # времени, чтобы не совпасть ни с одной из уже выданных.
+    return int(time.time() * 1000)
+
+
+def versions(*scopes):
+    keys = [_version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            version = _initial_version()
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            found[key] = version
+    return [found[key] for key in keys]
+
+
+def _bump(scopes):
+    page_cache.purge(*scopes)
+    for scope in scopes:
+        try:
+            cache.incr(_version_key(scope))
+        except ValueError:
+            cache.set(_version_key(scope), _initial_version(), None)
+
+
+def bump(*scopes):
+    """Сбрасывает кеш областей сейчас и ещё раз после коммита.
+
+    Повтор после коммита нужен, чтобы страница, отрисованная другим
+    запросом до коммита по старым данным, не осталась под новой версией.
+    """
+    scopes = {scope for scope in scopes if scope is not None}
+    _bump(scopes)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def for_page(request, name, *scopes):
+    """Ключ и время жизни фрагмента страницы ленты.
+
+    Области становятся и тегами ответа в ``core.page_cache``. Теги
+    ставятся после чтения версий: сброс, случившийся между ними, уже
+    направит чтения страницы в основную базу.
+    """
+    params = '&'.join(f'{param}={request.GET[param]}'
+                      for param in PAGE_PARAMS if param in request.GET)
+    key = ':'.join([name, *map(str, versions(*scopes)), params])
+    page_cache.tag(request, *scopes)
+    return FeedCache(key, settings.FEED_CACHE_TIMEOUT)
+
+
+def post_scopes(post, *group_ids):
+    """Области, которые затрагивает изменение поста."""
+    return ('index',
+            f'author:{post.author_id}',
+            f'post:{post.pk}',
+            *(f'group:{group_id}' for group_id in group_ids
+              if group_id is not None))
+
+
+def etag(request, fragment, *state):
+    """ETag страницы с фрагментами ``fragment``.
+
+    В ``state`` передаётся всё, что шаблон выводит вне фрагментов:
+    счётчики, состояние подписки, секрет CSRF для страниц с формой.
+    Пользователь входит в ETag всегда: от него зависит шапка.
+    """
+    user = request.user
+    parts = [fragment.key, str(user.pk) if user.is_authenticated else '',
+             *map(str, state)]
+    return quote_etag(
+        hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+    )
+
+
+def set_etag(response, etag):
+    """Проставляет ETag; клиент проверяет страницу при каждом показе."""
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def not_modified(request, etag):
+    """Ответ 304, если у клиента страница с тем же ETag, иначе None."""
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        set_etag(response, etag)
+    return response
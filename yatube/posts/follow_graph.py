@@ -0,0 +1,244 @@
+"""Граф подписок в кеше.
+
+Для каждого пользователя в общем кеше лежат два отсортированных массива
+id (``array('q')``, восемь байт на подписку): на кого он подписан и кто
+подписан на него. Массив читается из ``Follow`` одним запросом при
+первом обращении и дальше не переписывается на каждую подписку:
+``add`` и ``remove`` после коммита дописывают изменение в небольшой
+журнал рядом с массивом, а чтение накладывает журнал на массив. Когда
+в журнале набирается ``FOLLOW_GRAPH_DELTA_LIMIT`` изменений, они
+переносятся в массив, и журнал очищается. Изменение из транзакции,
+которая откатилась, в граф не попадает.
+
+Журнал хранит последнее состояние каждой изменённой подписки, поэтому
+наложить его дважды — то же, что один раз: массив, в который журнал
+уже перенесён, и журнал, который ещё не очищен, не противоречат друг
+другу.
+
+Каждое изменение оставляет отметку со случайным значением. ``_load``
+читает отметку до запроса к основной базе и сохраняет прочитанный
+массив, только если отметка не сменилась: иначе массив, прочитанный до
+подписки, лёг бы в кеш уже после неё, а журнал к тому времени мог быть
+уже перенесён в прежний массив.
+
+Проверка «подписан ли A на B» — двоичный поиск в массиве подписок A,
+число подписчиков — длина массива, взаимные подписки — пересечение
+двух массивов. Массивы живут ``FOLLOW_GRAPH_TIMEOUT`` секунд; граф
+служит страницам, а раскладка постов по лентам (``posts.timeline``)
+читает подписчиков из базы.
+"""
+import uuid
+from array import array
+from bisect import (bisect_left,
+                    insort,
+                    )
+from heapq import merge
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import (DEFAULT_DB_ALIAS,
+                       transaction,
+                       )
+
+from .models import Follow
+
+FOLLOWING = 'following'
+FOLLOWERS = 'followers'
+
+# Поле Follow с пользователем и поле с его соседом для каждого массива.
+FIELDS = {
+    FOLLOWING: ('user_id', 'author_id'),
+    FOLLOWERS: ('author_id', 'user_id'),
+}
+
+# Отметка изменения должна пережить любой идущий в это время _load.
+CHANGED_TIMEOUT = 60
+
+
+class Adjacency:
+    """Отсортированные id соседей пользователя в графе подписок.
+
+    ``added`` и ``removed`` — наложенный журнал: id, которых нет в
+    массиве ``ids``, и id массива, которых уже нет в графе. В кеш
+    попадает только ``ids``.
+    """
+    __slots__ = ('ids', 'added', 'removed')
+
+    def __init__(self, ids=()):
+        self.ids = array('q', sorted(ids))
+        self.added = array('q')
+        self.removed = set()
+
+    def _in_ids(self, user_id):
+        index = bisect_left(self.ids, user_id)
+        return index < len(self.ids) and self.ids[index] == user_id
+
+    def _in_added(self, user_id):
+        index = bisect_left(self.added, user_id)
+        return index < len(self.added) and self.added[index] == user_id
+
+    def __contains__(self, user_id):
+        if user_id in self.removed:
+            return False
+        return self._in_ids(user_id) or self._in_added(user_id)
+
+    def __len__(self):
+        return len(self.ids) + len(self.added) - len(self.removed)
+
+    def __iter__(self):
+        ids = (user_id for user_id in self.ids
+               if user_id not in self.removed)
+        return merge(ids, self.added)
+
+    def __and__(self, other):
+        smaller, larger = sorted((self, other), key=len)
+        return [user_id for user_id in smaller if user_id in larger]
+
+    def __getstate__(self):
+        return (self.ids,)
+
+    def __setstate__(self, state):
+        self.ids, = state
+        self.added = array('q')
+        self.removed = set()
+
+    def apply(self, delta):
+        """Накладывает журнал ``{id: есть ли подписка}``."""
+        for user_id, present in delta.items():
+            if present:
+                self.removed.discard(user_id)
+                if not self._in_ids(user_id) and not self._in_added(user_id):
+                    insort(self.added, user_id)
+            else:
+                if self._in_added(user_id):
+                    del self.added[bisect_left(self.added, user_id)]
+                elif self._in_ids(user_id):
+                    self.removed.add(user_id)
+        return self
+
+    def compact(self):
+        """Переносит наложенный журнал в ``ids``."""
+        self.ids = array('q', iter(self))
+        self.added = array('q')
+        self.removed = set()
+        return self
+
+
+def _key(kind, user_id):
+    return f'posts:follows:{kind}:{user_id}'
+
+
+def _changed_key(kind, user_id):
+    return f'posts:follows:changed:{kind}:{user_id}'
+
+
+def _delta_key(kind, user_id):
+    return f'posts:follows:delta:{kind}:{user_id}'
+
+
+def _load(kind, user_id):
+    field, other = FIELDS[kind]
+    changed_key = _changed_key(kind, user_id)
+    changed = cache.get(changed_key)
+    # Реплика может отставать от только что сделанной подписки.
+    adjacency = Adjacency(Follow.objects.using(DEFAULT_DB_ALIAS).filter(
+        **{field: user_id}
+    ).values_list(other, flat=True))
+
+    def store(current):
+        # Массив, который успел сохранить другой запрос, уже учитывает
+        # все изменения; свой — только если изменений не было.
+        if current is not None or cache.get(changed_key) != changed:
+            return current
+        return adjacency
+
+    cache.update(_key(kind, user_id), store, None,
+                 settings.FOLLOW_GRAPH_TIMEOUT)
+    return adjacency
+
+
+def _get(kind, user_id):
+    key, delta_key = _key(kind, user_id), _delta_key(kind, user_id)
+    found = cache.get_many([key, delta_key])
+    adjacency = found.get(key)
+    if adjacency is None:
+        adjacency = _load(kind, user_id)
+    return adjacency.apply(found.get(delta_key) or {})
+
+
+def following(user_id):
+    """Авторы, на которых подписан пользователь."""
+    return _get(FOLLOWING, user_id)
+
+
+def followers(user_id):
+    """Подписчики пользователя."""
+    return _get(FOLLOWERS, user_id)
+
+
+def follows(user, author_id):
+    """Подписан ли пользователь на автора; гость не подписан ни на кого."""
+    return user.is_authenticated and author_id in following(user.pk)
+
+
+def is_mutual(user_id, other_id):
+    """Подписаны ли пользователи друг на друга."""
+    return (other_id in following(user_id)
+            and user_id in following(other_id))
+
+
+def mutual(user_id):
+    """id пользователей, с которыми у пользователя взаимная подписка."""
+    return following(user_id) & followers(user_id)
+
+
+def _compact(kind, user_id, delta):
+    def apply(adjacency):
+        if adjacency is not None:
+            adjacency.apply(delta).compact()
+        return adjacency
+
+    def trim(current):
+        # Изменения, записанные после чтения журнала, остаются в нём.
+        return {member: present
+                for member, present in (current or {}).items()
+                if delta.get(member) != present} or None
+
+    cache.update(_key(kind, user_id), apply, None,
+                 settings.FOLLOW_GRAPH_TIMEOUT)
+    cache.update(_delta_key(kind, user_id), trim, None,
+                 settings.FOLLOW_GRAPH_TIMEOUT)
+
+
+def _change(kind, user_id, member, present):
+    cache.set(_changed_key(kind, user_id), uuid.uuid4().hex,
+              CHANGED_TIMEOUT)
+
+    def change(delta):
+        delta = dict(delta or {})
+        delta[member] = present
+        return delta
+
+    delta = cache.update(_delta_key(kind, user_id), change, None,
+                         settings.FOLLOW_GRAPH_TIMEOUT)
+    if len(delta) >= settings.FOLLOW_GRAPH_DELTA_LIMIT:
+        _compact(kind, user_id, delta)
+
+
+def _apply(user_id, author_id, present):
+    _change(FOLLOWING, user_id, author_id, present)
+    _change(FOLLOWERS, author_id, user_id, present)
+
+
+def _update(user_id, author_id, present):
+    transaction.on_commit(lambda: _apply(user_id, author_id, present))
+
+
+def add(user_id, author_id):
+    """Учитывает новую подписку после коммита."""
+    _update(user_id, author_id, True)
+
+
+def remove(user_id, author_id):
+    """Учитывает отписку после коммита."""
+    _update(user_id, author_id, False)
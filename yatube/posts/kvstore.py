@@ -0,0 +1,23 @@
+"""Хранилище ключей sorl-thumbnail (``THUMBNAIL_KVSTORE``).
+
+То же, что ``cached_db`` из sorl-thumbnail, но запись ключа — один
+``UPDATE``, а для нового ключа ещё ``INSERT``. Стандартное хранилище
+пишет через ``get_or_create``: ``SELECT`` и ``INSERT`` в отдельной
+транзакции (в режиме ``IMMEDIATE`` — с блокировкой записи) на каждую
+миниатюру и на каждое обновление списка миниатюр картинки.
+"""
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDB
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+
+class KVStore(CachedDB):
+    def _set_raw(self, key, value):
+        rows = KVStoreModel.objects.filter(key=key).update(value=value)
+        if not rows:
+            # Ключ, одновременно записанный другим потоком, не перезаписываем:
+            # значения для одного ключа совпадают.
+            KVStoreModel.objects.bulk_create(
+                [KVStoreModel(key=key, value=value)], ignore_conflicts=True,
+            )
+        self.cache.set(key, value, settings.THUMBNAIL_CACHE_TIMEOUT)
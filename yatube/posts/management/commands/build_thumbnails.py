@@ -0,0 +1,53 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import (feed_cache,
+                   thumbnails,
+                   )
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Строит миниатюры всех размеров и форматов для уже '
+            'загруженных картинок постов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Число процессов (по умолчанию — число ядер).',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересобрать миниатюры, даже если они уже есть.',
+        )
+
+    def handle(self, *args, workers, force, **options):
+        posts = Post.objects.exclude(image='').only(
+            'pk', 'author', 'group', 'image'
+        )
+        scopes = {}
+        for post in posts.iterator():
+            scopes.setdefault(post.image.name, set()).update(
+                feed_cache.post_scopes(post, post.group_id)
+            )
+        names = sorted(scopes)
+        build = partial(thumbnails.generate, force=force)
+        if workers > 1 and len(names) > 1:
+            # Дочерние процессы не должны унаследовать открытые соединения.
+            connections.close_all()
+            pool = ProcessPoolExecutor(workers, initializer=django.setup)
+            with pool:
+                results = list(pool.map(build, names, chunksize=8))
+        else:
+            results = [build(name) for name in names]
+        built = [name for name, result in zip(names, results) if result]
+        feed_cache.bump(*set().union(*(scopes[name] for name in built)))
+        failed = len(names) - len(built)
+        self.stdout.write(self.style.SUCCESS(
+            f'Миниатюры построены: {len(built)}, ошибок: {failed}.'
+        ))
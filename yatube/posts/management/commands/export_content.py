@@ -0,0 +1,38 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ('Выгружает группы, посты, комментарии и подписки в NDJSON '
+            'или CSV, по файлу на таблицу.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Каталог для файлов.')
+        parser.add_argument('--format', choices=transfer.FORMATS,
+                            default='ndjson', dest='file_format')
+        parser.add_argument('--tables', nargs='+', choices=transfer.ORDER,
+                            default=transfer.ORDER)
+        parser.add_argument('--chunk-size', type=int,
+                            default=transfer.CHUNK_SIZE)
+        parser.add_argument('--resume', action='store_true',
+                            help='Продолжить прерванную выгрузку.')
+
+    def handle(self, directory, file_format, tables, chunk_size, resume,
+               **options):
+        os.makedirs(directory, exist_ok=True)
+        for table in tables:
+            path = transfer.filename(directory, table, file_format)
+            started = time.perf_counter()
+            rows = transfer.export_table(table, path, file_format,
+                                         chunk_size=chunk_size,
+                                         resume=resume)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{table}: {rows} строк за {elapsed:.1f} с '
+                f'({rows / max(elapsed, 1e-6):.0f} строк/с) → {path}'
+            )
+        self.stdout.write(self.style.SUCCESS('Выгрузка завершена.'))
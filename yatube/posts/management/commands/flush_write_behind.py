@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import write_behind
+
+
+class Command(BaseCommand):
+    help = ('Дописывает в базу журналы отложенной записи процессов, '
+            'которые завершились, не успев их записать.')
+
+    def handle(self, *args, **options):
+        total = write_behind.recover()
+        self.stdout.write(self.style.SUCCESS(
+            f'Журналы отложенной записи дописаны, событий: {total}.'
+        ))
@@ -0,0 +1,60 @@
+import os
+import time
+
+from django.core.cache import cache
+from django.core.management.base import (BaseCommand,
+                                         CommandError,
+                                         )
+from django.db import transaction
+
+from posts import (counters,
+                   search,
+                   timeline,
+                   transfer,
+                   )
+
+
+class Command(BaseCommand):
+    help = ('Загружает группы, посты, комментарии и подписки из файлов '
+            'export_content.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Каталог с файлами.')
+        parser.add_argument('--format', choices=transfer.FORMATS,
+                            default='ndjson', dest='file_format')
+        parser.add_argument('--tables', nargs='+', choices=transfer.ORDER,
+                            default=transfer.ORDER)
+        parser.add_argument('--chunk-size', type=int,
+                            default=transfer.CHUNK_SIZE)
+        parser.add_argument('--resume', action='store_true',
+                            help='Продолжить прерванную загрузку.')
+        parser.add_argument('--no-rebuild', action='store_true',
+                            help='Не пересобирать счётчики, ленты и '
+                                 'поисковый индекс.')
+
+    def handle(self, directory, file_format, tables, chunk_size, resume,
+               no_rebuild, **options):
+        paths = {table: transfer.filename(directory, table, file_format)
+                 for table in transfer.ORDER if table in tables}
+        for path in paths.values():
+            if not os.path.exists(path):
+                raise CommandError(f'Нет файла {path}')
+        for table, path in paths.items():
+            started = time.perf_counter()
+            rows = transfer.import_table(table, path, file_format,
+                                         chunk_size=chunk_size,
+                                         resume=resume)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{table}: {rows} строк за {elapsed:.1f} с '
+                f'({rows / max(elapsed, 1e-6):.0f} строк/с)'
+            )
+        if not no_rebuild:
+            # bulk_create не вызывает сигналы: производные данные и кеш
+            # лент пересобираются целиком.
+            with transaction.atomic():
+                counters.rebuild()
+                timeline.rebuild()
+                search.rebuild()
+            cache.clear()
+        self.stdout.write(self.style.SUCCESS('Загрузка завершена.'))
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает предложения «Кого почитать».'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = recommendations.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Предложений: {rows}, за '
+            f'{time.perf_counter() - started:.1f} с.'
+        ))
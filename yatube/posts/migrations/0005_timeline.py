@@ -0,0 +1,74 @@
+# Generated by Django 2.2.28 on 2026-10-17 04:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Значения posts.timeline на момент миграции: она должна заполнять ленты
+# одинаково, как бы потом ни поменялись настройки.
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_BACKFILL = 1000
+
+
+FILL_SQL = """
+    INSERT INTO {timeline} (user_id, post_id, author_id, pub_date)
+    SELECT follow.user_id, post.id, post.author_id, post.pub_date
+    FROM {follow} AS follow
+    JOIN (
+        SELECT id, author_id, pub_date,
+               ROW_NUMBER() OVER (PARTITION BY author_id
+                                  ORDER BY pub_date DESC, id DESC) AS place
+        FROM {post}
+    ) AS post ON post.author_id = follow.author_id
+    WHERE post.place <= %s
+      AND follow.author_id NOT IN (
+          SELECT author_id FROM {follow}
+          GROUP BY author_id
+          HAVING COUNT(*) > %s
+      )
+"""
+
+
+def fill_timelines(apps, schema_editor):
+    # Один запрос, как posts.timeline.rebuild; счётчиков подписчиков
+    # ещё нет (0006), поэтому популярные авторы считаются по Follow.
+    sql = FILL_SQL.format(
+        timeline=apps.get_model('posts', 'Timeline')._meta.db_table,
+        follow=apps.get_model('posts', 'Follow')._meta.db_table,
+        post=apps.get_model('posts', 'Post')._meta.db_table,
+    )
+    schema_editor.execute(sql, [TIMELINE_BACKFILL, TIMELINE_FANOUT_LIMIT])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0004_follow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Timeline',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='timeline',
+            index=models.Index(fields=['user', 'pub_date', 'post'], name='timeline_user_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timeline',
+            index=models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timeline',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_timeline_post'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
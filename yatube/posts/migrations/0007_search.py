@@ -0,0 +1,42 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:20
+
+from django.db import (OperationalError,
+                       migrations,
+                       transaction,
+                       )
+
+TABLE = 'posts_search'
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    # Без FTS5 в сборке SQLite индекса нет, и поиск идёт через
+    # icontains (posts.search.available). Индекс создаётся пустым:
+    # посты, написанные до миграции, в него кладёт команда
+    # rebuild_search_index тем же стеммером, что и запросы.
+    try:
+        with transaction.atomic(using=connection.alias):
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {TABLE} USING fts5("
+                f"body, tokenize='unicode61 remove_diacritics 0')"
+            )
+    except OperationalError:
+        return
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
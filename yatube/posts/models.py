@@ -19,11 +19,39 @@ class Group(models.Model):
     description = models.TextField(
         verbose_name='Описание группы',
     )
+    posts_count = models.PositiveIntegerField(
+        'Число постов',
+        default=0,
+        editable=False,
+    )
 
     def __str__(self) -> str:
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для лент: автор и группа одним запросом, без лишних полей."""
+        return self.select_related('author', 'group').only(
+            'text', 'pub_date', 'image', 'thumbnails', 'comments_count',
+            'author', 'author__username',
+            'author__first_name', 'author__last_name',
+            'group', 'group__title', 'group__slug',
+        )
+
+    def for_detail(self):
+        """Пост для отдельной страницы вместе со счётчиками автора."""
+        return self.select_related('author__counters', 'group')
+
+
+class CommentQuerySet(models.QuerySet):
+    def for_post(self, post):
+        """Комментарии поста в порядке добавления вместе с авторами."""
+        return self.filter(post=post).select_related('author').only(
+            'text', 'created', 'post', 'author', 'author__username',
+        ).order_by('created', 'pk')
+
+
 class Post(CreatedModel):
     TEXT_LENGHT = 15
 
@@ -41,6 +69,7 @@ class Post(CreatedModel):
         on_delete=models.CASCADE,
         related_name='posts',
         verbose_name='Автор',
+        db_index=False,
     )
     group = models.ForeignKey(
         Group,
@@ -49,18 +78,43 @@ class Post(CreatedModel):
         related_name='posts',
         verbose_name='Группа',
         help_text='Группа, к которой будет относиться пост',
+        db_index=False,
     )
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
         blank=True,
     )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False,
+    )
+    # Готовые миниатюры картинки в JSON (posts.thumbnails).
+    thumbnails = models.TextField(
+        'Миниатюры',
+        blank=True,
+        default='',
+        editable=False,
+    )
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text[:int(self.TEXT_LENGHT)]
 
     class Meta:
         ordering = ['-pub_date']
+        # Ленты группы и автора листаются по (pub_date, id) внутри
+        # группы/автора; id SQLite добавляет в конец индекса сам.
+        # Отдельные индексы внешних ключей author и group не нужны:
+        # их заменяют первые колонки этих индексов.
+        indexes = [
+            models.Index(fields=['group', 'pub_date'],
+                         name='post_group_feed_idx'),
+            models.Index(fields=['author', 'pub_date'],
+                         name='post_author_feed_idx'),
+        ]
 
 
 class Comment(CreatedModel):
@@ -70,6 +124,7 @@ class Comment(CreatedModel):
         null=True,
         on_delete=models.CASCADE,
         related_name='comments',
+        db_index=False,
     )
     author = models.ForeignKey(
         User,
@@ -85,13 +140,93 @@ class Comment(CreatedModel):
         auto_now_add=True,
     )
 
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created_idx'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(User,
                              on_delete=models.CASCADE,
                              related_name='follower',
+                             db_index=False,
                              )
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE,
                                related_name='following',
                                )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'],
+                                    name='unique_follow'),
+        ]
+
+
+class Suggestion(models.Model):
+    """Автор, на которого стоит подписаться пользователю.
+
+    Строки целиком пересобирает ``posts.recommendations.rebuild``.
+    """
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='suggestions',
+                             db_index=False,
+                             )
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name='+',
+                               )
+    score = models.FloatField('Вес')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'score'],
+                         name='suggestion_user_score_idx'),
+        ]
+
+
+class UserCounter(models.Model):
+    """Счётчики пользователя, которые обновляются при записи."""
+    user = models.OneToOneField(User,
+                                on_delete=models.CASCADE,
+                                related_name='counters',
+                                )
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+    followers_count = models.PositiveIntegerField('Число подписчиков',
+                                                  default=0)
+    following_count = models.PositiveIntegerField('Число подписок',
+                                                  default=0)
+
+
+class Timeline(models.Model):
+    """Материализованная лента подписок: пост в ленте подписчика."""
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='timeline',
+                             )
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='timeline_entries',
+                             )
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name='+',
+                               )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_timeline_post'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'pub_date', 'post'],
+                         name='timeline_user_feed_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author_idx'),
+        ]
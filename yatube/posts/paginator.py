@@ -0,0 +1,303 @@
+from django.conf import settings
+from django.core.paginator import (EmptyPage,
+                                   Page,
+                                   PageNotAnInteger,
+                                   Paginator,
+                                   )
+from django.db.models import (Q,
+                              QuerySet,
+                              )
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+from django.utils.http import (urlsafe_base64_decode,
+                               urlsafe_base64_encode,
+                               )
+
+from core.db import estimated_rows
+
+
+def encode_cursor(post):
+    """Непрозрачный токен позиции поста в ленте: (pub_date, id)."""
+    raw = f'{post.pub_date.isoformat()}|{post.pk}'
+    return urlsafe_base64_encode(raw.encode())
+
+
+def decode_cursor(token):
+    """Разбирает токен; для испорченного токена возвращает None."""
+    try:
+        pub_date, pk = urlsafe_base64_decode(token).decode().split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+def keyset_queryset(queryset, cursor, newer, fields=('pub_date', 'pk')):
+    """Лента строго после курсора в порядке листания.
+
+    ``fields`` — поля ключа (дата, id); ``newer`` задаёт направление:
+    к более новым записям (по возрастанию) или к более старым.
+    Условие ``(дата, id) > курсор`` записано как ``дата >= x AND
+    (дата > x OR id > y)``: первая часть даёт SQLite диапазон по
+    индексу, а не полный проход с фильтром.
+    """
+    date_field, pk_field = fields
+    if cursor is not None:
+        pub_date, pk = cursor
+        lookup = 'gt' if newer else 'lt'
+        queryset = queryset.filter(
+            Q(**{f'{date_field}__{lookup}e': pub_date}),
+            Q(**{f'{date_field}__{lookup}': pub_date})
+            | Q(**{f'{pk_field}__{lookup}': pk}),
+        )
+    if newer:
+        return queryset.order_by(date_field, pk_field)
+    return queryset.order_by(f'-{date_field}', f'-{pk_field}')
+
+
+def keyset_slice(queryset, cursor, newer, limit, fields=('pub_date', 'pk')):
+    """Первые ``limit`` записей ленты строго после курсора."""
+    return list(keyset_queryset(queryset, cursor, newer, fields)[:limit])
+
+
+class CursorSlice:
+    """Ленивый список постов страницы: запрос уходит при первом чтении."""
+
+    def __init__(self, paginator):
+        self.paginator = paginator
+
+    def __len__(self):
+        return len(self.paginator.posts)
+
+    def __iter__(self):
+        return iter(self.paginator.posts)
+
+    def __getitem__(self, index):
+        return self.paginator.posts[index]
+
+
+class CursorPaginator(Paginator):
+    """Paginator, который листает ленту по курсору (pub_date, id).
+
+    Вместо ``COUNT(*)`` и ``OFFSET`` страница выбирается условием
+    ``(pub_date, id) < курсор`` по индексу ``pub_date``, поэтому любая
+    страница стоит столько же, сколько первая. Номер страницы здесь
+    условный: 1 — начало ленты, 2 — любая страница после неё, а
+    ``num_pages`` говорит только о том, есть ли следующая.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, after=None, before=None):
+        super().__init__(object_list, per_page)
+        self.after = decode_cursor(after) if after else None
+        self.before = (decode_cursor(before)
+                       if before and not self.after else None)
+        self._posts = None
+
+    @classmethod
+    def windowed(cls, object_list, **kwargs):
+        """Записи ленты для ``?page=N`` (``WindowedPaginator``)."""
+        return object_list
+
+    def get_cursor_page(self):
+        if self.before is not None:
+            number = 2 if self.has_previous else 1
+        else:
+            number = 1 if self.after is None else 2
+        return Page(CursorSlice(self), number, self)
+
+    @property
+    def posts(self):
+        if self._posts is None:
+            self._fetch()
+        return self._posts
+
+    @property
+    def num_pages(self):
+        number = 2 if self.has_previous else 1
+        return number + 1 if self.has_next else number
+
+    @property
+    def has_next(self):
+        self.posts
+        return self._has_next
+
+    @property
+    def has_previous(self):
+        self.posts
+        return self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self.has_next:
+            return encode_cursor(self.posts[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous:
+            return encode_cursor(self.posts[0])
+        return None
+
+    def _fetch(self):
+        if self.before is not None:
+            posts = self._slice(self.before, newer=True)
+            self._has_previous = len(posts) > self.per_page
+            self._has_next = True
+            self._posts = posts[:self.per_page][::-1]
+        else:
+            posts = self._slice(self.after, newer=False)
+            self._has_previous = self.after is not None
+            self._has_next = len(posts) > self.per_page
+            self._posts = posts[:self.per_page]
+
+    def _slice(self, cursor, newer):
+        return keyset_slice(self.object_list, cursor, newer,
+                            self.per_page + 1)
+
+
+class WindowedPage(Page):
+    def page_window(self):
+        return self.paginator.get_elided_page_range(self.number)
+
+    def has_next(self):
+        if not self.paginator.count_is_approximate:
+            return super().has_next()
+        # Оценка числа записей может быть меньше настоящего: полная
+        # страница, скорее всего, не последняя.
+        return (self.number < self.paginator.num_pages
+                or len(self.object_list) == self.paginator.per_page)
+
+
+class WindowedPaginator(Paginator):
+    """Paginator для ``?page=N``, который не перечисляет все страницы.
+
+    ``get_elided_page_range`` отдаёт шаблону окно номеров: первые
+    ``on_ends``, соседние с текущей ``on_each_side`` и последние, с
+    многоточием между ними, поэтому размер HTML не зависит от числа
+    страниц.
+
+    Записи считаются только до ``count_limit``. Если их больше, число
+    оценивается (``count_is_approximate``): для всей таблицы — по
+    статистике базы, иначе как ``count_limit + 1``. Последние страницы
+    окна тогда не показываются, а страницы за оценкой открываются, пока
+    на них есть записи.
+    """
+    ELLIPSIS = '…'
+
+    def __init__(self, object_list, per_page, count_limit=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_limit = count_limit
+        self._approximate = False
+
+    @cached_property
+    def count(self):
+        if self.count_limit is None:
+            return super().count
+        if isinstance(self.object_list, QuerySet):
+            # COUNT(*) по подзапросу с LIMIT: не дальше count_limit + 1.
+            rows = self.object_list[:self.count_limit + 1].count()
+            if rows <= self.count_limit:
+                return rows
+        elif not self.object_list[self.count_limit:self.count_limit + 1]:
+            return super().count
+        self._approximate = True
+        return max(self._estimate() or 0, self.count_limit + 1)
+
+    @property
+    def count_is_approximate(self):
+        self.count
+        return self._approximate
+
+    def _estimate(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where:
+            return estimated_rows(queryset.model)
+        return None
+
+    def validate_number(self, number):
+        if not self.count_is_approximate:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть целым')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_is_approximate:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom:bottom + self.per_page])
+        if not object_list and number > 1:
+            raise EmptyPage('На странице нет записей')
+        return self._get_page(object_list, number, self)
+
+    def get_page(self, number):
+        try:
+            return super().get_page(number)
+        except EmptyPage:
+            # За оценкой числа записей страниц оказалось меньше.
+            return self.page(1)
+
+    def _get_page(self, *args, **kwargs):
+        return WindowedPage(*args, **kwargs)
+
+    def get_elided_page_range(self, number=1, on_each_side=2, on_ends=1):
+        """Номера страниц вокруг ``number`` и по краям, с ELLIPSIS."""
+        number = self.validate_number(number)
+        num_pages = max(self.num_pages, number)
+        if num_pages <= (on_each_side + on_ends) * 2 + 1:
+            yield from range(1, num_pages + 1)
+            if self.count_is_approximate:
+                yield self.ELLIPSIS
+            return
+        if number > 1 + on_each_side + on_ends + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if self.count_is_approximate:
+            yield from range(number + 1,
+                             min(number + on_each_side, num_pages) + 1)
+            yield self.ELLIPSIS
+        elif number < num_pages - on_each_side - on_ends - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(num_pages - on_ends + 1, num_pages + 1)
+        else:
+            yield from range(number + 1, num_pages + 1)
+
+
+def windowed_page(request, object_list, per_page):
+    """Страница ``?page=N`` с оценкой числа записей сверх
+    ``PAGINATOR_COUNT_LIMIT``."""
+    paginator = WindowedPaginator(object_list, per_page,
+                                  count_limit=settings.PAGINATOR_COUNT_LIMIT)
+    return paginator.get_page(request.GET.get('page'))
+
+
+def paginate(request, queryset, per_page,
+             paginator_class=CursorPaginator, **kwargs):
+    """Страница ленты для запроса.
+
+    ``?page=N`` обслуживается ``WindowedPaginator`` по записям
+    ``paginator_class.windowed``, всё остальное (в том числе ``?after=``
+    и ``?before=``) — курсорным ``paginator_class``; обоим передаются
+    ``kwargs``.
+    """
+    if request.GET.get('page') is not None:
+        object_list = paginator_class.windowed(queryset, **kwargs)
+        return windowed_page(request, object_list, per_page)
+    paginator = paginator_class(queryset, per_page,
+                                after=request.GET.get('after'),
+                                before=request.GET.get('before'),
+                                **kwargs)
+    return paginator.get_cursor_page()
@@ -0,0 +1,184 @@
+"""Полнотекстовый поиск по постам.
+
+Индекс — виртуальная таблица SQLite FTS5 ``posts_search``: rowid
+совпадает с id поста, в колонке ``body`` лежат основы слов текста
+(``posts.stemmer``). Сигналы обновляют запись при сохранении поста и
+удаляют при удалении, ``rebuild_search_index`` пересобирает индекс
+целиком; миграция создаёт индекс пустым, и посты, написанные до неё,
+попадают в него после этой команды. Результаты упорядочены по BM25,
+при равенстве — новые выше.
+
+На других СУБД и в сборках SQLite без FTS5 поиск сводится к
+``icontains`` по основам. ``available`` один раз на процесс пробует
+создать временную таблицу FTS5 и проверяет, что индекс есть: миграция
+без FTS5 его не создаёт. Если SQLite потом обновили, индекс создаёт
+``rebuild_search_index``, а воркеры подхватят его после перезапуска.
+"""
+from functools import reduce
+from operator import and_
+
+from django.db import (OperationalError,
+                       connection,
+                       )
+from django.db.models import Q
+
+from .stemmer import stems
+
+TABLE = 'posts_search'
+BATCH_SIZE = 1000
+PREFIX_MIN_LENGTH = 4
+
+MATCHING_IDS = f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s'
+
+CREATE_TABLE = (f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+                f"body, tokenize='unicode61 remove_diacritics 0')")
+PROBE = 'CREATE VIRTUAL TABLE temp.posts_search_probe USING fts5(body)'
+
+_state = {}
+
+
+def fts5():
+    """Есть ли FTS5 в сборке SQLite."""
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(PROBE)
+        except OperationalError:
+            return False
+        cursor.execute('DROP TABLE temp.posts_search_probe')
+    return True
+
+
+def available():
+    """Можно ли искать по индексу FTS5."""
+    if 'available' not in _state:
+        _state['available'] = (
+            fts5() and TABLE in connection.introspection.table_names()
+        )
+    return _state['available']
+
+
+def index_text(text):
+    return ' '.join(stems(text))
+
+
+def match_expression(query):
+    """Запрос FTS5: все основы слов запроса должны встретиться в посте.
+
+    Основы длиной от PREFIX_MIN_LENGTH ищутся как префиксы: стеммер
+    иногда отрезает от одной формы слова больше, чем от другой
+    («сигнал» → «сигна», «сигналов» → «сигнал»).
+    """
+    return ' '.join(
+        f'"{term}"*' if len(term) >= PREFIX_MIN_LENGTH else f'"{term}"'
+        for term in dict.fromkeys(stems(query))
+    )
+
+
+def update(post):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT OR REPLACE INTO {TABLE} (rowid, body) VALUES (%s, %s)',
+            [post.pk, index_text(post.text)],
+        )
+
+
+def remove(post_id):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild():
+    """Пересобирает индекс по всем постам. Возвращает число постов."""
+    from .models import Post
+
+    if not fts5():
+        return 0
+    total = 0
+    rows = Post.objects.values_list('pk', 'text').order_by()
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_TABLE)
+        _state.pop('available', None)
+        cursor.execute(f'DELETE FROM {TABLE}')
+        batch = []
+        for pk, text in rows.iterator(chunk_size=BATCH_SIZE):
+            batch.append((pk, index_text(text)))
+            if len(batch) == BATCH_SIZE:
+                total += insert(cursor, batch)
+                batch = []
+        total += insert(cursor, batch)
+    return total
+
+
+def insert(cursor, rows):
+    if rows:
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, body) VALUES (%s, %s)', rows
+        )
+    return len(rows)
+
+
+class SearchResults:
+    """Найденные посты в порядке релевантности для ``Paginator``.
+
+    Срез выбирает из индекса только id нужной страницы, а сами посты
+    загружаются одним запросом из ``queryset``.
+    """
+
+    def __init__(self, expression, queryset):
+        self.expression = expression
+        self.queryset = queryset
+
+    def count(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {TABLE} '
+                           f'WHERE {TABLE} MATCH %s', [self.expression])
+            return cursor.fetchone()[0]
+
+    def __getitem__(self, page):
+        limit = page.stop - page.start
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'{MATCHING_IDS} ORDER BY rank, rowid DESC LIMIT %s OFFSET %s',
+                [self.expression, limit, page.start],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        posts = self.queryset.in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+def _contains_stems(queryset, query):
+    terms = dict.fromkeys(stems(query))
+    return queryset.filter(
+        reduce(and_, (Q(text__icontains=term) for term in terms))
+    ).order_by('-pub_date', '-pk')
+
+
+def search(query, queryset):
+    """Посты из ``queryset``, подходящие под запрос, или None для пустого."""
+    expression = match_expression(query)
+    if not expression:
+        return None
+    if not available():
+        return _contains_stems(queryset, query)
+    return SearchResults(expression, queryset)
+
+
+def filter_queryset(queryset, query):
+    """Ограничивает ``queryset`` постами, подходящими под запрос."""
+    expression = match_expression(query)
+    if not expression:
+        return queryset
+    if not available():
+        return _contains_stems(queryset, query)
+    # pk__in=RawSQL(...) в SQLite превращается в IN ((SELECT …)) и
+    # сравнивает только с первой строкой подзапроса.
+    opts = queryset.model._meta
+    column = f'{opts.db_table}.{opts.pk.column}'
+    return queryset.extra(where=[f'{column} IN ({MATCHING_IDS})'],
+                          params=[expression])
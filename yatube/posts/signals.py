@@ -0,0 +1,92 @@
+from django.db.models.signals import (post_delete,
+                                      post_save,
+                                      pre_save,
+                                      )
+from django.dispatch import receiver
+
+from . import (counters,
+               feed_cache,
+               follow_graph,
+               search,
+               thumbnails,
+               timeline,
+               )
+from .models import (Comment,
+                     Follow,
+                     Group,
+                     Post,
+                     )
+
+
+@receiver(pre_save, sender=Post)
+def remember_group(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._saved_group_id = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    saved_group_id = getattr(instance, '_saved_group_id', None)
+    feed_cache.bump(*feed_cache.post_scopes(instance, instance.group_id,
+                                            saved_group_id))
+    thumbnails.schedule(instance)
+    search.update(instance)
+    if created:
+        counters.bump_user(instance.author_id, posts_count=1)
+        counters.bump_group(instance.group_id, 1)
+        timeline.fan_out(instance)
+    elif saved_group_id != instance.group_id:
+        counters.bump_group(saved_group_id, -1)
+        counters.bump_group(instance.group_id, 1)
+        instance._saved_group_id = instance.group_id
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, posts_count=-1)
+    counters.bump_group(instance.group_id, -1)
+    feed_cache.bump(*feed_cache.post_scopes(instance, instance.group_id))
+    search.remove(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_post(instance.post_id, 1)
+    if not raw:
+        feed_cache.bump(f'post:{instance.post_id}')
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_post(instance.post_id, -1)
+    feed_cache.bump(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        feed_cache.bump('groups', f'group:{instance.pk}')
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_user(instance.user_id, following_count=1)
+        counters.bump_user(instance.author_id, followers_count=1)
+        follow_graph.add(instance.user_id, instance.author_id)
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.user_id, following_count=-1)
+    counters.bump_user(instance.author_id, followers_count=-1)
+    follow_graph.remove(instance.user_id, instance.author_id)
+    timeline.drop(instance.user_id, instance.author_id)
+    timeline.refill(instance.author_id)
@@ -0,0 +1,84 @@
+"""Стеммер для русского языка (алгоритм Snowball/Портера).
+
+Поисковый индекс хранит не слова, а их основы, поэтому «прогулка»,
+«прогулки» и «прогулкой» находятся по любой из форм. Слова не на
+кириллице только приводятся к нижнему регистру.
+"""
+import re
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND = re.compile(
+    r'(?:(?<=[ая])(?:вшись|вши|в)|ившись|ывшись|ивши|ывши|ив|ыв)$'
+)
+REFLEXIVE = re.compile(r'(?:ся|сь)$')
+ADJECTIVE = (r'(?:ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему'
+             r'|ому|их|ых|ую|юю|ая|яя|ою|ею)')
+PARTICIPLE = r'(?:(?<=[ая])(?:ем|нн|вш|ющ|щ)|ивш|ывш|ующ)'
+ADJECTIVAL = re.compile(f'{PARTICIPLE}?{ADJECTIVE}$')
+VERB = re.compile(
+    r'(?:(?<=[ая])(?:ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)'
+    r'|ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено'
+    r'|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)$'
+)
+NOUN = re.compile(
+    r'(?:а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием'
+    r'|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+DERIVATIONAL = re.compile(r'ость?$')
+SUPERLATIVE = re.compile(r'ейше?$')
+
+WORD = re.compile(r'\w+')
+CYRILLIC = re.compile(r'[а-я]')
+REGION = re.compile(f'[{VOWELS}][^{VOWELS}]')
+
+
+def _region(word, start=0):
+    """Начало области после первого сочетания «гласная + согласная»."""
+    match = REGION.search(word, start)
+    return match.end() if match else len(word)
+
+
+def _strip(pattern, word, start):
+    """Удаляет окончание, если оно целиком лежит в word[start:]."""
+    match = pattern.search(word[start:])
+    if match is None:
+        return word, False
+    return word[:start + match.start()], True
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    if not CYRILLIC.search(word):
+        return word
+    rv = next((i + 1 for i, letter in enumerate(word) if letter in VOWELS),
+              len(word))
+    r2 = _region(word, _region(word))
+
+    word, found = _strip(PERFECTIVE_GERUND, word, rv)
+    if not found:
+        word, _ = _strip(REFLEXIVE, word, rv)
+        for pattern in (ADJECTIVAL, VERB, NOUN):
+            word, found = _strip(pattern, word, rv)
+            if found:
+                break
+
+    if word.endswith('и') and len(word) > rv:
+        word = word[:-1]
+
+    word, _ = _strip(DERIVATIONAL, word, max(r2, rv))
+
+    if word.endswith('нн') and len(word) - 1 > rv:
+        word = word[:-1]
+    else:
+        word, found = _strip(SUPERLATIVE, word, rv)
+        if found and word.endswith('нн'):
+            word = word[:-1]
+        elif not found and word.endswith('ь') and len(word) > rv:
+            word = word[:-1]
+    return word
+
+
+def stems(text):
+    """Основы всех слов текста в порядке появления."""
+    return [stem(word) for word in WORD.findall(text)]
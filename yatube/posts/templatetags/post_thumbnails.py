@@ -0,0 +1,10 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/includes/thumbnail.html')
+def post_thumbnail(post):
+    return {'post': post, 'thumbnail': thumbnails.for_post(post)}
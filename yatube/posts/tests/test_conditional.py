@@ -0,0 +1,104 @@
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import (Client,
+                         TestCase,
+                         )
+from .utils import run_on_commit
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import (Comment,
+                      Follow,
+                      Group,
+                      Post,
+                      )
+
+User = get_user_model()
+
+
+class ConditionalResponseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='Author')
+        self.reader = User.objects.create_user(username='Reader')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.post = Post.objects.create(author=self.author, text='Пост',
+                                        group=self.group)
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.urls = {
+            'index': reverse('posts:index'),
+            'group': reverse('posts:group_list', args=[self.group.slug]),
+            'profile': reverse('posts:profile', args=[self.author.username]),
+            'post': reverse('posts:post_detail', args=[self.post.pk]),
+        }
+
+    def revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_page_is_not_rendered(self):
+        """Повторный запрос без изменений получает 304 без выборки
+        постов и комментариев."""
+        for name, url in self.urls.items():
+            with self.subTest(name=name):
+                etag = self.client.get(url)['ETag']
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url,
+                                               HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+                self.assertEqual(response['ETag'], etag)
+                self.assertFalse(response.templates)
+                self.assertFalse(any('ORDER BY' in query['sql']
+                                     for query in queries))
+
+    def test_new_post_changes_pages(self):
+        etags = {name: self.client.get(url)['ETag']
+                 for name, url in self.urls.items()}
+        Post.objects.create(author=self.author, text='Новый',
+                            group=self.group)
+        for name, url in self.urls.items():
+            with self.subTest(name=name):
+                response = self.client.get(url,
+                                           HTTP_IF_NONE_MATCH=etags[name])
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_comment_changes_post_page(self):
+        url = self.urls['post']
+        etag = self.client.get(url)['ETag']
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Комментарий')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Комментарий')
+
+    def test_follow_changes_profile(self):
+        url = self.urls['profile']
+        etag = self.client.get(url)['ETag']
+        Follow.objects.create(user=self.reader, author=self.author)
+        run_on_commit()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_page_depends_on_user(self):
+        """Страница другого пользователя или гостя не считается той же."""
+        other = Client()
+        other.force_login(self.author)
+        for name, url in self.urls.items():
+            with self.subTest(name=name):
+                etag = self.client.get(url)['ETag']
+                for client in (other, Client()):
+                    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_new_csrf_secret_changes_post_page(self):
+        url = self.urls['post']
+        etag = self.client.get(url)['ETag']
+        self.client.cookies.pop('csrftoken')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(self.revalidate(url).status_code,
+                         HTTPStatus.NOT_MODIFIED)
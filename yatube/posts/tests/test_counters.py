@@ -0,0 +1,122 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import (Client,
+                         TestCase,
+                         )
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from unittest import mock
+
+from ..models import (Comment,
+                      Follow,
+                      Group,
+                      Post,
+                      UserCounter,
+                      )
+
+User = get_user_model()
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='Author')
+        self.reader = User.objects.create_user(username='Reader')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.other_group = Group.objects.create(title='Другая',
+                                                slug='other')
+        self.post = Post.objects.create(author=self.author, text='Пост',
+                                        group=self.group)
+        self.client = Client()
+
+    def counters(self, user):
+        return UserCounter.objects.get(user=user)
+
+    def test_post_counters(self):
+        """Создание, перенос и удаление поста меняют счётчики."""
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.counters(self.author).posts_count, 1)
+        self.post.group = self.other_group
+        self.post.save()
+        self.group.refresh_from_db()
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(self.other_group.posts_count, 1)
+        self.post.delete()
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.other_group.posts_count, 0)
+        self.assertEqual(self.counters(self.author).posts_count, 0)
+
+    def test_comment_counter(self):
+        """Комментарии меняют счётчик поста."""
+        comment = Comment.objects.create(post=self.post, author=self.reader,
+                                         text='Комментарий')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        comment.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_post_edit_keeps_comment_counter(self):
+        """Редактирование не затирает счётчик комментариев, которые
+        добавили, пока пост был открыт в форме."""
+        stale_post = Post.objects.get(pk=self.post.pk)
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Комментарий')
+        self.client.force_login(self.author)
+        with mock.patch('posts.views.get_object_or_404',
+                        return_value=stale_post):
+            self.client.post(
+                reverse('posts:post_edit', args=[self.post.pk]),
+                {'text': 'Новый текст', 'group': self.group.pk},
+            )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, 'Новый текст')
+        self.assertEqual(self.post.comments_count, 1)
+
+    def test_follow_counters(self):
+        """Подписка и отписка меняют счётчики обоих пользователей."""
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.counters(self.author).followers_count, 1)
+        self.assertEqual(self.counters(self.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.counters(self.author).followers_count, 0)
+        self.assertEqual(self.counters(self.reader).following_count, 0)
+
+    def test_delete_user_with_content(self):
+        """Удаление пользователя с постами не ломает счётчики."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.author.delete()
+        self.assertFalse(UserCounter.objects.filter(
+            user_id=self.author.pk
+        ).exists())
+        self.assertEqual(self.counters(self.reader).following_count, 0)
+
+    def test_rebuild_counters(self):
+        """Команда rebuild_counters восстанавливает счётчики."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserCounter.objects.all().delete()
+        Group.objects.update(posts_count=0)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.counters(self.author).posts_count, 1)
+        self.assertEqual(self.counters(self.author).followers_count, 1)
+        self.assertEqual(self.counters(self.reader).following_count, 1)
+
+    def test_pages_do_not_count(self):
+        """Профиль, группа и пост не выполняют COUNT(*)."""
+        pages = (
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+        )
+        for url in pages:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(url)
+                self.assertFalse(any('COUNT(' in query['sql']
+                                     for query in queries.captured_queries))
@@ -0,0 +1,155 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import (connection,
+                       transaction,
+                       )
+from django.test import (Client,
+                         TestCase,
+                         override_settings,
+                         )
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from unittest import mock
+
+from .. import (follow_graph,
+                write_behind,
+                )
+from ..models import Follow
+from .utils import run_on_commit
+
+User = get_user_model()
+
+
+class FollowGraphTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='Reader')
+        self.author = User.objects.create_user(username='Author')
+        self.other = User.objects.create_user(username='Other')
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_follow_and_unfollow_update_cached_sets(self):
+        """Подписка и отписка меняют загруженные массивы без запросов."""
+        follow_graph.following(self.reader.pk)
+        follow_graph.followers(self.author.pk)
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        run_on_commit()
+        with self.assertNumQueries(0):
+            self.assertTrue(follow_graph.follows(self.reader, self.author.pk))
+            self.assertEqual(list(follow_graph.followers(self.author.pk)),
+                             [self.reader.pk])
+        follow.delete()
+        run_on_commit()
+        with self.assertNumQueries(0):
+            self.assertFalse(follow_graph.follows(self.reader,
+                                                  self.author.pk))
+            self.assertEqual(len(follow_graph.followers(self.author.pk)), 0)
+
+    def test_follow_during_load_is_not_lost(self):
+        """Подписка, сделанная, пока массив читался из базы, не теряется
+        из-за сохранения прочитанного до неё массива."""
+        init = follow_graph.Adjacency.__init__
+
+        def load_then_follow(adjacency, ids=()):
+            init(adjacency, ids)
+            if not Follow.objects.exists():
+                Follow.objects.create(user=self.reader, author=self.author)
+
+        with mock.patch.object(follow_graph.Adjacency, '__init__',
+                               load_then_follow):
+            self.assertFalse(follow_graph.follows(self.reader,
+                                                  self.author.pk))
+        run_on_commit()
+        self.assertTrue(follow_graph.follows(self.reader, self.author.pk))
+        self.assertEqual(list(follow_graph.followers(self.author.pk)),
+                         [self.reader.pk])
+
+    def test_rolled_back_follow_is_not_applied(self):
+        follow_graph.following(self.reader.pk)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Follow.objects.create(user=self.reader, author=self.author)
+            raise RuntimeError
+        run_on_commit()
+        self.assertFalse(follow_graph.follows(self.reader, self.author.pk))
+
+    @override_settings(FOLLOW_GRAPH_DELTA_LIMIT=2)
+    def test_changes_go_to_delta_until_compacted(self):
+        """Подписка дописывается в журнал, а не переписывает массив;
+        полный журнал переносится в массив."""
+        key = follow_graph._key(follow_graph.FOLLOWING, self.reader.pk)
+        delta_key = follow_graph._delta_key(follow_graph.FOLLOWING,
+                                            self.reader.pk)
+        follow_graph.following(self.reader.pk)
+        Follow.objects.create(user=self.reader, author=self.author)
+        run_on_commit()
+        self.assertEqual(list(cache.get(key).ids), [])
+        self.assertEqual(cache.get(delta_key), {self.author.pk: True})
+        self.assertEqual(list(follow_graph.following(self.reader.pk)),
+                         [self.author.pk])
+
+        Follow.objects.create(user=self.reader, author=self.other)
+        run_on_commit()
+        self.assertEqual(list(cache.get(key).ids),
+                         [self.author.pk, self.other.pk])
+        self.assertIsNone(cache.get(delta_key))
+        Follow.objects.filter(author=self.author).delete()
+        run_on_commit()
+        self.assertEqual(list(follow_graph.following(self.reader.pk)),
+                         [self.other.pk])
+        self.assertEqual(len(follow_graph.following(self.reader.pk)), 1)
+
+    def test_guest_follows_nobody(self):
+        with self.assertNumQueries(0):
+            self.assertFalse(follow_graph.follows(AnonymousUser(),
+                                                  self.author.pk))
+
+    def test_mutual(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.author, author=self.reader)
+        Follow.objects.create(user=self.reader, author=self.other)
+        self.assertTrue(follow_graph.is_mutual(self.reader.pk,
+                                               self.author.pk))
+        self.assertFalse(follow_graph.is_mutual(self.reader.pk,
+                                                self.other.pk))
+        self.assertEqual(follow_graph.mutual(self.reader.pk),
+                         [self.author.pk])
+
+    def test_write_behind_follows_update_graph(self):
+        follow_graph.following(self.reader.pk)
+        write_behind.write([{'kind': write_behind.FOLLOW,
+                             'user_id': self.reader.pk,
+                             'author_id': self.author.pk}])
+        run_on_commit()
+        with self.assertNumQueries(0):
+            self.assertTrue(follow_graph.follows(self.reader, self.author.pk))
+
+    def test_profile_does_not_query_follows(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        url = reverse('posts:profile', args=[self.author.username])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, 'Отписаться')
+        self.assertFalse(any(Follow._meta.db_table in query['sql']
+                             for query in queries))
+
+    def test_profile_checks_follow_once(self):
+        """Кнопка подписки получает значение, посчитанное для ETag."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        url = reverse('posts:profile', args=[self.author.username])
+        self.client.get(url)
+        with mock.patch.object(follow_graph, 'follows',
+                               wraps=follow_graph.follows) as follows:
+            response = self.client.get(url)
+        self.assertContains(response, 'Отписаться')
+        follows.assert_called_once()
+
+    def test_empty_follow_feed_reads_no_posts(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 0)
+        self.assertFalse(any('posts_post' in query['sql']
+                             or 'posts_timeline' in query['sql']
+                             for query in queries))
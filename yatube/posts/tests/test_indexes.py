@@ -0,0 +1,78 @@
+from django.contrib.auth import get_user_model
+from django.db import (connection,
+                       IntegrityError,
+                       transaction,
+                       )
+from django.test import TestCase
+from django.utils import timezone
+
+from ..models import (Comment,
+                      Follow,
+                      Group,
+                      Post,
+                      Timeline,
+                      )
+from ..paginator import keyset_queryset
+
+User = get_user_model()
+
+
+class FeedIndexTests(TestCase):
+    """Ленты читаются по индексу в нужном порядке, без сортировки."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='Reader')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.cursor = (timezone.now(), 1)
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return ' | '.join(row[-1] for row in cursor.fetchall())
+
+    def assert_index_ordered(self, queryset, index):
+        for cursor in (None, self.cursor):
+            with self.subTest(index=index, cursor=cursor):
+                plan = self.plan(keyset_queryset(queryset, cursor,
+                                                 False)[:11])
+                self.assertIn(index, plan)
+                self.assertNotIn('USE TEMP B-TREE', plan)
+
+    def test_group_feed(self):
+        self.assert_index_ordered(
+            Post.objects.for_feed().filter(group=self.group),
+            'post_group_feed_idx',
+        )
+
+    def test_profile_feed(self):
+        self.assert_index_ordered(
+            Post.objects.for_feed().filter(author=self.user),
+            'post_author_feed_idx',
+        )
+
+    def test_timeline(self):
+        queryset = Timeline.objects.filter(user=self.user).select_related(
+            'post__author', 'post__group'
+        )
+        plan = self.plan(keyset_queryset(queryset, self.cursor, False,
+                                         ('pub_date', 'post_id'))[:11])
+        self.assertIn('timeline_user_feed_idx', plan)
+        self.assertNotIn('USE TEMP B-TREE', plan)
+
+    def test_comments(self):
+        post = Post.objects.create(author=self.user, text='Пост')
+        plan = self.plan(Comment.objects.for_post(post))
+        self.assertIn('comment_post_created_idx', plan)
+        self.assertNotIn('USE TEMP B-TREE', plan)
+
+
+class FollowConstraintTests(TestCase):
+    def test_follow_is_unique(self):
+        """Подписаться на автора дважды нельзя."""
+        user = User.objects.create_user(username='Reader')
+        author = User.objects.create_user(username='Author')
+        Follow.objects.create(user=user, author=author)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=user, author=author)
+        self.assertEqual(Follow.objects.count(), 1)
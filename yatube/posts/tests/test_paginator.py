@@ -0,0 +1,184 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.paginator import EmptyPage
+from django.db import connection
+from django.test import (Client,
+                         SimpleTestCase,
+                         TestCase,
+                         override_settings,
+                         )
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import Post
+from ..paginator import (CursorPaginator,
+                         WindowedPaginator,
+                         decode_cursor,
+                         encode_cursor,
+                         )
+
+POSTS_COUNT: int = 25
+POSTS_ON_PAGE: int = 10
+
+User = get_user_model()
+
+
+class CursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='CursorUser')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=cls.user)
+            for i in range(POSTS_COUNT)
+        )
+        now = timezone.now()
+        # Половина постов с одинаковой датой: порядок решает id.
+        for i, post in enumerate(Post.objects.order_by('pk')):
+            post.pub_date = now - timedelta(minutes=i // 2)
+            post.save(update_fields=['pub_date'])
+        cls.expected = list(Post.objects.order_by('-pub_date', '-pk'))
+
+    def setUp(self):
+        self.client = Client()
+        cache.clear()
+
+    def get_page(self, after=None, before=None):
+        paginator = CursorPaginator(Post.objects.all(), POSTS_ON_PAGE,
+                                    after=after, before=before)
+        return paginator.get_cursor_page()
+
+    def walk_forward(self):
+        page = self.get_page()
+        pages = [page]
+        while page.has_next():
+            page = self.get_page(after=page.paginator.next_cursor)
+            pages.append(page)
+        return pages
+
+    def test_cursor_roundtrip(self):
+        """Токен курсора разбирается обратно в (pub_date, id)."""
+        post = self.expected[0]
+        self.assertEqual(decode_cursor(encode_cursor(post)),
+                         (post.pub_date, post.pk))
+
+    def test_broken_cursor_gives_first_page(self):
+        """Испорченный токен открывает первую страницу."""
+        page = self.get_page(after='not-a-cursor')
+        self.assertEqual(list(page), self.expected[:POSTS_ON_PAGE])
+        self.assertFalse(page.has_previous())
+
+    def test_forward_walk_covers_feed(self):
+        """Проход по курсорам вперёд выдаёт всю ленту без повторов."""
+        pages = self.walk_forward()
+        posts = [post for page in pages for post in page]
+        self.assertEqual(posts, self.expected)
+        self.assertEqual(len(pages[-1]), POSTS_COUNT % POSTS_ON_PAGE)
+
+    def test_backward_walk(self):
+        """Курсор before возвращает предыдущую страницу."""
+        last = self.walk_forward()[-1]
+        page = self.get_page(before=last.paginator.previous_cursor)
+        self.assertEqual(
+            list(page), self.expected[POSTS_ON_PAGE:2 * POSTS_ON_PAGE]
+        )
+        self.assertTrue(page.has_next())
+        self.assertTrue(page.has_previous())
+
+    def test_backward_walk_to_start(self):
+        """С курсором before можно вернуться в начало ленты."""
+        second = self.get_page(after=encode_cursor(
+            self.expected[POSTS_ON_PAGE - 1]
+        ))
+        page = self.get_page(before=second.paginator.previous_cursor)
+        self.assertEqual(list(page), self.expected[:POSTS_ON_PAGE])
+        self.assertFalse(page.has_previous())
+
+    def test_cursor_page_does_not_count(self):
+        """Страница по курсору не выполняет COUNT(*)."""
+        token = encode_cursor(self.expected[POSTS_ON_PAGE])
+        with self.assertNumQueries(1):
+            page = self.get_page(after=token)
+            list(page)
+            page.has_next()
+            page.has_previous()
+            page.has_other_pages()
+
+    def test_index_follows_cursor(self):
+        """Главная страница принимает ?after= из ссылки пагинатора."""
+        response = self.client.get(reverse('posts:index'))
+        token = response.context['page_obj'].paginator.next_cursor
+        self.assertContains(response, f'?after={token}')
+        response = self.client.get(reverse('posts:index'), {'after': token})
+        self.assertEqual(list(response.context['page_obj']),
+                         self.expected[POSTS_ON_PAGE:2 * POSTS_ON_PAGE])
+
+
+class WindowedPaginatorTests(SimpleTestCase):
+    def window(self, paginator, number):
+        return list(paginator.page(number).page_window())
+
+    def test_window_is_bounded(self):
+        """Окно показывает края и соседей текущей страницы."""
+        paginator = WindowedPaginator(range(1000), POSTS_ON_PAGE)
+        self.assertEqual(self.window(paginator, 1), [1, 2, 3, '…', 100])
+        self.assertEqual(self.window(paginator, 50),
+                         [1, '…', 48, 49, 50, 51, 52, '…', 100])
+        self.assertEqual(self.window(paginator, 99),
+                         [1, '…', 97, 98, 99, 100])
+
+    def test_few_pages_are_listed(self):
+        paginator = WindowedPaginator(range(60), POSTS_ON_PAGE)
+        self.assertEqual(self.window(paginator, 4), [1, 2, 3, 4, 5, 6])
+
+    def test_count_stops_at_limit(self):
+        """Сверх count_limit страницы открываются, пока есть записи."""
+        paginator = WindowedPaginator(list(range(105)), POSTS_ON_PAGE,
+                                      count_limit=50)
+        self.assertEqual(paginator.count, 51)
+        self.assertTrue(paginator.count_is_approximate)
+        page = paginator.page(8)
+        self.assertEqual(list(page), list(range(70, 80)))
+        self.assertTrue(page.has_next())
+        self.assertEqual(list(page.page_window()),
+                         [1, '…', 6, 7, 8, '…'])
+        self.assertFalse(paginator.page(11).has_next())
+        with self.assertRaises(EmptyPage):
+            paginator.page(12)
+        self.assertEqual(paginator.get_page(12).number, 1)
+
+    def test_exact_count_under_limit(self):
+        paginator = WindowedPaginator(list(range(50)), POSTS_ON_PAGE,
+                                      count_limit=50)
+        self.assertEqual(paginator.count, 50)
+        self.assertFalse(paginator.count_is_approximate)
+
+
+class WindowedPaginationViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='PageUser')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=cls.user) for i in range(150)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_page_links_are_windowed(self):
+        response = self.client.get(reverse('posts:index'), {'page': 1})
+        self.assertContains(response, '?page=3"')
+        self.assertContains(response, '?page=15"')
+        self.assertNotContains(response, '?page=8"')
+
+    @override_settings(PAGINATOR_COUNT_LIMIT=40)
+    def test_feed_count_is_estimated_from_statistics(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        response = self.client.get(reverse('posts:index'), {'page': 2})
+        paginator = response.context['page_obj'].paginator
+        self.assertTrue(paginator.count_is_approximate)
+        self.assertEqual(paginator.count, 150)
+        self.assertNotContains(response, 'Последняя')
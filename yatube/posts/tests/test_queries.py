@@ -0,0 +1,131 @@
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import (Client,
+                         TestCase,
+                         )
+from django.test.utils import CaptureQueriesContext
+from django.urls import (resolve,
+                         reverse,
+                         )
+
+from core.instrumentation import query_budget
+
+from ..models import (Comment,
+                      Follow,
+                      Group,
+                      Post,
+                      )
+
+User = get_user_model()
+
+
+class QueryCountTests(TestCase):
+    """Число запросов страницы не зависит от числа постов на ней."""
+
+    def setUp(self):
+        self.reader = User.objects.create_user(username='Reader')
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.post = None
+
+    def add_posts(self, count):
+        """Добавляет посты разных авторов с группой и комментариями."""
+        for i in range(count):
+            author = User.objects.create_user(
+                username=f'Author{Post.objects.count()}'
+            )
+            Follow.objects.create(user=self.reader, author=author)
+            self.post = Post.objects.create(author=author, text=f'Пост {i}',
+                                            group=self.group)
+            Comment.objects.create(post=self.post, author=author,
+                                   text='Комментарий')
+
+    def count_queries(self, url, status=200, data=None):
+        """Число запросов страницы с холодным кешем; оно должно
+        укладываться в бюджет представления (QUERY_BUDGETS). С ``data``
+        страница отправляется POST-запросом."""
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            if data is None:
+                response = self.client.get(url)
+            else:
+                response = self.client.post(url, data)
+        self.assertEqual(response.status_code, status)
+        view_name = resolve(urlsplit(url).path).view_name
+        self.assertLessEqual(len(queries), query_budget(view_name),
+                             view_name)
+        return len(queries)
+
+    def assert_constant(self, get_url):
+        self.add_posts(2)
+        small = self.count_queries(get_url())
+        self.add_posts(8)
+        large = self.count_queries(get_url())
+        self.assertEqual(small, large)
+
+    def test_index(self):
+        self.assert_constant(lambda: reverse('posts:index'))
+
+    def test_group_list(self):
+        self.assert_constant(
+            lambda: reverse('posts:group_list', kwargs={'slug': 'group'})
+        )
+
+    def test_follow_index(self):
+        self.assert_constant(lambda: reverse('posts:follow_index'))
+
+    def test_profile(self):
+        author = User.objects.create_user(username='Prolific')
+
+        def add_posts(count):
+            for i in range(count):
+                Post.objects.create(author=author, text=f'Пост {i}',
+                                    group=self.group)
+
+        url = reverse('posts:profile', kwargs={'username': author})
+        add_posts(2)
+        small = self.count_queries(url)
+        add_posts(8)
+        self.assertEqual(small, self.count_queries(url))
+
+    def test_views_within_budget(self):
+        """Остальные страницы тоже укладываются в свои бюджеты."""
+        self.add_posts(3)
+        author = self.post.author
+        own = Post.objects.create(author=self.reader, text='Свой пост')
+        urls = {
+            f'{reverse("posts:index")}?page=2': 200,
+            f'{reverse("posts:follow_index")}?page=1': 200,
+            f'{reverse("posts:search")}?q=Пост': 200,
+            reverse('posts:post_create'): 200,
+            reverse('posts:post_edit', args=[own.pk]): 200,
+            reverse('posts:profile_unfollow', args=[author]): 302,
+            reverse('posts:profile_follow', args=[author]): 302,
+        }
+        for url, status in urls.items():
+            with self.subTest(url=url):
+                self.count_queries(url, status)
+
+    def test_writes_within_budget(self):
+        """Сохранение поста укладывается в бюджет формы."""
+        self.add_posts(1)
+        Follow.objects.create(user=self.post.author, author=self.reader)
+        data = {'text': 'Новый пост', 'group': self.group.pk}
+        self.count_queries(reverse('posts:post_create'), 302, data)
+        post = Post.objects.get(text='Новый пост')
+        self.count_queries(reverse('posts:post_edit', args=[post.pk]), 302,
+                           {'text': 'Исправленный пост'})
+
+    def test_post_detail(self):
+        self.add_posts(1)
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        small = self.count_queries(url)
+        for i in range(10):
+            commenter = User.objects.create_user(username=f'Commenter{i}')
+            Comment.objects.create(post=self.post, author=commenter,
+                                   text=f'Комментарий {i}')
+        self.assertEqual(small, self.count_queries(url))
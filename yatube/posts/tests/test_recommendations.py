@@ -0,0 +1,146 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import (Client,
+                         TestCase,
+                         TransactionTestCase,
+                         override_settings,
+                         )
+from django.urls import reverse
+
+from .. import recommendations
+from ..models import (Follow,
+                      Suggestion,
+                      )
+from .utils import run_on_commit
+
+User = get_user_model()
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = {name: User.objects.create_user(username=name)
+                      for name in ('Reader', 'Author', 'Star', 'Fan',
+                                   'Similar')}
+        self.reader = self.users['Reader']
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def follow(self, user, author):
+        Follow.objects.create(user=self.users[user],
+                              author=self.users[author])
+        run_on_commit()
+
+    def suggested(self):
+        return [author.username
+                for author in recommendations.for_user(self.reader)]
+
+    def test_friends_of_friends(self):
+        """Предлагаются авторы, на которых подписаны авторы читателя."""
+        self.follow('Reader', 'Author')
+        self.follow('Author', 'Star')
+        self.follow('Author', 'Reader')
+        recommendations.rebuild()
+        self.assertEqual(self.suggested(), ['Star'])
+
+    def test_co_follow(self):
+        """Предлагаются авторы с теми же подписчиками, что у авторов
+        читателя."""
+        self.follow('Reader', 'Author')
+        self.follow('Fan', 'Author')
+        self.follow('Fan', 'Similar')
+        recommendations.rebuild()
+        self.assertEqual(self.suggested(), ['Similar'])
+        suggestion = Suggestion.objects.get(user=self.reader)
+        # Общий подписчик один, а всего у пары двое.
+        self.assertAlmostEqual(suggestion.score, 0.5)
+
+    def test_ranking_and_top(self):
+        self.follow('Reader', 'Author')
+        self.follow('Reader', 'Fan')
+        self.follow('Author', 'Star')
+        self.follow('Fan', 'Star')
+        self.follow('Fan', 'Similar')
+        with self.settings(RECOMMENDATIONS_TOP=1):
+            recommendations.rebuild()
+        self.assertEqual(self.suggested(), ['Star'])
+
+    @override_settings(RECOMMENDATIONS_HUB_LIMIT=0)
+    def test_hubs_do_not_connect_users(self):
+        self.follow('Reader', 'Author')
+        self.follow('Author', 'Star')
+        recommendations.rebuild()
+        self.assertEqual(self.suggested(), [])
+
+    def test_followed_authors_are_hidden_without_rebuild(self):
+        self.follow('Reader', 'Author')
+        self.follow('Author', 'Star')
+        recommendations.rebuild()
+        run_on_commit()
+        self.assertEqual(self.suggested(), ['Star'])
+        self.follow('Reader', 'Star')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggested(), [])
+
+    def test_pages_show_suggestions(self):
+        self.follow('Reader', 'Author')
+        self.follow('Author', 'Star')
+        self.follow('Author', 'Similar')
+        recommendations.rebuild()
+        star_url = reverse('posts:profile_follow', args=['Star'])
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Кого почитать')
+        self.assertContains(response, star_url)
+        response = self.client.get(reverse('posts:profile', args=['Star']))
+        self.assertContains(response, 'Кого почитать')
+        # Только кнопка подписки самого профиля.
+        self.assertContains(response, star_url, count=1)
+        self.assertContains(
+            response, reverse('posts:profile_follow', args=['Similar'])
+        )
+
+    def test_rebuild_changes_profile_etag(self):
+        url = reverse('posts:profile', args=['Author'])
+        etag = self.client.get(url)['ETag']
+        self.follow('Reader', 'Fan')
+        self.follow('Fan', 'Star')
+        recommendations.rebuild()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Кого почитать')
+
+    def test_command(self):
+        self.follow('Reader', 'Author')
+        self.follow('Author', 'Star')
+        out = StringIO()
+        call_command('rebuild_suggestions', stdout=out)
+        self.assertIn('Предложений: 1', out.getvalue())
+        self.assertEqual(self.suggested(), ['Star'])
+
+
+class RebuildTransactionTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        reader, author, star = (User.objects.create_user(username=name)
+                                for name in ('Reader', 'Author', 'Star'))
+        Follow.objects.create(user=reader, author=author)
+        Follow.objects.create(user=author, author=star)
+
+    def test_suggestions_are_computed_outside_transaction(self):
+        """Пока считаются предложения, блокировка записи не держится."""
+        in_atomic = []
+        suggestions = recommendations._suggestions
+
+        def record(*args):
+            in_atomic.append(connection.in_atomic_block)
+            yield from suggestions(*args)
+
+        with mock.patch.object(recommendations, '_suggestions', record):
+            self.assertEqual(recommendations.rebuild(), 1)
+        self.assertEqual(in_atomic, [False])
+        self.assertEqual(recommendations.rebuild(), 1)
+        self.assertEqual(Suggestion.objects.count(), 1)
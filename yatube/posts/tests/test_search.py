@@ -0,0 +1,125 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import (Client,
+                         TestCase,
+                         )
+from django.urls import reverse
+
+from .. import search
+from ..models import Post
+from ..stemmer import stem
+
+User = get_user_model()
+
+
+class StemmerTests(TestCase):
+    def test_forms_share_stem(self):
+        """Разные формы слова сводятся к одной основе."""
+        cases = {
+            'прогулк': ('прогулка', 'прогулки', 'прогулкой', 'прогулками'),
+            'красив': ('красивый', 'красивая', 'красивыми'),
+            'гуля': ('гулять', 'гуляли', 'гуляешь'),
+            'елк': ('ёлка', 'Ёлки'),
+            'django': ('Django',),
+        }
+        for expected, words in cases.items():
+            for word in words:
+                with self.subTest(word=word):
+                    self.assertEqual(stem(word), expected)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='Author')
+        self.walk = Post.objects.create(author=self.author,
+                                        text='Вечерняя прогулка по парку')
+        self.walks = Post.objects.create(
+            author=self.author,
+            text='Прогулки, прогулки и ещё раз прогулки с собакой',
+        )
+        self.other = Post.objects.create(author=self.author,
+                                         text='Рецепт пирога с вишней')
+        self.client = Client()
+
+    def found(self, query):
+        response = self.client.get(reverse('posts:search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['page_obj'])
+
+    def test_empty_query(self):
+        response = self.client.get(reverse('posts:search'))
+        self.assertTemplateUsed(response, 'posts/search.html')
+        self.assertIsNone(response.context['page_obj'])
+
+    def test_finds_word_forms_ranked(self):
+        """Поиск находит другие формы слова, частые совпадения выше."""
+        self.assertEqual(self.found('прогулками'), [self.walks, self.walk])
+        self.assertEqual(self.found('прогулки собака'), [self.walks])
+        self.assertEqual(self.found('самолёт'), [])
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при правке и удалении поста."""
+        self.other.text = 'Пирог для прогулки'
+        self.other.save()
+        self.assertIn(self.other, self.found('прогулка'))
+        self.assertEqual(self.found('вишня'), [])
+        self.walks.delete()
+        self.assertNotIn(self.walks.pk,
+                         [post.pk for post in self.found('прогулка')])
+
+    def test_pagination_keeps_query(self):
+        """Ссылки на страницы результатов сохраняют запрос."""
+        for i in range(12):
+            Post.objects.create(author=self.author, text=f'Прогулка {i}')
+        response = self.client.get(reverse('posts:search'),
+                                   {'q': 'прогулка'})
+        self.assertEqual(response.context['page_obj'].paginator.count, 14)
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self.assertContains(response, '?q=%D0%BF%D1%80%D0%BE%D0%B3%D1%83'
+                                      '%D0%BB%D0%BA%D0%B0&amp;page=2')
+        response = self.client.get(reverse('posts:search'),
+                                   {'q': 'прогулка', 'page': 2})
+        self.assertEqual(len(response.context['page_obj']), 4)
+
+    def test_admin_search(self):
+        """Поиск в админке идёт по индексу."""
+        admin = User.objects.create_superuser('admin', 'admin@example.com',
+                                              'password')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:posts_post_changelist'),
+                                   {'q': 'прогулкой'})
+        self.assertEqual(
+            {post.pk for post in response.context['cl'].result_list},
+            {self.walk.pk, self.walks.pk},
+        )
+
+    def test_rebuild_search_index(self):
+        """Команда rebuild_search_index восстанавливает индекс."""
+        Post.objects.bulk_create([Post(author=self.author,
+                                       text='Прогулка без сигналов')])
+        self.assertEqual(len(self.found('сигнал')), 0)
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.found('сигнал')), 1)
+        self.assertEqual(len(self.found('прогулка')), 3)
+
+    def test_filter_queryset(self):
+        self.assertEqual(
+            list(search.filter_queryset(Post.objects.order_by('pk'),
+                                        'вишни')),
+            [self.other],
+        )
+
+    def test_without_fts5_search_uses_icontains(self):
+        """Без FTS5 в сборке SQLite поиск идёт по основам через
+        icontains."""
+        no_fts5 = 'CREATE VIRTUAL TABLE temp.probe USING no_such_module(a)'
+        with mock.patch.object(search, 'PROBE', no_fts5), \
+                mock.patch.dict(search._state, clear=True):
+            self.assertFalse(search.available())
+            self.assertEqual(self.found('прогулками'),
+                             [self.walks, self.walk])
+            Post.objects.create(author=self.author, text='Прогулка')
+        self.assertTrue(search.available())
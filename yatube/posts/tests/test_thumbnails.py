@@ -0,0 +1,185 @@
+import shutil
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import (Client,
+                         override_settings,
+                         TestCase,
+                         TransactionTestCase,
+                         )
+from django.urls import reverse
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .. import (feed_cache,
+                kvstore,
+                thumbnails,
+                )
+from ..models import Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+User = get_user_model()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_ASYNC=True)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='Author')
+        self.post = Post.objects.create(
+            author=self.author,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('small.gif', SMALL_GIF,
+                                     content_type='image/gif'),
+        )
+        self.client = Client()
+
+    def test_placeholder_until_ready(self):
+        """Пока миниатюры нет, страница показывает заглушку."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'bg-light')
+        self.assertNotContains(response, '<img class="card-img')
+        self.assertIsNone(thumbnails.ready(self.post.image.name))
+
+    def test_generate_stores_variants_and_bumps_feeds(self):
+        """Готовые миниатюры попадают в кеш и сбрасывают фрагменты лент."""
+        scopes = feed_cache.post_scopes(self.post)
+        before = feed_cache.versions(*scopes)
+        thumbnail = thumbnails.generate(self.post.image.name, scopes)
+        self.assertTrue(thumbnail['src'].startswith(settings.MEDIA_URL))
+        self.assertEqual(thumbnails.ready(self.post.image.name), thumbnail)
+        self.assertNotEqual(feed_cache.versions(*scopes), before)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, f'src="{thumbnail["src"]}"')
+        self.assertContains(response, f'srcset="{thumbnail["srcset"]}"')
+
+    def test_variants_are_stored_on_post(self):
+        """Набор миниатюр хранится в посте и без кеша."""
+        thumbnail = thumbnails.generate(self.post.image.name)
+        cache.clear()
+        post = Post.objects.for_feed().get(pk=self.post.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(thumbnails.for_post(post), thumbnail)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, f'src="{thumbnail["src"]}"')
+
+    def test_stored_variants_of_old_image_are_ignored(self):
+        """После смены картинки набор старой картинки не показывается."""
+        thumbnails.generate(self.post.image.name)
+        self.post.refresh_from_db()
+        self.post.image = SimpleUploadedFile('other.gif', SMALL_GIF,
+                                             content_type='image/gif')
+        self.post.save()
+        self.assertIsNone(thumbnails.stored(self.post))
+
+    def test_variants(self):
+        """Варианты есть для каждой ширины и каждого доступного формата."""
+        thumbnail = thumbnails.build(self.post.image.name)
+        widths = [f'{width}w' for width in settings.THUMBNAIL_WIDTHS]
+        for srcset in [thumbnail['srcset'],
+                       *(source['srcset'] for source in thumbnail['sources'])]:
+            with self.subTest(srcset=srcset):
+                self.assertEqual(
+                    [candidate.split()[1] for candidate in srcset.split(', ')],
+                    widths,
+                )
+        self.assertTrue(thumbnail['srcset'].split()[0].endswith('.jpg'))
+        self.assertEqual(len(thumbnail['sources']),
+                         len(thumbnails.formats()) - 1)
+        if 'WEBP' in thumbnails.formats():
+            self.assertIn('image/webp', [source['type']
+                                         for source in thumbnail['sources']])
+
+    def test_generate_failure_is_logged(self):
+        """Ошибка построения не ломает страницу и запоминается."""
+        with mock.patch.object(thumbnails, 'get_thumbnail',
+                               side_effect=OSError('broken')):
+            with self.assertLogs('posts.thumbnails', 'ERROR'):
+                self.assertEqual(
+                    thumbnails.generate(self.post.image.name),
+                    thumbnails.FAILED,
+                )
+        self.assertEqual(thumbnails.ready(self.post.image.name),
+                         thumbnails.FAILED)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'bg-light')
+
+    @override_settings(THUMBNAIL_ASYNC=False)
+    def test_sync_mode(self):
+        """Без фонового режима миниатюра строится при отрисовке."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<img class="card-img')
+        self.assertTrue(thumbnails.ready(self.post.image.name))
+
+    def test_kvstore_updates_existing_key(self):
+        """Ключ sorl-thumbnail перезаписывается без второй строки."""
+        store = kvstore.KVStore()
+        store._set_raw('test||key', '1')
+        store._set_raw('test||key', '2')
+        self.assertEqual(
+            list(KVStoreModel.objects.filter(key='test||key')
+                 .values_list('value', flat=True)),
+            ['2'],
+        )
+        cache.clear()
+        self.assertEqual(store._get_raw('test||key'), '2')
+
+    def test_build_thumbnails_command(self):
+        """Команда build_thumbnails строит миниатюры старых картинок."""
+        out = StringIO()
+        call_command('build_thumbnails', workers=1, stdout=out)
+        self.assertIn('построены: 1', out.getvalue())
+        self.assertTrue(thumbnails.ready(self.post.image.name))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_ASYNC=True,
+                   THUMBNAIL_EXECUTOR='pool')
+class ThumbnailPoolTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_pool_builds_after_commit(self):
+        """После коммита миниатюры строит пул, а не поток запроса."""
+        cache.clear()
+        author = User.objects.create_user(username='Author')
+        threads = []
+        generate = thumbnails.generate
+
+        def record(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return generate(*args, **kwargs)
+
+        with mock.patch.object(thumbnails, 'generate', record):
+            post = Post.objects.create(
+                author=author,
+                text='Пост с картинкой',
+                image=SimpleUploadedFile('pool.gif', SMALL_GIF,
+                                         content_type='image/gif'),
+            )
+            thumbnails.shutdown()
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith('thumbnails'))
+        self.assertTrue(thumbnails.ready(post.image.name))
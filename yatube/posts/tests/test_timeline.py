@@ -0,0 +1,151 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import (Client,
+                         TestCase,
+                         override_settings,
+                         )
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import (Follow,
+                      Post,
+                      Timeline,
+                      )
+from .. import timeline
+
+User = get_user_model()
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user(username='Reader')
+        self.author = User.objects.create_user(username='Author')
+        self.star = User.objects.create_user(username='Star')
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def feed(self, **params):
+        response = self.client.get(reverse('posts:follow_index'), params)
+        return list(response.context['page_obj'])
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост попадает в ленты подписчиков автора."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertTrue(
+            Timeline.objects.filter(user=self.reader, post=post).exists()
+        )
+        self.assertEqual(self.feed(), [post])
+
+    def test_follow_backfills_and_unfollow_drops(self):
+        """Подписка заполняет ленту, отписка её очищает."""
+        posts = [Post.objects.create(author=self.author, text=f'Пост {i}')
+                 for i in range(3)]
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(
+            Timeline.objects.filter(user=self.reader).count(), len(posts)
+        )
+        follow.delete()
+        self.assertFalse(Timeline.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_popular_author_is_fanned_in_on_read(self):
+        """Посты популярного автора подмешиваются при чтении."""
+        fan = User.objects.create_user(username='Fan')
+        Follow.objects.create(user=fan, author=self.star)
+        Follow.objects.create(user=self.reader, author=self.star)
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = []
+        for i in range(12):
+            author = self.star if i % 2 else self.author
+            posts.append(Post.objects.create(author=author, text=f'П{i}'))
+        self.assertFalse(
+            Timeline.objects.filter(author=self.star).exists()
+        )
+        expected = sorted(posts, key=lambda post: (post.pub_date, post.pk),
+                          reverse=True)
+        first = self.feed()
+        self.assertEqual(first, expected[:10])
+        response = self.client.get(reverse('posts:follow_index'))
+        token = response.context['page_obj'].paginator.next_cursor
+        self.assertEqual(self.feed(after=token), expected[10:])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_numbered_pages_read_timeline(self):
+        """``?page=N`` листает ту же ленту, что и курсор."""
+        fan = User.objects.create_user(username='Fan')
+        Follow.objects.create(user=fan, author=self.star)
+        Follow.objects.create(user=self.reader, author=self.star)
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = []
+        for i in range(12):
+            author = self.star if i % 2 else self.author
+            posts.append(Post.objects.create(author=author, text=f'П{i}'))
+        expected = sorted(posts, key=lambda post: (post.pub_date, post.pk),
+                          reverse=True)
+        self.assertEqual(self.feed(page=1), expected[:10])
+        self.assertEqual(self.feed(page=2), expected[10:])
+        response = self.client.get(reverse('posts:follow_index'),
+                                   {'page': 2})
+        self.assertEqual(response.context['page_obj'].paginator.count, 12)
+
+    def test_numbered_page_is_offset_into_timeline(self):
+        """Без популярных авторов страница читается из ``Timeline``
+        по индексу, без сортировки соединения с постами."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(author=self.author, text='Пост')
+        with CaptureQueriesContext(connection) as queries:
+            self.feed(page=1)
+        # Последний запрос к Timeline — сама страница.
+        sql = [query['sql'] for query in queries
+               if 'posts_timeline' in query['sql']][-1]
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = ' | '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('timeline_user_feed_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_rebuild(self):
+        """Пересборка восстанавливает ленты по подпискам."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Пост')
+        Timeline.objects.all().delete()
+        timeline.rebuild()
+        self.assertEqual(self.feed(), [post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1, TIMELINE_BACKFILL=2)
+    def test_rebuild_limits(self):
+        """Пересборка берёт TIMELINE_BACKFILL постов и пропускает звёзд."""
+        fan = User.objects.create_user(username='Fan')
+        Follow.objects.create(user=fan, author=self.star)
+        Follow.objects.create(user=self.reader, author=self.star)
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [Post.objects.create(author=author, text='Пост')
+                 for author in (self.author, self.star) * 3]
+        timeline.rebuild()
+        self.assertEqual(
+            list(Timeline.objects.filter(user=self.reader)
+                 .order_by('-pub_date', '-post_id')
+                 .values_list('post_id', flat=True)),
+            [posts[4].pk, posts[2].pk],
+        )
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_author_who_stops_being_popular_is_fanned_out(self):
+        """Посты и подписки, сделанные, пока автор был популярен,
+        попадают в ленты, когда он перестаёт им быть."""
+        fan = User.objects.create_user(username='Fan')
+        fan_follow = Follow.objects.create(user=fan, author=self.star)
+        Follow.objects.create(user=self.reader, author=self.star)
+        posts = [Post.objects.create(author=self.star, text=f'Пост {i}')
+                 for i in range(3)]
+        self.assertFalse(Timeline.objects.filter(author=self.star).exists())
+        fan_follow.delete()
+        self.assertEqual(
+            set(Timeline.objects.filter(user=self.reader)
+                .values_list('post_id', flat=True)),
+            {post.pk for post in posts},
+        )
+        self.assertFalse(Timeline.objects.filter(user=fan).exists())
+        self.assertEqual(self.feed(), posts[::-1])
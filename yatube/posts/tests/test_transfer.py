@@ -0,0 +1,146 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from .. import transfer
+from ..models import (Comment,
+                      Follow,
+                      Group,
+                      Post,
+                      UserCounter,
+                      )
+
+User = get_user_model()
+
+TRICKY_TEXT = 'Строка с "кавычками", запятой;\nи переносом\r\nстроки'
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.author = User.objects.create_user(username='Author')
+        self.reader = User.objects.create_user(username='Reader')
+        self.group = Group.objects.create(title='Группа', slug='group',
+                                          description=TRICKY_TEXT)
+        self.posts = [
+            Post.objects.create(author=self.author, text=f'{TRICKY_TEXT} {i}',
+                                group=self.group if i % 2 else None)
+            for i in range(5)
+        ]
+        Comment.objects.create(post=self.posts[0], author=self.reader,
+                               text=TRICKY_TEXT)
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def snapshot(self):
+        return {
+            'groups': list(Group.objects.order_by('pk').values_list(
+                'pk', 'title', 'slug', 'description')),
+            'posts': list(Post.objects.order_by('pk').values_list(
+                'pk', 'author__username', 'group_id', 'text', 'pub_date',
+                'created', 'image')),
+            'comments': list(Comment.objects.order_by('pk').values_list(
+                'pk', 'post_id', 'author__username', 'text', 'created')),
+            'follows': list(Follow.objects.order_by('pk').values_list(
+                'user__username', 'author__username')),
+        }
+
+    def wipe(self):
+        for model in (Follow, Comment, Post, Group):
+            model.objects.all().delete()
+        User.objects.all().delete()
+
+    def export(self, file_format, **options):
+        call_command('export_content', self.directory.name,
+                     format=file_format, stdout=StringIO(), **options)
+
+    def load(self, file_format, **options):
+        call_command('import_content', self.directory.name,
+                     format=file_format, stdout=StringIO(), **options)
+
+    def test_round_trip(self):
+        """Выгрузка и загрузка сохраняют id, даты, тексты и авторов."""
+        for file_format in transfer.FORMATS:
+            with self.subTest(file_format=file_format):
+                expected = self.snapshot()
+                self.export(file_format)
+                self.wipe()
+                self.load(file_format)
+                self.assertEqual(self.snapshot(), expected)
+                author = User.objects.get(username='Author')
+                self.assertFalse(author.has_usable_password())
+                self.assertEqual(
+                    UserCounter.objects.get(user=author).posts_count, 5
+                )
+
+    def test_import_twice(self):
+        """Повторная загрузка того же файла не дублирует строки."""
+        expected = self.snapshot()
+        self.export('ndjson')
+        self.load('ndjson')
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_export_resume(self):
+        """Прерванная выгрузка продолжается с последней пачки."""
+        path = transfer.filename(self.directory.name, 'posts', 'csv')
+        transfer.export_table('posts', path, 'csv', chunk_size=2)
+        with open(path, 'rb') as file:
+            expected = file.read()
+        write = transfer.CSVWriter.write
+        written = []
+
+        def failing_write(writer, row):
+            if len(written) == 3:
+                raise RuntimeError('прервано')
+            written.append(row)
+            write(writer, row)
+
+        with mock.patch.object(transfer.CSVWriter, 'write', failing_write):
+            with self.assertRaises(RuntimeError):
+                transfer.export_table('posts', path, 'csv', chunk_size=2)
+        self.assertTrue(os.path.exists(f'{path}.checkpoint'))
+        rows = transfer.export_table('posts', path, 'csv', chunk_size=2,
+                                     resume=True)
+        self.assertEqual(rows, 5)
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), expected)
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_import_resume(self):
+        """Прерванная загрузка продолжается с последней пачки."""
+        for file_format in transfer.FORMATS:
+            with self.subTest(file_format=file_format):
+                expected = self.snapshot()['posts']
+                path = transfer.filename(self.directory.name, 'posts',
+                                         file_format)
+                transfer.export_table('posts', path, file_format)
+                Post.objects.all().delete()
+                save = transfer._save
+                calls = []
+
+                def failing_save(model, records):
+                    if calls:
+                        raise RuntimeError('прервано')
+                    calls.append(len(records))
+                    save(model, records)
+
+                with mock.patch.object(transfer, '_save', failing_save):
+                    with self.assertRaises(RuntimeError):
+                        transfer.import_table('posts', path, file_format,
+                                              chunk_size=2)
+                self.assertEqual(Post.objects.count(), 2)
+                with mock.patch.object(transfer, '_save',
+                                       wraps=save) as saved:
+                    rows = transfer.import_table('posts', path, file_format,
+                                                 chunk_size=2, resume=True)
+                self.assertEqual(rows, 5)
+                self.assertEqual(
+                    sum(len(call.args[1]) for call in saved.call_args_list),
+                    3,
+                )
+                self.assertEqual(self.snapshot()['posts'], expected)
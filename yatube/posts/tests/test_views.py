@@ -4,11 +4,14 @@ import tempfile
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import (Client,
                          override_settings,
                          TestCase,
                          )
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from posts.models import (Post,
@@ -166,6 +169,20 @@ class PostPagesTests(TestCase):
                 form_field = response.context['form'].fields[value]
                 self.assertIsInstance(form_field, expected)
 
+    def test_forms_are_shown_without_transaction(self):
+        """Формы create и edit открываются без транзакции."""
+        post = Post.objects.filter(author=self.user).first()
+        urls = [
+            reverse('posts:post_create'),
+            reverse('posts:post_edit', args=[post.pk]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    self.authorized_client.get(url)
+                self.assertFalse([query for query in queries
+                                  if 'SAVEPOINT' in query['sql']])
+
     def test_post_shown_in_desired_group(self):
         """Пост записывается в нужную группу."""
         pages = [
@@ -208,12 +225,38 @@ class PostPagesTests(TestCase):
         )
 
     def test_check_cache(self):
-        """Проверка кеша."""
+        """Проверка кеша: повторный запрос не обращается к базе."""
+        cache.clear()
         response = self.guest_client.get(reverse("posts:index"))
-        Post.objects.get(id=1).delete()
-        new_response = self.guest_client.get(reverse("posts:index"))
+        with self.assertNumQueries(0):
+            new_response = self.guest_client.get(reverse("posts:index"))
         self.assertEqual(response.content, new_response.content)
 
+    def test_cache_invalidated_on_change(self):
+        """Кеш главной сбрасывается при создании и удалении поста."""
+        cache.clear()
+        response = self.guest_client.get(reverse("posts:index"))
+        self.assertContains(response, self.post.text)
+        Post.objects.create(author=self.user, text='Свежий пост')
+        response = self.guest_client.get(reverse("posts:index"))
+        self.assertContains(response, 'Свежий пост')
+        Post.objects.get(text='Свежий пост').delete()
+        response = self.guest_client.get(reverse("posts:index"))
+        self.assertNotContains(response, 'Свежий пост')
+
+    def test_cache_is_per_page(self):
+        """Разные страницы ленты кешируются под разными ключами."""
+        cache.clear()
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Пост {i}') for i in range(10)
+        )
+        first = self.guest_client.get(reverse("posts:index"))
+        token = first.context['page_obj'].paginator.next_cursor
+        second = self.guest_client.get(reverse("posts:index"),
+                                       {'after': token})
+        self.assertNotEqual(first.content, second.content)
+        self.assertContains(second, self.post.text)
+
     def test_follow_page_clear(self):
         """Проверяем, что страница подписок пуста."""
         response = self.authorized_client.get(reverse("posts:follow_index"))
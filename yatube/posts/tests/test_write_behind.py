@@ -0,0 +1,231 @@
+import fcntl
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import (Client,
+                         TestCase,
+                         TransactionTestCase,
+                         override_settings,
+                         )
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import write_behind
+from ..models import (Comment,
+                      Follow,
+                      Post,
+                      Timeline,
+                      UserCounter,
+                      )
+from .utils import run_on_commit
+
+User = get_user_model()
+
+
+def reset():
+    write_behind._queue.clear()
+    if write_behind._state['journal'] is not None:
+        write_behind._state['journal'].close()
+    write_behind._state.update(pid=None, journal=None, path=None,
+                               thread=None)
+
+
+class WriteBehindTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.journal_dir = directory.name
+        override = override_settings(WRITE_BEHIND=True,
+                                     WRITE_BEHIND_JOURNAL_DIR=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(reset)
+        self.reader = User.objects.create_user(username='Reader')
+        self.author = User.objects.create_user(username='Author')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def journal(self):
+        events = []
+        for name in os.listdir(self.journal_dir):
+            with open(os.path.join(self.journal_dir, name)) as journal:
+                events += [json.loads(line) for line in journal]
+        return events
+
+    def comment(self, text):
+        return self.client.post(
+            reverse('posts:add_comment', args=[self.post.pk]),
+            {'text': text},
+        )
+
+    def test_comment_is_queued_and_visible_to_author(self):
+        """Комментарий из очереди автор видит сразу, остальные — после
+        записи."""
+        self.comment('Из очереди')
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(len(self.journal()), 1)
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        self.assertContains(self.client.get(url), 'Из очереди')
+        self.assertNotContains(Client().get(url), 'Из очереди')
+
+        self.assertEqual(write_behind.flush(), 1)
+        comment = Comment.objects.get()
+        self.assertEqual(comment.author, self.reader)
+        self.assertEqual(self.journal(), [])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertContains(self.client.get(url), 'Из очереди', count=1)
+
+    @override_settings(WRITE_BEHIND_BATCH=2)
+    def test_full_batch_is_written(self):
+        self.comment('Первый')
+        self.assertFalse(Comment.objects.exists())
+        self.comment('Второй')
+        self.assertEqual(Comment.objects.count(), 2)
+        # Записанные комментарии больше не ждут записи и не выводятся
+        # дважды.
+        self.assertEqual(
+            write_behind.pending_comments(self.reader, self.post.pk), []
+        )
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        self.assertContains(self.client.get(url), 'Второй', count=1)
+
+    def test_written_comments_are_found_by_index(self):
+        """Поиск уже записанных комментариев идёт по индексу."""
+        self.comment('Из очереди')
+        with CaptureQueriesContext(connection) as queries:
+            write_behind.flush()
+        sql, = [query['sql'] for query in queries
+                if query['sql'].startswith('SELECT')
+                and 'posts_comment' in query['sql']]
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = ' | '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('comment_post_created_idx', plan)
+
+    @override_settings(WRITE_BEHIND_BATCH=1)
+    def test_follow_written_with_its_batch_is_not_pending(self):
+        self.client.get(reverse('posts:profile_follow',
+                                args=[self.author.username]))
+        self.assertTrue(Follow.objects.exists())
+        self.assertEqual(list(write_behind.pending_follows(self.reader)), [])
+
+    def test_follow_is_queued(self):
+        """Посты автора видны в ленте подписок до записи подписки."""
+        self.client.get(reverse('posts:profile_follow',
+                                args=[self.author.username]))
+        self.assertFalse(Follow.objects.exists())
+        for params in ({}, {'page': 1}):
+            response = self.client.get(reverse('posts:follow_index'), params)
+            self.assertEqual(list(response.context['page_obj']), [self.post])
+
+        write_behind.flush()
+        run_on_commit()
+        self.assertTrue(Follow.objects.filter(user=self.reader,
+                                              author=self.author).exists())
+        self.assertTrue(Timeline.objects.filter(user=self.reader,
+                                                post=self.post).exists())
+        self.assertEqual(
+            UserCounter.objects.get(user=self.author).followers_count, 1
+        )
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+
+    def test_unfollow_cancels_queued_follow(self):
+        self.client.get(reverse('posts:profile_follow',
+                                args=[self.author.username]))
+        self.client.get(reverse('posts:profile_unfollow',
+                                args=[self.author.username]))
+        self.assertEqual(self.journal(), [])
+        write_behind.flush()
+        self.assertFalse(Follow.objects.exists())
+
+    def lost_journal(self, *events):
+        # PID живого процесса: такой PID мог достаться новому процессу,
+        # но журнал без блокировки всё равно брошен.
+        path = os.path.join(self.journal_dir, f'{os.getpid()}-lost.ndjson')
+        with open(path, 'w') as journal:
+            for event in events:
+                journal.write(json.dumps(event) + '\n')
+        return path
+
+    def test_journal_of_dead_process_is_recovered_once(self):
+        """Журнал упавшего процесса дописывается без дублей."""
+        comment = {
+            'kind': 'comment', 'post_id': self.post.pk,
+            'author_id': self.reader.pk, 'text': 'Из журнала',
+            'created': timezone.now().isoformat(),
+        }
+        follow = {'kind': 'follow', 'user_id': self.reader.pk,
+                  'author_id': self.author.pk}
+        self.lost_journal(comment, follow, comment)
+        out = StringIO()
+        call_command('flush_write_behind', stdout=out)
+        self.assertIn('событий: 3', out.getvalue())
+        self.assertEqual(Comment.objects.get().text, 'Из журнала')
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+    def test_locked_journal_is_left_to_its_owner(self):
+        """Журнал, на котором держат flock, принадлежит живому процессу."""
+        path = self.lost_journal({'kind': 'follow',
+                                  'user_id': self.reader.pk,
+                                  'author_id': self.author.pk})
+        with open(path) as journal:
+            fcntl.flock(journal, fcntl.LOCK_EX)
+            self.assertEqual(write_behind.recover(), 0)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(write_behind.recover(), 1)
+        self.assertFalse(os.path.exists(path))
+
+    def test_own_journal_is_not_recovered(self):
+        self.comment('Из очереди')
+        self.assertEqual(write_behind.recover(), 0)
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(len(self.journal()), 1)
+
+    @override_settings(WRITE_BEHIND=False)
+    def test_disabled(self):
+        self.comment('Сразу')
+        self.assertTrue(Comment.objects.filter(text='Сразу').exists())
+        self.assertEqual(self.journal(), [])
+
+
+class WriteBehindThreadTests(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(WRITE_BEHIND=True,
+                                     WRITE_BEHIND_EXECUTOR='thread',
+                                     WRITE_BEHIND_INTERVAL=0.05,
+                                     WRITE_BEHIND_JOURNAL_DIR=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(reset)
+        self.addCleanup(write_behind.stop)
+
+    def test_background_thread_writes_queue(self):
+        """Очередь записывает фоновый поток, без вызова flush."""
+        author = User.objects.create_user(username='Author')
+        post = Post.objects.create(author=author, text='Пост')
+        write_behind.save_comment(Comment(post=post, author=author,
+                                          text='Из потока'))
+        self.assertIsNotNone(write_behind._state['thread'])
+        # Пока поток пишет, таблица базы в памяти заблокирована без
+        # ожидания, поэтому ждать надо очередь, а не строку в базе.
+        deadline = time.monotonic() + 5
+        while write_behind._queue and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(Comment.objects.get().text, 'Из потока')
+        write_behind.stop()
+        self.assertIsNone(write_behind._state['thread'])
@@ -0,0 +1,13 @@
+from django.db import connection
+
+
+def run_on_commit():
+    """Выполняет функции, отложенные до коммита.
+
+    ``TestCase`` не коммитит транзакцию теста, поэтому ``on_commit``
+    сам не срабатывает, а ``captureOnCommitCallbacks`` в Django 2.2 нет.
+    """
+    while connection.run_on_commit:
+        callbacks, connection.run_on_commit = connection.run_on_commit, []
+        for _, callback in callbacks:
+            callback()
@@ -0,0 +1,204 @@
+"""Фоновая подготовка миниатюр картинок постов.
+
+Для каждой картинки строится набор вариантов: кадр 960x339 в нескольких
+ширинах (``THUMBNAIL_WIDTHS``) и форматах (``THUMBNAIL_FORMATS``, из
+которых берутся те, что умеют сохранять Pillow и sorl-thumbnail).
+Варианты строятся после коммита сохранения поста в пуле потоков, а
+готовый набор (``src``, ``srcset`` и ``<source>`` для современных
+форматов) записывается в поле ``Post.thumbnails`` вместе с именем
+картинки, для которой он построен, и кладётся в кеш. Шаблоны (тег
+``post_thumbnail``) берут набор из поста, а если пост прочитан до
+записи набора — из кеша; пока миниатюр нет, показывают заглушку того
+же размера, поэтому ни один запрос страницы не ждёт обработки
+картинки. Когда миниатюры готовы, версии лент поста сбрасываются, и
+закешированные фрагменты с заглушкой больше не используются.
+
+При ``THUMBNAIL_ASYNC = False`` миниатюры строятся сразу, в том же
+потоке, как это делал тег ``{% thumbnail %}`` sorl-thumbnail. При
+``THUMBNAIL_EXECUTOR = 'inline'`` они строятся после коммита, но в
+потоке запроса, без пула (так работают тесты, см. ``core.runner``).
+Уже загруженные картинки обрабатывает команда ``build_thumbnails``.
+"""
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import (connections,
+                       transaction,
+                       )
+from PIL import Image
+from sorl.thumbnail import (delete,
+                            get_thumbnail,
+                            )
+from sorl.thumbnail.base import EXTENSIONS
+
+from . import feed_cache
+from .models import Post
+
+# Пропорции кадра в лентах и ширина, которую отдаёт атрибут src.
+WIDTH, HEIGHT = 960, 339
+OPTIONS = {'crop': 'center', 'upscale': True}
+FALLBACK_FORMAT = 'JPEG'
+SIZES = f'(max-width: {WIDTH}px) 100vw, {WIDTH}px'
+
+# Неудачную попытку запоминаем ненадолго, чтобы битая картинка
+# не ставилась в очередь при каждом показе страницы.
+FAILED = ''
+FAILED_TIMEOUT = 5 * 60
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def _key(name):
+    return f'posts:thumbnails:{name}'
+
+
+def formats():
+    """Сохраняемые форматы из THUMBNAIL_FORMATS, JPEG всегда последний."""
+    Image.init()
+    found = [image_format for image_format in settings.THUMBNAIL_FORMATS
+             if image_format in EXTENSIONS and image_format in Image.SAVE
+             and image_format != FALLBACK_FORMAT]
+    return [*found, FALLBACK_FORMAT]
+
+
+def geometry(width):
+    return f'{width}x{round(width * HEIGHT / WIDTH)}'
+
+
+def _srcset(name, image_format):
+    candidates = []
+    for width in settings.THUMBNAIL_WIDTHS:
+        image = get_thumbnail(name, geometry(width), format=image_format,
+                              **OPTIONS)
+        candidates.append(f'{image.url} {width}w')
+    return ', '.join(candidates)
+
+
+def build(name):
+    """Строит все варианты картинки и возвращает их описание для шаблона."""
+    sources = [
+        {'type': Image.MIME[image_format], 'srcset': _srcset(name,
+                                                             image_format)}
+        for image_format in formats()
+    ]
+    fallback = sources.pop()
+    src = get_thumbnail(name, geometry(WIDTH), format=FALLBACK_FORMAT,
+                        **OPTIONS).url
+    return {'src': src, 'srcset': fallback['srcset'], 'sources': sources,
+            'sizes': SIZES}
+
+
+def ready(name):
+    """Готовый набор миниатюр из кеша, ``''`` после ошибки или None."""
+    return cache.get(_key(name))
+
+
+def stored(post):
+    """Набор миниатюр, записанный в пост для его нынешней картинки."""
+    if not post.thumbnails:
+        return None
+    thumbnails = json.loads(post.thumbnails)
+    if thumbnails['image'] != post.image.name:
+        return None
+    return thumbnails['variants']
+
+
+def generate(name, scopes=(), force=False):
+    """Строит миниатюры и запоминает их. Ошибки только пишет в лог.
+
+    ``force`` удаляет ранее построенные миниатюры, чтобы собрать их заново.
+    """
+    try:
+        if force:
+            delete(name, delete_file=False)
+        thumbnail = build(name)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры %s', name)
+        cache.set(_key(name), FAILED, FAILED_TIMEOUT)
+        return FAILED
+    Post.objects.filter(image=name).update(
+        thumbnails=json.dumps({'image': name, 'variants': thumbnail})
+    )
+    cache.set(_key(name), thumbnail, None)
+    if scopes:
+        feed_cache.bump(*scopes)
+    return thumbnail
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def _run(name, scopes):
+    try:
+        generate(name, scopes)
+    finally:
+        with _executor_lock:
+            _pending.discard(name)
+        connections.close_all()
+
+
+def _submit(name, scopes):
+    if settings.THUMBNAIL_EXECUTOR == 'inline':
+        generate(name, scopes)
+        return
+    with _executor_lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    _get_executor().submit(_run, name, scopes)
+
+
+def shutdown():
+    """Дожидается поставленных в пул миниатюр и останавливает пул."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def schedule(post):
+    """Ставит в очередь миниатюры картинки поста после коммита."""
+    if not post.image:
+        return
+    name = post.image.name
+    scopes = feed_cache.post_scopes(post, post.group_id)
+    if settings.THUMBNAIL_ASYNC:
+        transaction.on_commit(lambda: _submit(name, scopes))
+    else:
+        transaction.on_commit(lambda: generate(name))
+
+
+def for_post(post):
+    """Набор миниатюр для шаблона; None, пока он не готов.
+
+    Если набора нет ни в посте, ни в кеше (картинка загружена до поля
+    ``Post.thumbnails`` или сменилась), миниатюры ставятся в очередь.
+    В синхронном режиме строятся сразу.
+    """
+    if not post.image:
+        return None
+    thumbnail = stored(post) or ready(post.image.name)
+    if thumbnail is None:
+        if not settings.THUMBNAIL_ASYNC:
+            return generate(post.image.name) or None
+        scopes = feed_cache.post_scopes(post, post.group_id)
+        name = post.image.name
+        transaction.on_commit(lambda: _submit(name, scopes))
+    return thumbnail or None
@@ -0,0 +1,257 @@
+"""Материализованная лента подписок.
+
+Пост обычного автора при публикации раскладывается по лентам всех его
+подписчиков (fan-out on write), и ``follow_index`` читает готовый
+упорядоченный срез таблицы ``Timeline``. Посты популярных авторов,
+у которых подписчиков больше ``TIMELINE_FANOUT_LIMIT``, не копируются,
+а подмешиваются к срезу при чтении (fan-in on read).
+
+Пока автор популярен, его новые посты и новые подписки на него в
+``Timeline`` не попадают. Когда после отписки подписчиков снова
+становится не больше ``TIMELINE_FANOUT_LIMIT``, ``refill`` заново
+раскладывает последние посты автора по лентам всех его подписчиков.
+После смены самого ``TIMELINE_FANOUT_LIMIT`` ленты пересобирает
+``rebuild_timelines``.
+"""
+from heapq import merge
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection
+
+from .models import (Follow,
+                     Post,
+                     Timeline,
+                     UserCounter,
+                     )
+from .paginator import (CursorPaginator,
+                        keyset_slice,
+                        )
+
+
+def is_popular(author_id):
+    return UserCounter.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).exists()
+
+
+def popular_authors(user):
+    """id популярных авторов среди подписок пользователя."""
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    return list(Follow.objects.filter(
+        user=user,
+        author__counters__followers_count__gt=limit,
+    ).values_list('author_id', flat=True))
+
+
+def fan_out(post):
+    """Кладёт новый пост в ленты подписчиков автора."""
+    if is_popular(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    Timeline.objects.bulk_create(
+        (Timeline(user_id=user_id,
+                  post_id=post.pk,
+                  author_id=post.author_id,
+                  pub_date=post.pub_date)
+         for user_id in followers.iterator()),
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Заполняет ленту последними постами автора после подписки."""
+    if is_popular(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date'
+    ).values_list('pk', 'pub_date')[:settings.TIMELINE_BACKFILL]
+    Timeline.objects.bulk_create(
+        (Timeline(user_id=user_id,
+                  post_id=pk,
+                  author_id=author_id,
+                  pub_date=pub_date)
+         for pk, pub_date in posts),
+        ignore_conflicts=True,
+    )
+
+
+def drop(user_id, author_id):
+    """Убирает посты автора из ленты после отписки."""
+    Timeline.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+REFILL_SQL = """
+    INSERT INTO {timeline} (user_id, post_id, author_id, pub_date)
+    SELECT follow.user_id, post.id, post.author_id, post.pub_date
+    FROM {follow} AS follow
+    JOIN (
+        SELECT id, author_id, pub_date
+        FROM {post}
+        WHERE author_id = %s
+        ORDER BY pub_date DESC, id DESC
+        LIMIT %s
+    ) AS post ON post.author_id = follow.author_id
+    WHERE follow.author_id = %s
+"""
+
+
+def refill(author_id):
+    """Раскладывает посты автора по лентам, если отписка только что
+    сделала его непопулярным.
+
+    Счётчик подписчиков меняется на единицу, поэтому переход через
+    порог — это ровно ``TIMELINE_FANOUT_LIMIT`` после уменьшения.
+    """
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    if not UserCounter.objects.filter(user_id=author_id,
+                                      followers_count=limit).exists():
+        return
+    # В лентах могли остаться посты, разложенные до того, как автор
+    # стал популярным; они будут вставлены заново.
+    Timeline.objects.filter(author_id=author_id).delete()
+    sql = REFILL_SQL.format(timeline=Timeline._meta.db_table,
+                            follow=Follow._meta.db_table,
+                            post=Post._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [author_id, settings.TIMELINE_BACKFILL,
+                             author_id])
+
+
+REBUILD_SQL = """
+    INSERT INTO {timeline} (user_id, post_id, author_id, pub_date)
+    SELECT follow.user_id, post.id, post.author_id, post.pub_date
+    FROM {follow} AS follow
+    JOIN (
+        SELECT id, author_id, pub_date,
+               ROW_NUMBER() OVER (PARTITION BY author_id
+                                  ORDER BY pub_date DESC, id DESC) AS place
+        FROM {post}
+    ) AS post ON post.author_id = follow.author_id
+    WHERE post.place <= %s
+      AND follow.author_id NOT IN (
+          SELECT user_id FROM {counter} WHERE followers_count > %s
+      )
+"""
+
+
+def rebuild():
+    """Пересобирает все ленты по текущим подпискам.
+
+    Делает то же, что ``backfill`` для каждой подписки, но одним
+    запросом: на миллионах подписок цикл занял бы часы.
+    """
+    Timeline.objects.all().delete()
+    sql = REBUILD_SQL.format(timeline=Timeline._meta.db_table,
+                             follow=Follow._meta.db_table,
+                             post=Post._meta.db_table,
+                             counter=UserCounter._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [settings.TIMELINE_BACKFILL,
+                             settings.TIMELINE_FANOUT_LIMIT])
+
+
+class TimelinePaginator(CursorPaginator):
+    """Курсорный постраничный вывод ленты подписок.
+
+    ``object_list`` — все посты авторов, на которых подписан
+    пользователь; из него берутся только посты популярных авторов,
+    остальное читается из ``Timeline`` по индексу (user, pub_date, post).
+    """
+
+    def __init__(self, object_list, per_page, user, after=None,
+                 before=None, pending_authors=()):
+        super().__init__(object_list, per_page, after=after, before=before)
+        self.user = user
+        self.pending_authors = list(pending_authors)
+
+    @classmethod
+    def windowed(cls, object_list, user, pending_authors=()):
+        return TimelineFeed(object_list, user, pending_authors)
+
+    def _slice(self, cursor, newer):
+        limit = self.per_page + 1
+        popular = popular_authors(self.user)
+        entries = Timeline.objects.filter(user=self.user).select_related(
+            'post__author', 'post__group'
+        )
+        if popular:
+            entries = entries.exclude(author_id__in=popular)
+        posts = [entry.post for entry in keyset_slice(
+            entries, cursor, newer, limit, fields=('pub_date', 'post_id')
+        )]
+        sources = []
+        if popular:
+            sources.append(keyset_slice(
+                self.object_list.filter(author_id__in=popular),
+                cursor, newer, limit,
+            ))
+        # Подписки из очереди posts.write_behind ещё не разложены по
+        # ленте, а в object_list их авторов нет.
+        if self.pending_authors:
+            sources.append(keyset_slice(
+                Post.objects.for_feed().filter(
+                    author_id__in=self.pending_authors
+                ),
+                cursor, newer, limit,
+            ))
+        if not sources:
+            return posts
+        merged = merge(posts, *sources,
+                       key=lambda post: (post.pub_date, post.pk),
+                       reverse=not newer)
+        unique = {post.pk: post for post in merged}
+        return list(unique.values())[:limit]
+
+
+class TimelineFeed:
+    """Лента подписок для ``?page=N`` (``WindowedPaginator``).
+
+    Как и ``TimelinePaginator``, читает ``Timeline`` по индексу
+    (user, pub_date, post) и подмешивает посты популярных авторов и
+    подписок из очереди ``posts.write_behind``. Источники не
+    пересекаются, поэтому число записей — сумма их ``COUNT``, а страница
+    — слияние первых записей каждого. Без подмешиваемых постов страница
+    — ``OFFSET`` по индексу ``Timeline``, без сортировки соединения.
+    """
+
+    def __init__(self, object_list, user, pending_authors=()):
+        popular = popular_authors(user)
+        pending = [author_id for author_id in pending_authors
+                   if author_id not in popular]
+        self.entries = Timeline.objects.filter(user=user).select_related(
+            'post__author', 'post__group'
+        ).order_by('-pub_date', '-post_id')
+        if popular or pending:
+            self.entries = self.entries.exclude(
+                author_id__in=popular + pending
+            )
+        self.sources = []
+        if popular:
+            self.sources.append(object_list.filter(author_id__in=popular))
+        if pending:
+            self.sources.append(
+                Post.objects.for_feed().filter(author_id__in=pending)
+            )
+        self.sources = [source.order_by('-pub_date', '-pk')
+                        for source in self.sources]
+
+    def count(self):
+        return self.entries.count() + sum(source.count()
+                                          for source in self.sources)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        start, stop = index.start or 0, index.stop
+        if not self.sources:
+            return [entry.post for entry in self.entries[start:stop]]
+        merged = merge((entry.post for entry in self.entries[:stop]),
+                       *(source[:stop] for source in self.sources),
+                       key=lambda post: (post.pub_date, post.pk),
+                       reverse=True)
+        return list(islice(merged, start, stop))
@@ -0,0 +1,370 @@
+"""Потоковые выгрузка и загрузка контента: группы, посты, комментарии,
+подписки.
+
+Каждая таблица пишется в свой файл (``posts.ndjson`` или ``posts.csv``)
+построчно из ``iterator()`` и читается обратно пачками, которые
+вставляются одним ``executemany``, поэтому память не зависит от
+размера таблиц.
+Пользователи передаются по username: при загрузке недостающие
+создаются без пароля. id сохраняются, а уже существующие строки
+пропускаются, так что повторная загрузка того же файла безопасна.
+
+Рядом с файлом, пока он обрабатывается, лежит ``<файл>.checkpoint``
+с позицией последней завершённой пачки; ``resume=True`` продолжает
+с неё после прерывания.
+"""
+import csv
+import json
+import os
+from collections import namedtuple
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import (connection,
+                       transaction,
+                       )
+
+from .models import (Comment,
+                     Follow,
+                     Group,
+                     Post,
+                     )
+
+User = get_user_model()
+
+FORMATS = ('ndjson', 'csv')
+CHUNK_SIZE = 2000
+USERNAMES_PER_QUERY = 500
+
+# (колонка в файле, поле для values_list при выгрузке)
+Table = namedtuple('Table', ('model', 'columns'))
+
+TABLES = {
+    'groups': Table(Group, (
+        ('id', 'id'),
+        ('title', 'title'),
+        ('slug', 'slug'),
+        ('description', 'description'),
+    )),
+    'posts': Table(Post, (
+        ('id', 'id'),
+        ('author', 'author__username'),
+        ('group', 'group_id'),
+        ('text', 'text'),
+        ('pub_date', 'pub_date'),
+        ('created', 'created'),
+        ('image', 'image'),
+    )),
+    'comments': Table(Comment, (
+        ('id', 'id'),
+        ('post', 'post_id'),
+        ('author', 'author__username'),
+        ('text', 'text'),
+        ('created', 'created'),
+    )),
+    'follows': Table(Follow, (
+        ('id', 'id'),
+        ('user', 'user__username'),
+        ('author', 'author__username'),
+    )),
+}
+
+TABLES_BY_MODEL = {table.model: table.columns for table in TABLES.values()}
+
+# Порядок загрузки учитывает внешние ключи.
+ORDER = ('groups', 'posts', 'comments', 'follows')
+
+
+def filename(directory, table, file_format):
+    return os.path.join(directory, f'{table}.{file_format}')
+
+
+class Checkpoint:
+    """Позиция последней завершённой пачки в файле ``<путь>.checkpoint``."""
+
+    def __init__(self, path):
+        self.path = f'{path}.checkpoint'
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def save(self, **state):
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _dump(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class NDJSONWriter:
+    def __init__(self, file, columns):
+        self.file = file
+        self.columns = columns
+
+    def header(self):
+        pass
+
+    def write(self, row):
+        self.file.write(json.dumps(
+            dict(zip(self.columns, map(_dump, row))), ensure_ascii=False
+        ).encode() + b'\n')
+
+
+class CSVWriter:
+    def __init__(self, file, columns):
+        self.file = file
+        self.columns = columns
+        self.line = _Line()
+        self.writer = csv.writer(self.line)
+
+    def header(self):
+        self.write(self.columns)
+
+    def write(self, row):
+        self.writer.writerow(['' if value is None else _dump(value)
+                              for value in row])
+        self.file.write(self.line.pop().encode())
+
+
+class _Line:
+    """Приёмник для csv.writer: отдаёт записанную строку целиком."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def pop(self):
+        text, self.parts = ''.join(self.parts), []
+        return text
+
+
+WRITERS = {'ndjson': NDJSONWriter, 'csv': CSVWriter}
+
+
+def export_table(table, path, file_format, chunk_size=CHUNK_SIZE,
+                 resume=False):
+    """Выгружает таблицу в файл. Возвращает число записанных строк."""
+    model, columns = TABLES[table]
+    names = [name for name, _ in columns]
+    lookups = [lookup for _, lookup in columns]
+    checkpoint = Checkpoint(path)
+    state = checkpoint.load() if resume else None
+    rows = model.objects.order_by('pk').values_list(*lookups)
+    if state:
+        rows = rows.filter(pk__gt=state['last_pk'])
+    with open(path, 'r+b' if state else 'wb') as file:
+        writer = WRITERS[file_format](file, names)
+        if state:
+            file.truncate(state['offset'])
+            file.seek(state['offset'])
+        else:
+            writer.header()
+        written = state['rows'] if state else 0
+        for row in rows.iterator(chunk_size=chunk_size):
+            writer.write(row)
+            written += 1
+            if written % chunk_size == 0:
+                file.flush()
+                checkpoint.save(last_pk=row[0], offset=file.tell(),
+                                rows=written)
+    checkpoint.clear()
+    return written
+
+
+def _lines(file, position):
+    """Строки файла с позицией конца каждой из них."""
+    for raw in file:
+        position[0] += len(raw)
+        yield raw.decode()
+
+
+def _read(file, file_format, position, columns=None):
+    """Словари строк файла; ``position`` — конец последней прочитанной.
+
+    ``columns`` — заголовок CSV, если чтение начинается не с начала файла.
+    """
+    lines = _lines(file, position)
+    if file_format == 'ndjson':
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+        return
+    reader = csv.reader(lines)
+    if columns is None:
+        columns = next(reader)
+    for row in reader:
+        yield dict(zip(columns, row))
+
+
+def _csv_columns(path):
+    with open(path, encoding='utf-8', newline='') as file:
+        return next(csv.reader(file))
+
+
+def _lookup_users(usernames):
+    found = {}
+    # SQLite ограничивает число параметров запроса.
+    for start in range(0, len(usernames), USERNAMES_PER_QUERY):
+        found.update(User.objects.filter(
+            username__in=usernames[start:start + USERNAMES_PER_QUERY]
+        ).values_list('username', 'pk'))
+    return found
+
+
+def _user_ids(usernames):
+    """id пользователей по username; недостающие создаются без пароля."""
+    found = _lookup_users(list(usernames))
+    missing = [username for username in usernames if username not in found]
+    if missing:
+        User.objects.bulk_create(
+            (User(username=username, password=make_password(None))
+             for username in missing),
+            ignore_conflicts=True,
+        )
+        found.update(_lookup_users(missing))
+    return found
+
+
+# Разбор значений из файла для частых типов колонок: общий путь через
+# to_python и get_db_prep_save в несколько раз медленнее.
+PARSERS = {
+    'AutoField': int,
+    'ForeignKey': int,
+    'IntegerField': int,
+    'PositiveIntegerField': int,
+    'CharField': str,
+    'SlugField': str,
+    'TextField': str,
+    'FileField': str,
+    'ImageField': str,
+    'DateTimeField': datetime.fromisoformat,
+}
+
+
+def _converter(field, user_ids=None):
+    """Приводит значение из файла к значению колонки в базе."""
+    parse = PARSERS.get(field.get_internal_type())
+    if parse is None:
+        def prepare(value):
+            return field.get_db_prep_save(field.to_python(value), connection)
+    elif parse is datetime.fromisoformat:
+        def prepare(value):
+            return connection.ops.adapt_datetimefield_value(parse(value))
+    else:
+        prepare = parse
+
+    def convert(value):
+        if user_ids is not None:
+            return user_ids[value]
+        if value is None or value == '' and field.null:
+            return None
+        return prepare(value)
+    return convert
+
+
+def _rows(model, records):
+    """Колонки и строки для вставки; поля, которых нет в файле, получают
+    значения по умолчанию."""
+    columns = dict(TABLES_BY_MODEL[model])
+    user_columns = [name for name, lookup in columns.items()
+                    if lookup.endswith('__username')]
+    usernames = {record[name] for record in records
+                 for name in user_columns}
+    user_ids = _user_ids(usernames) if usernames else {}
+    fields, converters, defaults = [], [], []
+    for field in model._meta.concrete_fields:
+        if field.name in columns:
+            fields.append(field)
+            converters.append((field.name, _converter(
+                field, user_ids if field.name in user_columns else None
+            )))
+        elif field.has_default():
+            fields.append(field)
+            defaults.append(
+                field.get_db_prep_save(field.get_default(), connection)
+            )
+    rows = [
+        [convert(record[name]) for name, convert in converters] + defaults
+        for record in records
+    ]
+    return [field.column for field in fields], rows
+
+
+def _save(model, records):
+    """Вставляет пачку одним executemany, пропуская существующие id.
+
+    bulk_create для тысяч строк тратит основное время на сборку моделей
+    и SQL; сигналов и auto_now_add здесь всё равно не нужно: даты берутся
+    из файла, а счётчики пересчитываются после загрузки.
+    """
+    columns, rows = _rows(model, records)
+    quote = connection.ops.quote_name
+    sql = '{} {} ({}) VALUES ({}) {}'.format(
+        connection.ops.insert_statement(ignore_conflicts=True),
+        quote(model._meta.db_table),
+        ', '.join(map(quote, columns)),
+        ', '.join(['%s'] * len(columns)),
+        connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=True),
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(sql.rstrip(), rows)
+
+
+def import_table(table, path, file_format, chunk_size=CHUNK_SIZE,
+                 resume=False):
+    """Загружает таблицу из файла. Возвращает число прочитанных строк."""
+    model = TABLES[table].model
+    checkpoint = Checkpoint(path)
+    state = checkpoint.load() if resume else None
+    loaded = state['rows'] if state else 0
+    with open(path, 'rb') as file:
+        position = [0]
+        columns = None
+        if state:
+            file.seek(state['offset'])
+            position[0] = state['offset']
+            if file_format == 'csv':
+                columns = _csv_columns(path)
+        records = _read(file, file_format, position, columns)
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) == chunk_size:
+                _save(model, chunk)
+                loaded += len(chunk)
+                chunk = []
+                checkpoint.save(offset=position[0], rows=loaded)
+        if chunk:
+            _save(model, chunk)
+            loaded += len(chunk)
+    _reset_sequence(model)
+    checkpoint.clear()
+    return loaded
+
+
+def _reset_sequence(model):
+    """После вставки с явными id счётчик id должен идти дальше них."""
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
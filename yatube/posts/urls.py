@@ -21,6 +21,10 @@ urlpatterns = [
          views.post_detail,
          name='post_detail'
          ),
+    path('search/',
+         views.post_search,
+         name='search'
+         ),
     path('create/',
          views.post_create,
          name='post_create'),
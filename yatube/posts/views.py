@@ -1,81 +1,159 @@
-from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.shortcuts import (get_object_or_404,
                               redirect,
                               render,
                               )
-
-
+from django.middleware.csrf import get_token
+from django.utils.http import urlencode
+
+from core import (holes,
+                  page_cache,
+                  routers,
+                  )
+
+from . import (counters,
+               feed_cache,
+               follow_graph,
+               recommendations,
+               search,
+               write_behind,
+               )
 from .forms import (CommentForm,
                     PostForm,
                     )
 from .models import (Comment,
-                     Follow,
                      Group,
                      Post,
                      User,
                      )
+from .paginator import (paginate,
+                        windowed_page,
+                        )
+from .timeline import TimelinePaginator
 
 
 POSTS_ON_PAGE = 10
 
 
 def index(request):
-    post_list = Post.objects.select_related('author', 'group').all()
-    paginator = Paginator(post_list, POSTS_ON_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    context = {
-        'page_obj': page_obj,
-    }
-    return render(request, 'posts/index.html', context)
+    cache_key = feed_cache.for_page(request, 'index', 'index', 'groups')
+    etag = feed_cache.etag(request, cache_key)
+    response = feed_cache.not_modified(request, etag)
+    if response is not None:
+        return response
+    return feed_cache.set_etag(holes.render_page(
+        request, 'posts/index.html', cache_key, lambda: {
+            'page_obj': paginate(request, Post.objects.for_feed(),
+                                 POSTS_ON_PAGE),
+            'feed_cache': cache_key,
+        },
+    ), etag)
 
 
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts_list = group.posts.all()
-    paginator = Paginator(posts_list, POSTS_ON_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    context = {
-        'group': group,
-        'page_obj': page_obj,
-    }
-    return render(request, 'posts/group_list.html', context)
+    cache_key = feed_cache.for_page(request, 'group', f'group:{group.pk}',
+                                    'groups')
+    if routers.stale(group):
+        group = get_object_or_404(Group, slug=slug)
+    etag = feed_cache.etag(request, cache_key)
+    response = feed_cache.not_modified(request, etag)
+    if response is not None:
+        return response
+    return feed_cache.set_etag(holes.render_page(
+        request, 'posts/group_list.html', cache_key, lambda: {
+            'group': group,
+            'page_obj': paginate(request, group.posts.for_feed(),
+                                 POSTS_ON_PAGE),
+            'feed_cache': cache_key,
+        },
+    ), etag)
 
 
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts_count = author.posts.count()
+    authors = User.objects.select_related('counters')
+    author = get_object_or_404(authors, username=username)
+    cache_key = feed_cache.for_page(request, 'profile',
+                                    f'author:{author.pk}', 'groups')
+    if routers.stale(author):
+        author = get_object_or_404(authors, username=username)
+    posts_count = counters.for_user(author).posts_count
     title = f'Профиль пользователя {author}'
 
-    paginator = Paginator(author.posts.all(), POSTS_ON_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    following = author.following.exists()
-
-    context = {
-        'author': author,
-        'title': title,
-        'posts_count': posts_count,
-        'page_obj': page_obj,
-        'following': following,
-    }
-    return render(request, 'posts/profile.html', context)
+    following = follow_graph.follows(request.user, author.pk)
+    suggested = recommendations.for_user(request.user, exclude=author.pk)
+    etag = feed_cache.etag(request, cache_key, posts_count, following,
+                           *(suggestion.pk for suggestion in suggested))
+    response = feed_cache.not_modified(request, etag)
+    if response is not None:
+        return response
+
+    return feed_cache.set_etag(holes.render_page(
+        request, 'posts/profile.html', cache_key, lambda: {
+            'author': author,
+            'title': title,
+            'posts_count': posts_count,
+            'page_obj': paginate(request, author.posts.for_feed(),
+                                 POSTS_ON_PAGE),
+            'feed_cache': cache_key,
+        },
+        personal={'following': following, 'suggested': suggested},
+    ), etag)
 
 
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    # Теги страницы ставятся до чтения поста: если пост недавно менялся,
+    # он читается уже из основной базы (core.page_cache.tag).
+    cache_key = feed_cache.for_page(request, 'post', f'post:{post_id}',
+                                    'groups')
+    post = get_object_or_404(Post.objects.for_detail(), pk=post_id)
+    page_cache.tag(request, f'author:{post.author_id}')
+    if routers.stale(post):
+        post = get_object_or_404(Post.objects.for_detail(), pk=post_id)
+    pending_comments = write_behind.pending_comments(request.user, post_id)
+    posts_count = counters.for_user(post.author).posts_count
+    # Форма комментария содержит токен CSRF: отрисованная страница
+    # годится, пока у клиента тот же секрет.
+    csrf_secret = ''
+    if request.user.is_authenticated:
+        get_token(request)
+        csrf_secret = request.META['CSRF_COOKIE']
+    etag = feed_cache.etag(
+        request, cache_key, posts_count, csrf_secret,
+        *(comment.created.isoformat() for comment in pending_comments),
+    )
+    response = feed_cache.not_modified(request, etag)
+    if response is not None:
+        return response
     form = CommentForm(request.POST or None)
-    comments = Comment.objects.filter(post=post)
-    posts_count = Post.objects.all().count()
+    comments = Comment.objects.for_post(post)
     context = {
         'post': post,
         'posts_count': posts_count,
         'form': form,
         'comments': comments,
+        'pending_comments': pending_comments,
+        'feed_cache': cache_key,
     }
-    return render(request, 'posts/post_detail.html', context)
+    return feed_cache.set_etag(
+        render(request, 'posts/post_detail.html', context), etag
+    )
+
+
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    results = search.search(query, Post.objects.for_feed())
+    page_obj = None
+    if results is not None:
+        page_obj = windowed_page(request, results, POSTS_ON_PAGE)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_params': urlencode({'q': query}) + '&',
+        'title': f'Поиск: {query}' if query else 'Поиск',
+    }
+    return render(request, 'posts/search.html', context)
 
 
 @login_required
@@ -88,7 +166,10 @@ def post_create(request):
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
-            post.save()
+            # Транзакция только на запись: GET не берёт блокировку
+            # записи, которую режим IMMEDIATE ставит на каждую транзакцию.
+            with transaction.atomic():
+                post.save()
             return redirect('posts:profile', username=request.user)
     return render(request, 'posts/post_create.html', context={'form': form,
                                                               'title': title})
@@ -107,7 +188,11 @@ def post_edit(request, post_id):
         return redirect("posts:post_detail", post_id)
     if request.method == 'POST':
         if form.is_valid():
-            post = form.save()
+            post = form.save(commit=False)
+            # Только поля формы: comments_count, прочитанный вместе с
+            # постом, мог устареть, пока пост редактировали.
+            with transaction.atomic():
+                post.save(update_fields=PostForm._meta.fields)
             return redirect('posts:post_detail', post_id)
     return render(request, 'posts/post_create.html',
                   context={'form': form,
@@ -118,42 +203,47 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(Post.objects.only('pk'), id=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        write_behind.save_comment(comment)
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    follower = Follow.objects.filter(user=request.user).values_list(
-        'author_id', flat=True
-    )
-    posts = Post.objects.filter(author_id__in=follower)
-    paginator = Paginator(posts, POSTS_ON_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    pending_authors = write_behind.pending_follows(request.user)
+    if follow_graph.following(request.user.pk) or pending_authors:
+        posts = Post.objects.for_feed().filter(
+            author__following__user=request.user
+        )
+        page_obj = paginate(request, posts, POSTS_ON_PAGE,
+                            paginator_class=TimelinePaginator,
+                            user=request.user,
+                            pending_authors=pending_authors)
+    else:
+        # Без подписок лента пуста: ни Timeline, ни посты не читаются.
+        page_obj = paginate(request, Post.objects.none(), POSTS_ON_PAGE)
     context = {
         'page_obj': page_obj,
         'title': 'Избранные посты',
+        'suggested': recommendations.for_user(request.user),
     }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
-    if author != request.user:
-        Follow.objects.get_or_create(user=request.user, author=author)
+    author = get_object_or_404(User.objects.only('pk'), username=username)
+    write_behind.follow(request.user, author)
     return redirect('posts:follow_index')
 
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
-    Follow.objects.get(user=request.user, author=author).delete()
+    author = get_object_or_404(User.objects.only('pk'), username=username)
+    write_behind.unfollow(request.user, author)
     return redirect('posts:follow_index')
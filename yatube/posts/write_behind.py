@@ -0,0 +1,430 @@
+"""Отложенная запись комментариев и подписок.
+
+При ``WRITE_BEHIND = True`` ``add_comment`` и ``profile_follow`` не
+пишут в базу сами: событие встаёт в очередь процесса, а фоновый поток
+раз в ``WRITE_BEHIND_INTERVAL`` секунд или по ``WRITE_BEHIND_BATCH``
+событий записывает всю очередь одной транзакцией и затем делает то же,
+что сигналы при обычном сохранении: счётчики, версии фрагментов,
+ленты подписок.
+
+Надёжность. До ответа пользователю событие дописывается в журнал
+процесса (``WRITE_BEHIND_JOURNAL_DIR/<pid>-<метка>.ndjson``, с
+``os.fsync`` при ``WRITE_BEHIND_FSYNC``), а после коммита пачки журнал
+сжимается до ещё не записанных событий. Процесс держит на своём журнале
+``flock``, и ядро снимает её, когда процесс завершается, — в отличие от
+проверки PID, которую обманывает PID, доставшийся новому процессу.
+Журналы без блокировки дописывает первый запущенный после них воркер
+или команда ``flush_write_behind``. Повторная запись безопасна: комментарий
+узнаётся по автору и времени создания, подписка уникальна. При
+обычной остановке очередь записывается из ``atexit``.
+
+Свои изменения автор видит сразу: ещё не записанные комментарии
+и подписки лежат в общем кеше под ключом пользователя,
+и ``post_detail`` и ``follow_index`` подмешивают их к данным из базы.
+
+Ограничение: отписка удаляет подписку из очереди своего процесса и из
+базы, но подписку, которая ждёт в очереди другого процесса, та ещё
+запишет.
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import (close_old_connections,
+                       connection,
+                       transaction,
+                       )
+from django.utils import timezone
+
+from . import (counters,
+               feed_cache,
+               follow_graph,
+               timeline,
+               )
+from .models import (Comment,
+                     Follow,
+                     Post,
+                     User,
+                     )
+
+logger = logging.getLogger(__name__)
+
+COMMENT = 'comment'
+FOLLOW = 'follow'
+
+_lock = threading.Condition()
+_flush_lock = threading.Lock()
+_queue = deque()
+_state = {'pid': None, 'journal': None, 'path': None, 'thread': None,
+          'stop': None}
+
+JOURNAL_SUFFIX = '.ndjson'
+# Журнал пишется под этим суффиксом, пока не заблокирован и не дописан.
+PARTIAL_SUFFIX = '.tmp'
+
+
+def enabled():
+    return settings.WRITE_BEHIND
+
+
+def _pending_key(kind, user_id):
+    return f'posts:pending-{kind}s:{user_id}'
+
+
+def _add_pending(kind, user_id, value):
+    cache.update(_pending_key(kind, user_id),
+                 lambda pending: [*pending, value], [],
+                 settings.WRITE_BEHIND_PENDING_TIMEOUT)
+
+
+def _remove_pending(kind, user_id, values):
+    cache.update(_pending_key(kind, user_id),
+                 lambda pending: [value for value in pending
+                                  if value not in values], [],
+                 settings.WRITE_BEHIND_PENDING_TIMEOUT)
+
+
+def pending_comments(user, post_id):
+    """Ещё не записанные комментарии пользователя к посту."""
+    if not enabled() or not user.is_authenticated:
+        return []
+    return [
+        Comment(post_id=post_id, author=user, text=event['text'],
+                created=datetime.fromisoformat(event['created']))
+        for event in cache.get(_pending_key(COMMENT, user.pk)) or []
+        if event['post_id'] == post_id
+    ]
+
+
+def pending_follows(user):
+    """id авторов, подписка на которых ещё не записана."""
+    if not enabled() or not user.is_authenticated:
+        return []
+    return cache.get(_pending_key(FOLLOW, user.pk)) or []
+
+
+def _journal_dir():
+    return settings.WRITE_BEHIND_JOURNAL_DIR
+
+
+def _open_journal(events=()):
+    """Новый журнал процесса с событиями ``events``: (файл, путь).
+
+    Файл получает имя журнала уже заблокированным и дописанным, иначе
+    ``recover`` мог бы принять его за брошенный.
+    """
+    name = f'{os.getpid()}-{uuid.uuid4().hex}'
+    partial = os.path.join(_journal_dir(), name + PARTIAL_SUFFIX)
+    journal = open(partial, 'a', encoding='utf-8')
+    fcntl.flock(journal, fcntl.LOCK_EX)
+    for event in events:
+        journal.write(json.dumps(event, ensure_ascii=False) + '\n')
+    journal.flush()
+    os.fsync(journal.fileno())
+    path = os.path.join(_journal_dir(), name + JOURNAL_SUFFIX)
+    os.rename(partial, path)
+    return journal, path
+
+
+def _start():
+    """Открывает журнал и поток записи в новом процессе (и после fork).
+
+    Возвращает True, если процесс только что начал работу.
+    """
+    if _state['pid'] == os.getpid():
+        return False
+    os.makedirs(_journal_dir(), exist_ok=True)
+    _queue.clear()
+    if _state['journal'] is not None:
+        # Журнал родителя после fork: его блокировку держит родитель.
+        _state['journal'].close()
+    _state['pid'] = os.getpid()
+    _state['journal'], _state['path'] = _open_journal()
+    # При WRITE_BEHIND_EXECUTOR = 'inline' полная очередь пишется
+    # в потоке запроса.
+    _state['thread'] = None
+    if settings.WRITE_BEHIND_EXECUTOR != 'inline':
+        stop = threading.Event()
+        thread = threading.Thread(target=_loop, args=(stop,),
+                                  name='write-behind', daemon=True)
+        thread.start()
+        _state.update(thread=thread, stop=stop)
+    atexit.register(flush)
+    return True
+
+
+def _append(event):
+    with _lock:
+        started = _start()
+        journal = _state['journal']
+        journal.write(json.dumps(event, ensure_ascii=False) + '\n')
+        journal.flush()
+        if settings.WRITE_BEHIND_FSYNC:
+            os.fsync(journal.fileno())
+        _queue.append(event)
+        full = len(_queue) >= settings.WRITE_BEHIND_BATCH
+        if full:
+            _lock.notify()
+    if started:
+        try:
+            recover()
+        except Exception:
+            logger.exception('Не удалось дописать журналы других процессов')
+    if full and _state['thread'] is None:
+        flush()
+
+
+def _loop(stop):
+    while not stop.is_set():
+        with _lock:
+            _lock.wait_for(
+                lambda: (stop.is_set()
+                         or len(_queue) >= settings.WRITE_BEHIND_BATCH),
+                timeout=settings.WRITE_BEHIND_INTERVAL,
+            )
+        try:
+            flush()
+        finally:
+            close_old_connections()
+
+
+def stop():
+    """Записывает очередь и останавливает поток записи процесса."""
+    thread = _state['thread']
+    if thread is not None:
+        with _lock:
+            _state['stop'].set()
+            _lock.notify()
+        thread.join()
+        _state.update(thread=None, stop=None)
+    flush()
+
+
+def save_comment(comment):
+    """Сохраняет комментарий сразу или ставит в очередь."""
+    if not enabled():
+        with transaction.atomic():
+            comment.save()
+        return
+    comment.created = timezone.now()
+    event = {
+        'kind': COMMENT,
+        'post_id': comment.post_id,
+        'author_id': comment.author_id,
+        'text': comment.text,
+        'created': comment.created.isoformat(),
+    }
+    # Сначала в список ожидающих: заполнив пакет, _append может записать
+    # его сразу, и запись должна найти, что убрать из списка.
+    _add_pending(COMMENT, comment.author_id, {
+        'post_id': comment.post_id,
+        'text': comment.text,
+        'created': event['created'],
+    })
+    _append(event)
+
+
+def follow(user, author):
+    """Подписывает сразу или ставит подписку в очередь."""
+    if user.pk == author.pk:
+        return
+    if not enabled():
+        with transaction.atomic():
+            Follow.objects.get_or_create(user=user, author=author)
+        return
+    _add_pending(FOLLOW, user.pk, author.pk)
+    _append({'kind': FOLLOW, 'user_id': user.pk, 'author_id': author.pk})
+
+
+def unfollow(user, author):
+    """Отписывает, в том числе от подписки, которая ещё в очереди."""
+    if enabled():
+        pair = (user.pk, author.pk)
+        with _flush_lock, _lock:
+            queued = [event for event in _queue if event['kind'] == FOLLOW
+                      and (event['user_id'], event['author_id']) == pair]
+            for event in queued:
+                _queue.remove(event)
+            if queued:
+                _compact()
+        _remove_pending(FOLLOW, user.pk, [author.pk])
+    with transaction.atomic():
+        for follow in Follow.objects.filter(user=user, author=author):
+            follow.delete()
+
+
+def flush():
+    """Записывает очередь процесса. Возвращает число событий."""
+    with _flush_lock:
+        with _lock:
+            events = list(_queue)
+        if not events:
+            return 0
+        try:
+            write(events)
+        except Exception:
+            logger.exception('Не удалось записать %d событий',
+                             len(events))
+            return 0
+        with _lock:
+            for _ in events:
+                _queue.popleft()
+            _compact()
+        _forget_pending(events)
+        return len(events)
+
+
+def _compact():
+    """Оставляет в журнале только незаписанные события."""
+    journal, path = _open_journal(_queue)
+    # Старый журнал удаляется, пока он ещё заблокирован.
+    os.remove(_state['path'])
+    _state['journal'].close()
+    _state.update(journal=journal, path=path)
+
+
+def _forget_pending(events):
+    comments, follows = {}, {}
+    for event in events:
+        if event['kind'] == COMMENT:
+            comments.setdefault(event['author_id'], []).append({
+                'post_id': event['post_id'],
+                'text': event['text'],
+                'created': event['created'],
+            })
+        else:
+            follows.setdefault(event['user_id'], []).append(
+                event['author_id']
+            )
+    for user_id, values in comments.items():
+        _remove_pending(COMMENT, user_id, values)
+    for user_id, values in follows.items():
+        _remove_pending(FOLLOW, user_id, values)
+
+
+def _claim(path):
+    """Открытый и заблокированный журнал, если его процесс завершился,
+    иначе None."""
+    try:
+        journal = open(path, encoding='utf-8')
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # Пока файл открывался, его мог дописать и удалить другой
+        # процесс.
+        if os.fstat(journal.fileno()).st_ino == os.stat(path).st_ino:
+            return journal
+    except (BlockingIOError, FileNotFoundError):
+        pass
+    journal.close()
+    return None
+
+
+def recover():
+    """Дописывает журналы завершившихся процессов. Возвращает число
+    событий."""
+    directory = _journal_dir()
+    if not os.path.isdir(directory):
+        return 0
+    recovered = 0
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith((JOURNAL_SUFFIX, PARTIAL_SUFFIX)):
+            continue
+        path = os.path.join(directory, name)
+        journal = _claim(path)
+        if journal is None:
+            continue
+        with journal:
+            # Недописанный журнал дублирует ещё не удалённый прежний.
+            if name.endswith(JOURNAL_SUFFIX):
+                events = [json.loads(line) for line in journal
+                          if line.strip()]
+                batch = settings.WRITE_BEHIND_BATCH
+                for start in range(0, len(events), batch):
+                    write(events[start:start + batch])
+                _forget_pending(events)
+                recovered += len(events)
+            os.remove(path)
+    return recovered
+
+
+def write(events):
+    """Записывает события одной транзакцией; повторная запись тех же
+    событий ничего не меняет."""
+    comments = [event for event in events if event['kind'] == COMMENT]
+    follows = [event for event in events if event['kind'] == FOLLOW]
+    user_ids = {event['author_id'] for event in events} | {
+        event['user_id'] for event in follows
+    }
+    with transaction.atomic():
+        users = set(User.objects.filter(
+            pk__in=user_ids
+        ).values_list('pk', flat=True))
+        _write_comments([event for event in comments
+                         if event['author_id'] in users])
+        _write_follows([event for event in follows
+                        if {event['user_id'], event['author_id']} <= users])
+
+
+def _write_comments(events):
+    posts = set(Post.objects.filter(
+        pk__in={event['post_id'] for event in events}
+    ).values_list('pk', flat=True))
+    created = {event['created']: datetime.fromisoformat(event['created'])
+               for event in events}
+    # post_id__in даёт поиск по индексу (post, created), а не проход
+    # по всей таблице.
+    existing = set(Comment.objects.filter(
+        post_id__in=posts, created__in=created.values()
+    ).values_list('author_id', 'created'))
+    rows, per_post = [], {}
+    for event in events:
+        key = (event['author_id'], created[event['created']])
+        if event['post_id'] not in posts or key in existing:
+            continue
+        existing.add(key)
+        rows.append((event['post_id'], event['author_id'], event['text'],
+                     connection.ops.adapt_datetimefield_value(key[1])))
+        per_post[event['post_id']] = per_post.get(event['post_id'], 0) + 1
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(Comment._meta.get_field(name).column)
+                        for name in ('post', 'author', 'text', 'created'))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {quote(Comment._meta.db_table)} ({columns}) '
+            f'VALUES (%s, %s, %s, %s)',
+            rows,
+        )
+    for post_id, count in per_post.items():
+        counters.bump_post(post_id, count)
+    feed_cache.bump(*(f'post:{post_id}' for post_id in per_post))
+
+
+def _write_follows(events):
+    pairs = {(event['user_id'], event['author_id']) for event in events}
+    existing = set(Follow.objects.filter(
+        user_id__in={user_id for user_id, _ in pairs},
+        author_id__in={author_id for _, author_id in pairs},
+    ).values_list('user_id', 'author_id'))
+    new = sorted(pairs - existing)
+    Follow.objects.bulk_create(
+        (Follow(user_id=user_id, author_id=author_id)
+         for user_id, author_id in new),
+        ignore_conflicts=True,
+    )
+    for user_id, author_id in new:
+        counters.bump_user(user_id, following_count=1)
+        counters.bump_user(author_id, followers_count=1)
+        follow_graph.add(user_id, author_id)
+        timeline.backfill(user_id, author_id)
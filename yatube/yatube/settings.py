@@ -50,7 +50,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.InstrumentationMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.AnonymousPageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -60,6 +63,10 @@ MIDDLEWARE = [
 ]
 
 ROOT_URLCONF = 'yatube.urls'
+
+# Тесты выполняют фоновые задачи в своём потоке (см. core.runner).
+TEST_RUNNER = 'core.runner.TestRunner'
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'
@@ -68,12 +75,26 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
+# Шаблоны разбираются один раз на процесс (cached.Loader), а wsgi.py
+# загружает их заранее (core.template.warmup). При отладке кеш выключен,
+# чтобы правки шаблонов были видны сразу; YATUBE_CACHED_TEMPLATES=1
+# или 0 задаёт его явно.
+CACHED_TEMPLATES = os.environ.get('YATUBE_CACHED_TEMPLATES',
+                                  '0' if DEBUG else '1') == '1'
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if CACHED_TEMPLATES:
+    TEMPLATE_LOADERS = [('django.template.loaders.cached.Loader',
+                         TEMPLATE_LOADERS)]
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template.backends.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -91,13 +112,48 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# core.db.backends.sqlite3 включает WAL и прагмы (synchronous = NORMAL,
+# кеш страниц, mmap; меняются через OPTIONS['pragmas']), открывает
+# транзакции через BEGIN IMMEDIATE и повторяет запись, если база занята
+# другим воркером (timeout — ожидание блокировки в секундах).
+# Соединение воркера живёт CONN_MAX_AGE секунд, а не открывается заново
+# на каждый запрос.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'busy_retries': 5,
+        },
     }
 }
 
+# Реплики для чтения (core.routers.ReplicaRouter): пути к копиям базы
+# через запятую в YATUBE_REPLICAS, например
+# YATUBE_REPLICAS=/var/lib/yatube/replica.sqlite3. Копии обновляет
+# репликация вне Django (Litestream, LiteFS, потоковая репликация
+# Postgres). Запись и чтение внутри транзакций идут в default, а после
+# записи клиент ещё REPLICA_STICKY_SECONDS секунд читает из default,
+# пока реплики догоняют; столько же из default собираются страницы,
+# области которых недавно сброшены (core.page_cache.tag). В тестах
+# реплики — зеркала default.
+DATABASE_REPLICAS = []
+for number, name in enumerate(
+    filter(None, os.environ.get('YATUBE_REPLICAS', '').split(',')), 1
+):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'NAME': name.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = 10
+REPLICA_COOKIE_NAME = 'primary_reads_until'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -141,8 +197,142 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# default — LRU в памяти воркера поверх общего для всех воркеров
+# файлового кеша 'shared' (см. core.cache.TieredCache). Блокировки
+# страниц и подписок, версии лент и счётчики опираются на атомарные
+# между процессами add/incr/update, поэтому 'shared' — это
+# core.cache.SharedFileCache или кеш с такими же гарантиями; файловый
+# кеш Django их не даёт. CULL_INTERVAL — как часто (в секундах)
+# проверять MAX_ENTRIES: проверка перечисляет весь каталог.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
+            'LOCAL_SKIP_PREFIXES': ['posts:version:', 'core:page-purged:',
+                                    'django.contrib.sessions.',
+                                    'posts:follows:', 'core:view-metrics'],
+            'STATS_FLUSH_INTERVAL': 10,
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache.SharedFileCache',
+        'LOCATION': os.environ.get('YATUBE_CACHE_DIR',
+                                   os.path.join(BASE_DIR, 'cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'CULL_INTERVAL': 60,
+        },
+    },
+}
+
+# Лента подписок (posts.timeline): посты авторов, у которых подписчиков
+# больше TIMELINE_FANOUT_LIMIT, не раскладываются по лентам при
+# публикации, а подмешиваются при чтении. TIMELINE_BACKFILL — сколько
+# последних постов автора попадает в ленту сразу после подписки.
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_BACKFILL = 1000
+
+# Массивы подписок и подписчиков (posts.follow_graph) целиком
+# перечитываются из базы раз в FOLLOW_GRAPH_TIMEOUT секунд. Подписки и
+# отписки копятся в журнале рядом с массивом и переносятся в массив по
+# FOLLOW_GRAPH_DELTA_LIMIT изменений.
+FOLLOW_GRAPH_TIMEOUT = 60 * 60
+FOLLOW_GRAPH_DELTA_LIMIT = 100
+
+# «Кого почитать» (posts.recommendations): команда rebuild_suggestions
+# сохраняет RECOMMENDATIONS_TOP авторов на пользователя, страницы
+# показывают RECOMMENDATIONS_SHOWN из них. Для совместных подписок
+# у автора берётся RECOMMENDATIONS_SIMILAR самых похожих авторов.
+# Пользователи, у которых подписок больше RECOMMENDATIONS_HUB_LIMIT,
+# не связывают других: каждый из них дал бы квадрат своих подписок.
+RECOMMENDATIONS_TOP = 20
+RECOMMENDATIONS_SHOWN = 5
+RECOMMENDATIONS_SIMILAR = 20
+RECOMMENDATIONS_HUB_LIMIT = 1000
+RECOMMENDATIONS_CACHE_TIMEOUT = 60 * 60
+
+# Время жизни фрагментов лент (posts.feed_cache). Свежесть обеспечивают
+# версии, которые сбрасываются при изменении постов, комментариев и групп.
+FEED_CACHE_TIMEOUT = 60 * 60
+
+# Миниатюры картинок постов (posts.thumbnails) строятся после сохранения
+# поста в THUMBNAIL_WORKERS фоновых потоках; пока миниатюры нет, страницы
+# показывают заглушку. THUMBNAIL_ASYNC = False строит их при отрисовке.
+# Каждая картинка нарезается по ширинам THUMBNAIL_WIDTHS во всех форматах
+# THUMBNAIL_FORMATS, которые поддерживает установленный Pillow.
+# THUMBNAIL_EXECUTOR = 'inline' строит их после коммита без пула, в
+# потоке запроса (так их строят тесты, см. core.runner).
+THUMBNAIL_ASYNC = True
+THUMBNAIL_EXECUTOR = 'pool'
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_WIDTHS = (480, 960, 1440)
+THUMBNAIL_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+# Служебные ключи sorl-thumbnail пишутся без get_or_create (posts.kvstore).
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+
+# Отложенная запись комментариев и подписок (posts.write_behind).
+# WRITE_BEHIND = True ставит их в очередь процесса, которая пишется
+# в базу одной транзакцией раз в WRITE_BEHIND_INTERVAL секунд или по
+# WRITE_BEHIND_BATCH событий. Перед ответом событие дописывается
+# в журнал в WRITE_BEHIND_JOURNAL_DIR (с fsync при WRITE_BEHIND_FSYNC):
+# очередь упавшего процесса допишет следующий воркер или команда
+# flush_write_behind. Ещё не записанные события автор видит из кеша
+# WRITE_BEHIND_PENDING_TIMEOUT секунд. WRITE_BEHIND_EXECUTOR = 'inline'
+# пишет полную очередь в потоке запроса, без фонового потока.
+WRITE_BEHIND = False
+WRITE_BEHIND_EXECUTOR = 'thread'
+WRITE_BEHIND_INTERVAL = 0.2
+WRITE_BEHIND_BATCH = 100
+WRITE_BEHIND_JOURNAL_DIR = os.environ.get(
+    'YATUBE_JOURNAL_DIR', os.path.join(BASE_DIR, 'journal')
+)
+WRITE_BEHIND_FSYNC = True
+WRITE_BEHIND_PENDING_TIMEOUT = 60
+
+# Сессии читаются из кеша, а в базу пишутся, только когда изменились
+# (core.sessions.backends.cached_db). С YATUBE_SESSION_ENGINE=
+# django.contrib.sessions.backends.signed_cookies база не нужна совсем,
+# но сессию тогда нельзя завершить на сервере.
+SESSION_ENGINE = os.environ.get('YATUBE_SESSION_ENGINE',
+                                'core.sessions.backends.cached_db')
+
+# Готовые ответы анонимным читателям (core.page_cache): свежие
+# PAGE_CACHE_TIMEOUT секунд, потом и после изменения постов ещё
+# PAGE_CACHE_STALE секунд отдаются устаревшими, пока один запрос
+# пересобирает страницу. Без записи в кеше остальные запросы ждут её до
+# PAGE_CACHE_LOCK_WAIT секунд.
+PAGE_CACHE_VIEWS = ('posts:index', 'posts:group_list', 'posts:profile',
+                    'posts:post_detail')
+PAGE_CACHE_TIMEOUT = 60
+PAGE_CACHE_STALE = 300
+PAGE_CACHE_LOCK_TIMEOUT = 30
+PAGE_CACHE_LOCK_WAIT = 2
+
+# Страницы ?page=N и поиска: записи считаются не дальше
+# PAGINATOR_COUNT_LIMIT, сверх него число страниц оценивается
+# (posts.paginator.WindowedPaginator).
+PAGINATOR_COUNT_LIMIT = 10000
+
+# Метрики запросов (core.instrumentation): предупреждение в лог, если
+# представление выполнило больше SQL-запросов, чем разрешено. Бюджеты —
+# число запросов страницы с холодным кешем (posts.tests.test_queries);
+# подписка включает запись пачки posts.write_behind, если она набралась.
+# При THUMBNAIL_ASYNC = False страница, на которой строятся миниатюры,
+# бюджет превышает: это запись служебных ключей sorl-thumbnail.
+QUERY_BUDGET = 15
+QUERY_BUDGETS = {
+    'posts:index': 4,
+    'posts:group_list': 4,
+    'posts:profile': 6,
+    'posts:post_detail': 4,
+    'posts:follow_index': 8,
+    'posts:search': 7,
+    'posts:post_create': 13,
+    'posts:post_edit': 10,
+    'posts:profile_follow': 17,
+    'posts:profile_unfollow': 11,
 }
+METRICS_FLUSH_INTERVAL = 10